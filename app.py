@@ -5,13 +5,15 @@ from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy.orm import DeclarativeBase
 from werkzeug.middleware.proxy_fix import ProxyFix
 
+import db_routing
+
 # Configure logging
 logging.basicConfig(level=logging.DEBUG)
 
 class Base(DeclarativeBase):
     pass
 
-db = SQLAlchemy(model_class=Base)
+db = SQLAlchemy(model_class=Base, session_options={"class_": db_routing.RoutingSession})
 
 # Create the app
 app = Flask(__name__)
@@ -26,11 +28,27 @@ app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
 }
 app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
 
+# Optional read replica for the read-only pages (see db_routing.read_replica)
+if os.environ.get("DATABASE_REPLICA_URL"):
+    app.config["SQLALCHEMY_BINDS"] = {db_routing.REPLICA_BIND: os.environ["DATABASE_REPLICA_URL"]}
+
+# Per-route SQL statement budgets: "raise" in development/tests, "warn" or "off" in production
+app.config["QUERY_BUDGET_MODE"] = os.environ.get("QUERY_BUDGET_MODE", "off")
+
+# Background job worker threads per web process (they poll less while idle); 0 leaves jobs to
+# `flask jobs work` processes
+app.config["JOB_WORKER_THREADS"] = int(os.environ.get("JOB_WORKER_THREADS", "1"))
+
+# Seconds between refreshes of each host's food recommendation matrix; 0 disables them
+app.config["FOOD_MATRIX_REFRESH"] = int(os.environ.get("FOOD_MATRIX_REFRESH", "300"))
+
 # Initialize the app with the extension
 db.init_app(app)
+db_routing.init_app(app)
 
 with app.app_context():
     # Import models to ensure tables are created
     import models  # noqa: F401
+    from services.food_log_partitions import FoodLogPartitions  # noqa: F401  (partitioned DDL for create_all)
     db.create_all()
     logging.info("Database tables created")
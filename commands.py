@@ -0,0 +1,295 @@
+import json
+import threading
+from datetime import datetime
+from pathlib import Path
+
+import click
+
+from app import app, db
+from models import User
+from services.assets import AssetPipeline
+from services.food_log_partitions import FoodLogPartitions
+from services.food_log_recompute import FoodLogRecompute
+from services.food_recommender import FoodRecommender
+from services.job_queue import JobQueue
+from services.nutrition_calculator import NutritionCalculator
+from services.schema_upgrade import SchemaUpgrade
+from services.search_cache import SearchCache
+from services.session_store import SessionStore
+from services.sync import SyncBatch
+from services.weight_import import WeightImport
+from tools.benchmarks import Benchmarks
+from tools.load_test import LoadTest
+from tools.synthetic_data import SyntheticData
+
+@app.cli.command('recompute-food-logs')
+@click.option('--food-id', type=int, default=None, help='Only recompute logs of this food (default: all foods)')
+@click.option('--batch-size', type=int, default=FoodLogRecompute.DEFAULT_BATCH_SIZE, show_default=True,
+              help='Number of food log rows updated per transaction')
+def recompute_food_logs(food_id, batch_size):
+    """Recompute stored FoodLog nutrition from the current foods table"""
+    stats = FoodLogRecompute.recompute(food_id=food_id, batch_size=batch_size)
+    click.echo(
+        f"Scanned {stats['scanned']} logs in {stats['batches']} batches, "
+        f"updated {stats['updated']} for {stats['users']} users "
+        f"in {stats['seconds']}s ({stats['rows_per_second']} rows/s)"
+    )
+
+@app.cli.command('build-assets')
+def build_assets():
+    """Fingerprint and precompress static JS/CSS into static/dist"""
+    manifest = AssetPipeline.build(app.static_folder)
+    for source, fingerprinted in sorted(manifest.items()):
+        click.echo(f"{source} -> {AssetPipeline.DIST_DIR}/{fingerprinted}")
+
+@app.cli.command('generate-synthetic-data')
+@click.option('--users', type=int, default=1000, show_default=True)
+@click.option('--foods', type=int, default=1000000, show_default=True)
+@click.option('--days', type=int, default=730, show_default=True, help='Days of history per user')
+@click.option('--logs-per-day', type=int, default=5, show_default=True)
+@click.option('--batch-size', type=int, default=SyntheticData.DEFAULT_BATCH_SIZE, show_default=True)
+@click.option('--seed', type=int, default=42, show_default=True)
+@click.option('--purge', is_flag=True, help='Delete previously generated synthetic data instead')
+def generate_synthetic_data(users, foods, days, logs_per_day, batch_size, seed, purge):
+    """Bulk-insert synthetic users, foods and food/weight history for load testing"""
+    if purge:
+        counts = SyntheticData.purge(batch_size=batch_size)
+        click.echo(', '.join(f"{count} {name}" for name, count in counts.items()) + ' deleted')
+        return
+
+    try:
+        stats = SyntheticData.generate(users=users, foods=foods, days=days, logs_per_day=logs_per_day,
+                                       seed=seed, batch_size=batch_size)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    click.echo(
+        f"Inserted {stats['users']} users, {stats['foods']} foods, {stats['food_logs']} food logs and "
+        f"{stats['weight_entries']} weight entries in {stats['seconds']}s ({stats['rows_per_second']} rows/s)"
+    )
+
+@app.cli.command('load-test')
+@click.option('--requests', 'requests_total', type=int, default=1000, show_default=True)
+@click.option('--concurrency', type=int, default=8, show_default=True)
+@click.option('--users', type=int, default=50, show_default=True, help='Synthetic users to sign in as')
+@click.option('--base-url', default=None, help='Drive a running server instead of the in-process app')
+@click.option('--out', type=click.Path(dir_okay=False, path_type=Path), default=None,
+              help='Where to save the JSON results (default: loadtest-results/<timestamp>.json)')
+@click.option('--baseline', type=click.Path(exists=True, dir_okay=False, path_type=Path), default=None,
+              help='Previous results to compare against')
+def load_test(requests_total, concurrency, users, base_url, out, baseline):
+    """Drive the main pages with synthetic users and report per-route latency"""
+    try:
+        results = LoadTest.run(app, requests_total=requests_total, concurrency=concurrency,
+                               users=users, base_url=base_url)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+
+    click.echo(f"{results['requests']} requests in {results['seconds']}s "
+               f"({results['throughput']} req/s, {results['database']}, {results['target']})")
+    for route, stats in results['routes'].items():
+        click.echo(f"  {route:<15} {stats['requests']:>6} req  {stats['errors']:>4} err  "
+                   f"{stats['throughput']:>8} req/s  p50 {stats['p50_ms']:>8} ms  "
+                   f"p95 {stats['p95_ms']:>8} ms  p99 {stats['p99_ms']:>8} ms")
+
+    if baseline:
+        for line in LoadTest.compare(results, json.loads(baseline.read_text())):
+            click.echo(line)
+
+    out = out or Path('loadtest-results') / f"{datetime.now():%Y%m%d-%H%M%S}.json"
+    LoadTest.save(results, out)
+    click.echo(f"Results saved to {out}")
+
+BENCHMARK_DIR = Path('benchmark-results')
+
+@app.cli.group()
+def benchmark():
+    """Microbenchmarks of NutritionCalculator and the food API parsers"""
+
+@benchmark.command('run')
+@click.option('--only', multiple=True, help='Run only the named benchmark (repeatable)')
+@click.option('--out', type=click.Path(dir_okay=False, path_type=Path), default=BENCHMARK_DIR / 'latest.json',
+              show_default=True)
+@click.option('--baseline', type=click.Path(dir_okay=False, path_type=Path), default=BENCHMARK_DIR / 'baseline.json',
+              show_default=True, help='Compared against when it exists')
+@click.option('--threshold', type=float, default=Benchmarks.DEFAULT_THRESHOLD, show_default=True,
+              help='Relative slowdown of the median that counts as a regression')
+@click.option('--record-baseline', is_flag=True, help='Save these results as the new baseline')
+def benchmark_run(only, out, baseline, threshold, record_baseline):
+    """Run the benchmarks on an in-memory database and compare with the baseline"""
+    results = Benchmarks.run(only=list(only))
+    Benchmarks.save(results, out)
+    for name, stats in results['benchmarks'].items():
+        click.echo(f"{name:<30} median {stats['median_us']:>12} us  min {stats['min_us']:>12} us")
+    click.echo(f"Results saved to {out}")
+
+    if record_baseline:
+        Benchmarks.save(results, baseline)
+        click.echo(f"Baseline recorded in {baseline}")
+    elif baseline.exists():
+        _report_benchmark_comparison(results, json.loads(baseline.read_text()), threshold)
+
+@benchmark.command('compare')
+@click.argument('current', type=click.Path(exists=True, dir_okay=False, path_type=Path))
+@click.argument('baseline', type=click.Path(exists=True, dir_okay=False, path_type=Path))
+@click.option('--threshold', type=float, default=Benchmarks.DEFAULT_THRESHOLD, show_default=True)
+def benchmark_compare(current, baseline, threshold):
+    """Compare two saved benchmark results; exits non-zero on regressions"""
+    _report_benchmark_comparison(json.loads(current.read_text()), json.loads(baseline.read_text()), threshold)
+
+def _report_benchmark_comparison(current, baseline, threshold):
+    lines, regressions = Benchmarks.compare(current, baseline, threshold)
+    for line in lines:
+        click.echo(line)
+    if regressions:
+        raise click.ClickException(
+            f"{len(regressions)} benchmark(s) regressed by more than {threshold:.0%}: {', '.join(regressions)}"
+        )
+
+@app.cli.group('food-logs')
+def food_logs():
+    """Monthly partitions of food_logs (PostgreSQL)"""
+
+@food_logs.command('partition')
+@click.option('--months-ahead', type=int, default=FoodLogPartitions.MONTHS_AHEAD, show_default=True)
+def food_logs_partition(months_ahead):
+    """Convert an existing unpartitioned food_logs table into monthly partitions"""
+    try:
+        stats = FoodLogPartitions.convert(months_ahead=months_ahead)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    click.echo(f"Moved {stats['rows']} food logs into {stats['partitions']} monthly partitions")
+
+@food_logs.command('ensure-partitions')
+@click.option('--months-ahead', type=int, default=FoodLogPartitions.MONTHS_AHEAD, show_default=True)
+def food_logs_ensure_partitions(months_ahead):
+    """Create upcoming monthly partitions; the food_logs.ensure_partitions job does this daily"""
+    created = FoodLogPartitions.ensure_partitions(months_ahead=months_ahead)
+    click.echo(f"Created {', '.join(created)}" if created else "All partitions present")
+
+@food_logs.command('archive')
+@click.option('--older-than-months', type=int, default=24, show_default=True)
+@click.option('--tablespace', envvar='FOOD_LOG_ARCHIVE_TABLESPACE', required=True,
+              help='Tablespace on compressed storage [env FOOD_LOG_ARCHIVE_TABLESPACE]')
+def food_logs_archive(older_than_months, tablespace):
+    """Move old monthly partitions to compressed storage; they stay queryable and writable"""
+    try:
+        archived = FoodLogPartitions.archive(older_than_months, tablespace=tablespace)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    click.echo(f"Archived {', '.join(archived)}" if archived else "Nothing to archive")
+
+@app.cli.command('refresh-nutrition-targets')
+def refresh_nutrition_targets():
+    """Store derived nutrition targets for users who have none yet"""
+    users = User.query.filter(User.calorie_target.is_(None)).all()
+    for user in users:
+        NutritionCalculator.refresh_targets(user)
+    db.session.commit()
+    click.echo(f"Stored targets for {len(users)} users")
+
+@app.cli.group()
+def jobs():
+    """Background job queue"""
+
+@jobs.command('work')
+@click.option('--threads', type=int, default=1, show_default=True)
+@click.option('--once', is_flag=True, help='Exit when no job is due instead of polling')
+def jobs_work(threads, once):
+    """Process background jobs"""
+    stop = threading.Event()
+    workers = [
+        threading.Thread(target=JobQueue.work, args=(app,), kwargs={'stop': stop, 'once': once},
+                         name=f'job-worker-{n}')
+        for n in range(threads)
+    ]
+    for worker in workers:
+        worker.start()
+    try:
+        for worker in workers:
+            while worker.is_alive():
+                worker.join(1)
+    except KeyboardInterrupt:
+        click.echo("Stopping after the current jobs")
+        stop.set()
+        for worker in workers:
+            worker.join()
+
+@jobs.command('enqueue')
+@click.argument('name')
+@click.option('--payload', default='{}', show_default=True, help='JSON object passed to the handler')
+@click.option('--idempotency-key', default=None)
+@click.option('--delay', type=float, default=0, help='Seconds before the job becomes due')
+def jobs_enqueue(name, payload, idempotency_key, delay):
+    """Enqueue a background job"""
+    try:
+        job = JobQueue.enqueue(name, json.loads(payload), idempotency_key=idempotency_key, delay=delay)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    db.session.commit()
+    click.echo(f"Job {job.id} {job.status}")
+
+@jobs.command('stats')
+def jobs_stats():
+    """Show job counts per status"""
+    for status, count in sorted(JobQueue.stats().items()):
+        click.echo(f"{status:<8} {count}")
+
+@jobs.command('purge')
+@click.option('--older-than-days', type=int, default=JobQueue.RETENTION_DAYS, show_default=True)
+def jobs_purge(older_than_days):
+    """Delete finished jobs"""
+    click.echo(f"Deleted {JobQueue.purge(older_than_days)} jobs")
+
+@app.cli.command('clear-search-cache')
+def clear_search_cache():
+    """Drop all cached food search results, e.g. after editing foods in the database by hand"""
+    click.echo(f"Deleted {SearchCache.clear()} cached searches")
+
+@app.cli.command('upgrade-db')
+def upgrade_db():
+    """Add tables, columns and indexes missing from an existing database; safe to run on every deploy"""
+    changed = SchemaUpgrade.upgrade()
+    click.echo(f"Applied {', '.join(changed)}" if changed else "Database schema is up to date")
+
+@app.cli.command('build-food-matrix')
+@click.option('--full', is_flag=True, help='Rebuild from scratch instead of appending new foods')
+def build_food_matrix(full):
+    """Build or update the nutrient matrix behind food recommendations"""
+    if not FoodRecommender.is_available():
+        raise click.ClickException("Food recommendations need numpy")
+    stats = FoodRecommender.build() if full else FoodRecommender.refresh()
+    click.echo(f"Food matrix generation {stats['generation']}: {stats['rows']} foods")
+
+@app.cli.command('gc-sessions')
+@click.option('--batch-size', type=int, default=SessionStore.GC_BATCH_SIZE, show_default=True)
+def gc_sessions(batch_size):
+    """Delete expired sessions and orphaned OAuth tokens"""
+    counts = SessionStore.gc(batch_size=batch_size)
+    click.echo(f"Deleted {counts['sessions']} sessions and {counts['oauth']} OAuth tokens")
+
+@app.cli.command('purge-sync-keys')
+@click.option('--older-than-days', type=int, default=SyncBatch.RETENTION_DAYS, show_default=True)
+def purge_sync_keys(older_than_days):
+    """Delete the idempotency keys of old offline sync mutations"""
+    click.echo(f"Deleted {SyncBatch.purge(older_than_days)} sync keys")
+
+@app.cli.command('import-weights')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--user-id', required=True)
+@click.option('--batch-size', type=int, default=WeightImport.BATCH_SIZE, show_default=True)
+def import_weights(path, user_id, batch_size):
+    """Import a smart-scale CSV or Apple Health export.xml/export.zip for a user"""
+    user = db.session.get(User, user_id)
+    if user is None:
+        raise click.ClickException(f"No user {user_id}")
+    try:
+        stats = WeightImport.import_file(user, path, batch_size=batch_size)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    click.echo(
+        f"Imported {stats['readings']} readings as {stats['days']} days "
+        f"({stats['first_day']} to {stats['last_day']}) in {stats['seconds']}s ({stats['rows_per_second']} rows/s)"
+    )
+    if stats['out_of_range']:
+        click.echo(f"Skipped {stats['out_of_range']} readings outside "
+                   f"{WeightImport.MIN_WEIGHT:g}-{WeightImport.MAX_WEIGHT:g} kg")
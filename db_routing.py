@@ -0,0 +1,61 @@
+import time
+from functools import wraps
+
+from flask import g, has_request_context, session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.sql import Select
+
+REPLICA_BIND = 'replica'
+
+# Seconds after a write during which the writer's reads stay on the primary
+READ_YOUR_WRITES_SECONDS = 10
+
+class RoutingSession(Session):
+    """
+    Session that sends SELECTs of read-only views to the replica bind, when one is
+    configured, and everything else (writes, and reads after a write) to the primary
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and self._reads_from_replica(clause):
+            replica = self._db.engines.get(REPLICA_BIND)
+            if replica is not None:
+                return replica
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+    def _reads_from_replica(self, clause) -> bool:
+        if not has_request_context() or not g.get('db_read_replica'):
+            return False
+        if self._flushing or self.info.get('wrote'):
+            return False
+        return isinstance(clause, Select)
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _stick_to_primary(db_session, flush_context):
+    # Any write in this request pins its later reads to the primary
+    db_session.info['wrote'] = True
+    if has_request_context():
+        g.db_wrote = True
+
+def read_replica(f):
+    """
+    Mark a view as read-only so its queries may be served by the replica,
+    unless the user wrote something within the read-your-own-writes window
+    """
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        g.db_read_replica = session.get('_db_primary_until', 0) < time.time()
+        return f(*args, **kwargs)
+
+    return decorated_function
+
+def init_app(app):
+    """
+    Start the read-your-own-writes window of users whose request wrote to the primary
+    """
+    @app.after_request
+    def remember_primary_write(response):
+        if g.get('db_wrote'):
+            session['_db_primary_until'] = time.time() + READ_YOUR_WRITES_SECONDS
+        return response
@@ -21,6 +21,16 @@ class User(UserMixin, db.Model):
     goal = db.Column(db.String(20), nullable=True)  # lose_weight, maintain, gain_weight
     daily_calorie_goal = db.Column(db.Integer, default=2000)
     
+    # Daily targets derived from the profile and latest weight, see NutritionCalculator.refresh_targets
+    tdee_target = db.Column(db.Float, nullable=True)
+    calorie_target = db.Column(db.Float, nullable=True)
+    protein_target = db.Column(db.Float, nullable=True)
+    carbs_target = db.Column(db.Float, nullable=True)
+    fat_target = db.Column(db.Float, nullable=True)
+    
+    # Bumped whenever data feeding the user's derived views changes
+    data_version = db.Column(db.Integer, nullable=False, default=0)
+    
     created_at = db.Column(db.DateTime, default=datetime.now)
     updated_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
     
@@ -41,6 +51,16 @@ class OAuth(OAuthConsumerMixin, db.Model):
         name='uq_user_browser_session_key_provider',
     ),)
 
+# Server-side Flask sessions; the cookie only carries the signed session id
+class BrowserSession(db.Model):
+    __tablename__ = 'browser_sessions'
+    id = db.Column(db.String(64), primary_key=True)  # sha256 of the session id
+    data = db.Column(db.Text, nullable=False)
+    user_id = db.Column(db.String, nullable=True, index=True)
+    browser_session_key = db.Column(db.String, nullable=True, index=True)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+    updated_at = db.Column(db.DateTime, default=datetime.now)
+
 class Food(db.Model):
     __tablename__ = 'foods'
     id = db.Column(db.Integer, primary_key=True)
@@ -58,12 +78,18 @@ class Food(db.Model):
     sodium_per_100g = db.Column(db.Float, nullable=True)
     
     created_at = db.Column(db.DateTime, default=datetime.now)
+    # Lets each host's food recommendation matrix pick up changed nutrients
+    updated_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now, index=True)
     
     # Relationships
     food_logs = db.relationship('FoodLog', backref='food', lazy=True)
 
 class FoodLog(db.Model):
     __tablename__ = 'food_logs'
+    # Partitioned by month on PostgreSQL, see services/food_log_partitions.py
+    __table_args__ = (
+        db.Index('ix_food_logs_user_date_meal', 'user_id', 'log_date', 'meal_type'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.String, db.ForeignKey('users.id'), nullable=False)
     food_id = db.Column(db.Integer, db.ForeignKey('foods.id'), nullable=False)
@@ -71,7 +97,7 @@ class FoodLog(db.Model):
     quantity = db.Column(db.Float, nullable=False, default=100)  # in grams
     meal_type = db.Column(db.String(20), nullable=False)  # breakfast, lunch, dinner, snack
     logged_at = db.Column(db.DateTime, default=datetime.now)
-    log_date = db.Column(db.Date, default=date.today)
+    log_date = db.Column(db.Date, nullable=False, default=date.today)
     
     # Calculated nutrition values based on quantity
     calories = db.Column(db.Float, nullable=True)
@@ -92,3 +118,49 @@ class WeightEntry(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.now)
     
     __table_args__ = (UniqueConstraint('user_id', 'entry_date', name='uq_user_date_weight'),)
+
+# Weight export waiting for its import job; in the database so a worker on any instance can read it
+class WeightUpload(db.Model):
+    __tablename__ = 'weight_uploads'
+    id = db.Column(db.String(32), primary_key=True)
+    user_id = db.Column(db.String, db.ForeignKey('users.id'), nullable=False)
+    filename = db.Column(db.String(255), nullable=False)
+    data = db.Column(db.LargeBinary, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.now)
+
+# Deferred work processed by the background workers, see services/job_queue.py
+class Job(db.Model):
+    __tablename__ = 'jobs'
+    __table_args__ = (
+        db.Index('ix_jobs_status_run_at', 'status', 'run_at'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    payload = db.Column(db.JSON, nullable=False, default=dict)
+    # Enqueueing again with the same key returns the existing job
+    idempotency_key = db.Column(db.String(255), unique=True, nullable=True)
+    
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, running, done, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=5)
+    run_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
+    # A running job whose lease expired is picked up again by another worker
+    locked_until = db.Column(db.DateTime, nullable=True)
+    locked_by = db.Column(db.String(100), nullable=True)
+    last_error = db.Column(db.Text, nullable=True)
+    
+    created_at = db.Column(db.DateTime, default=datetime.now)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+# Client mutations applied through /api/sync, kept so replays are not applied twice
+class SyncMutation(db.Model):
+    __tablename__ = 'sync_mutations'
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.String, db.ForeignKey('users.id'), nullable=False)
+    idempotency_key = db.Column(db.String(64), nullable=False)
+    operation = db.Column(db.String(30), nullable=False)
+    result = db.Column(db.JSON, nullable=True)
+    client_timestamp = db.Column(db.DateTime, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.now)
+    
+    __table_args__ = (UniqueConstraint('user_id', 'idempotency_key', name='uq_user_sync_key'),)
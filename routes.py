@@ -1,17 +1,52 @@
-from flask import render_template, request, redirect, url_for, flash, jsonify
+from flask import render_template, request, redirect, url_for, flash, jsonify, send_from_directory, abort
 from flask_login import current_user
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import contains_eager
 from datetime import date, datetime
+import hashlib
+import hmac
 import logging
+import mimetypes
+import os
 
 from app import app, db
 from models import User, Food, FoodLog, WeightEntry
 from replit_auth import require_login, make_replit_blueprint
+from db_routing import read_replica
 from services.food_api import OpenFoodFactsAPI, FoodRecognitionAPI
 from services.nutrition_calculator import NutritionCalculator
+from services.data_version import DataVersion
+from services.assets import AssetPipeline
+from services.fragment_cache import FragmentCache
+from services.food_log_recompute import NUTRIENT_COLUMNS
+from services.food_recommender import FoodRecommender
+from services.job_queue import JobQueue
+from services.metrics import PerformanceMetrics
+from services.weight_import import WeightImport
+from services.query_budget import query_budget
+from services.search_cache import SearchCache
+from services.session_store import SessionStore
+from services.sync import SyncBatch, SyncError
+
+# Sessions live in the database; the cookie only holds a signed id
+SessionStore.init_app(app)
 
 # Register authentication blueprint
 app.register_blueprint(make_replit_blueprint(), url_prefix="/auth")
 
+# Per-route timings exported on /metrics
+PerformanceMetrics.init_app(app)
+
+# Worker threads for deferred jobs
+JobQueue.init_app(app)
+
+# Keeps this host's food recommendation matrix built and current
+FoodRecommender.init_app(app)
+
+# Fingerprinted static URLs in templates: {{ asset_url('js/app.js') }}
+app.jinja_env.globals['asset_url'] = AssetPipeline.url
+
 logger = logging.getLogger(__name__)
 
 @app.before_request
@@ -20,6 +55,7 @@ def make_session_permanent():
     session.permanent = True
 
 @app.route('/')
+@query_budget(2)
 def index():
     """Landing page for logged out users, dashboard for logged in users"""
     if current_user.is_authenticated:
@@ -27,6 +63,8 @@ def index():
     return render_template('index.html')
 
 @app.route('/dashboard')
+@query_budget(8)
+@read_replica
 @require_login
 def dashboard():
     """Main dashboard showing nutrition overview"""
@@ -36,15 +74,30 @@ def dashboard():
     # Get weight progress
     weight_progress = NutritionCalculator.get_weight_progress(current_user, days=30)
     
-    # Get fitness recommendations
-    recommendations = NutritionCalculator.get_fitness_recommendations(current_user)
+    # Partials that only change on writes; recommendations are only computed on a cache miss
+    fragments = {
+        'meal_breakdown': FragmentCache.get_or_render(
+            'dashboard_meal_breakdown', current_user, nutrition_summary['date'],
+            'partials/dashboard_meal_breakdown.html',
+            lambda: {'nutrition': nutrition_summary}
+        ),
+        'recommendations': FragmentCache.get_or_render(
+            'dashboard_recommendations', current_user, nutrition_summary['date'],
+            'partials/dashboard_recommendations.html',
+            lambda: {'recommendations': NutritionCalculator.get_fitness_recommendations(
+                current_user, nutrition_summary, weight_progress
+            )}
+        ),
+    }
     
     return render_template('dashboard.html', 
                          nutrition=nutrition_summary,
                          weight_progress=weight_progress,
-                         recommendations=recommendations)
+                         fragments=fragments)
 
 @app.route('/food-log')
+@query_budget(8)
+@read_replica
 @require_login
 def food_log():
     """Food logging page"""
@@ -54,21 +107,31 @@ def food_log():
     except ValueError:
         target_date = date.today()
     
-    # Get food logs for the target date
-    logs = db.session.query(FoodLog).filter_by(
-        user_id=current_user.id,
-        log_date=target_date
-    ).join(Food).order_by(FoodLog.logged_at.desc()).all()
-    
     # Get nutrition summary for the date
     nutrition_summary = NutritionCalculator.get_daily_nutrition_summary(current_user, target_date)
     
+    def meals_context():
+        # Get food logs for the target date
+        logs = db.session.query(FoodLog).filter_by(
+            user_id=current_user.id,
+            log_date=target_date
+        ).join(Food).options(contains_eager(FoodLog.food)).order_by(FoodLog.logged_at.desc()).all()
+        return {'logs': logs, 'nutrition': nutrition_summary}
+    
+    fragments = {
+        'meals': FragmentCache.get_or_render(
+            'food_log_meals', current_user, target_date,
+            'partials/food_log_meals.html', meals_context
+        ),
+    }
+    
     return render_template('food_log.html', 
-                         logs=logs, 
                          target_date=target_date,
-                         nutrition=nutrition_summary)
+                         nutrition=nutrition_summary,
+                         fragments=fragments)
 
 @app.route('/add-food', methods=['POST'])
+@query_budget(6)
 @require_login
 def add_food():
     """Add food to log"""
@@ -109,6 +172,7 @@ def add_food():
         )
         
         db.session.add(food_log)
+        DataVersion.bump([current_user.id])
         db.session.commit()
         
         flash('Food added successfully!', 'success')
@@ -121,13 +185,20 @@ def add_food():
     return redirect(url_for('food_log', date=log_date.isoformat()))
 
 @app.route('/search-food')
+@query_budget(6)
 @require_login
 def search_food():
     """Search for food items"""
-    query = request.args.get('q', '')
+    # Searched as typed; SearchCache folds case, accents and spacing into its key
+    query = request.args.get('q', '').strip()
     if not query:
         return jsonify([])
     
+    # Popular queries are answered without the database or Open Food Facts
+    cached = SearchCache.get(query)
+    if cached is not None:
+        return jsonify(cached)
+    
     # Search in database first
     db_foods = Food.query.filter(Food.name.ilike(f'%{query}%')).limit(10).all()
     
@@ -143,32 +214,52 @@ def search_food():
     
     # If we have less than 5 results, search Open Food Facts
     if len(results) < 5:
-        api_results = OpenFoodFactsAPI.search_products(query, page_size=10)
-        for food_data in api_results[:10-len(results)]:
-            # Check if food already exists in database
-            existing_food = Food.query.filter_by(barcode=food_data['barcode']).first()
-            if not existing_food and food_data['barcode']:
-                # Add to database
-                food = Food(**food_data)
-                db.session.add(food)
-                db.session.commit()
-                food_id = food.id
-            elif existing_food:
-                food_id = existing_food.id
-            else:
-                continue
+        api_results = OpenFoodFactsAPI.search_products(query, page_size=10)[:10-len(results)]
+        
+        # Look up all returned barcodes at once instead of one query per product
+        barcodes = {food_data['barcode'] for food_data in api_results if food_data['barcode']}
+        food_ids = dict(
+            db.session.query(Food.barcode, Food.id).filter(Food.barcode.in_(barcodes)).all()
+        ) if barcodes else {}
+        
+        # Add the new products to the database in a single INSERT
+        new_foods = {}
+        for food_data in api_results:
+            if food_data['barcode'] and food_data['barcode'] not in food_ids:
+                new_foods.setdefault(food_data['barcode'], food_data)
+        if new_foods:
+            inserted = db.session.execute(
+                insert(Food).returning(Food.barcode, Food.id),
+                list(new_foods.values())
+            ).all()
+            food_ids.update(dict(inserted))
             
+            # Search results often lack nutrients; fetch the full products in the background
+            incomplete = [
+                food_ids[barcode] for barcode, food_data in new_foods.items()
+                if any(food_data[column] is None for column in NUTRIENT_COLUMNS.values())
+            ]
+            if incomplete:
+                JobQueue.enqueue('foods.enrich', {'food_ids': incomplete})
+            db.session.commit()
+            SearchCache.invalidate(food_data['name'] for food_data in new_foods.values())
+        
+        for food_data in api_results:
+            if not food_data['barcode']:
+                continue
             results.append({
-                'id': food_id,
+                'id': food_ids[food_data['barcode']],
                 'name': food_data['name'],
                 'brand': food_data['brand'],
                 'calories_per_100g': food_data['calories_per_100g'],
                 'source': 'api'
             })
     
+    SearchCache.set(query, results)
     return jsonify(results)
 
 @app.route('/scan-barcode', methods=['POST'])
+@query_budget(4)
 @require_login
 def scan_barcode():
     """Process barcode scan"""
@@ -186,6 +277,7 @@ def scan_barcode():
             food = Food(**food_data)
             db.session.add(food)
             db.session.commit()
+            SearchCache.invalidate([food.name])
         else:
             return jsonify({'error': 'Product not found'}), 404
     
@@ -200,6 +292,7 @@ def scan_barcode():
     })
 
 @app.route('/recognize-food', methods=['POST'])
+@query_budget(2)
 @require_login
 def recognize_food():
     """Process food image recognition"""
@@ -232,20 +325,22 @@ def recognize_food():
         return jsonify({'error': 'Error processing image'}), 500
 
 @app.route('/weight-tracker')
+@query_budget(4)
+@read_replica
 @require_login
 def weight_tracker():
     """Weight tracking page"""
     # Get weight progress for different time periods
-    weight_7d = NutritionCalculator.get_weight_progress(current_user, days=7)
-    weight_30d = NutritionCalculator.get_weight_progress(current_user, days=30)
-    weight_90d = NutritionCalculator.get_weight_progress(current_user, days=90)
+    weight_progress = NutritionCalculator.get_weight_progress_for_periods(current_user, [7, 30, 90])
     
     return render_template('weight_tracker.html',
-                         weight_7d=weight_7d,
-                         weight_30d=weight_30d,
-                         weight_90d=weight_90d)
+                         weight_7d=weight_progress[7],
+                         weight_30d=weight_progress[30],
+                         weight_90d=weight_progress[90],
+                         date=date)
 
 @app.route('/add-weight', methods=['POST'])
+@query_budget(7)
 @require_login
 def add_weight():
     """Add weight entry"""
@@ -275,6 +370,8 @@ def add_weight():
             )
             db.session.add(weight_entry)
         
+        NutritionCalculator.refresh_targets(current_user)
+        DataVersion.bump([current_user.id])
         db.session.commit()
         flash('Weight recorded successfully!', 'success')
         
@@ -287,13 +384,55 @@ def add_weight():
     
     return redirect(url_for('weight_tracker'))
 
+@app.route('/import-weights', methods=['POST'])
+@query_budget(4)
+@require_login
+def import_weights():
+    """Import weight history from a smart-scale CSV or Apple Health export in the background"""
+    upload = request.files.get('file')
+    if not upload or not upload.filename:
+        flash('Please choose a file to import', 'error')
+        return redirect(url_for('weight_tracker'))
+    
+    extension = os.path.splitext(upload.filename)[1].lower()
+    if extension not in WeightImport.ALLOWED_EXTENSIONS:
+        flash('Please upload a CSV file or an Apple Health export (export.xml or export.zip)', 'error')
+        return redirect(url_for('weight_tracker'))
+    
+    try:
+        # Stored in the database: the job may run on another instance
+        upload_id = WeightImport.store_upload(current_user, upload.filename, upload.stream)
+        if upload_id is None:
+            flash(f'Please upload a file smaller than {WeightImport.MAX_UPLOAD_BYTES // (1024 * 1024)} MB', 'error')
+            return redirect(url_for('weight_tracker'))
+        JobQueue.enqueue('weights.import', {'upload_id': upload_id})
+        db.session.commit()
+        flash('Import started. Your weight history will appear shortly.', 'success')
+        
+    except Exception as e:
+        logger.error(f"Error starting weight import: {str(e)}")
+        flash('Error importing weights. Please try again.', 'error')
+        db.session.rollback()
+    
+    return redirect(url_for('weight_tracker'))
+
 @app.route('/profile')
+@query_budget(2)
+@read_replica
 @require_login
 def profile():
     """User profile page"""
     return render_template('profile.html', user=current_user)
 
+@app.route('/barcode-benchmark')
+@query_budget(2)
+@require_login
+def barcode_benchmark():
+    """Client-side barcode decoding benchmark"""
+    return render_template('barcode_benchmark.html')
+
 @app.route('/update-profile', methods=['POST'])
+@query_budget(6)
 @require_login
 def update_profile():
     """Update user profile"""
@@ -305,6 +444,8 @@ def update_profile():
         current_user.goal = request.form.get('goal')
         current_user.daily_calorie_goal = int(request.form.get('daily_calorie_goal', 2000))
         
+        NutritionCalculator.refresh_targets(current_user)
+        DataVersion.bump([current_user.id])
         db.session.commit()
         flash('Profile updated successfully!', 'success')
         
@@ -316,6 +457,7 @@ def update_profile():
     return redirect(url_for('profile'))
 
 @app.route('/delete-food-log/<int:log_id>', methods=['POST'])
+@query_budget(6)
 @require_login
 def delete_food_log(log_id):
     """Delete a food log entry"""
@@ -324,6 +466,7 @@ def delete_food_log(log_id):
         if food_log:
             log_date = food_log.log_date
             db.session.delete(food_log)
+            DataVersion.bump([current_user.id])
             db.session.commit()
             flash('Food entry deleted successfully!', 'success')
             return redirect(url_for('food_log', date=log_date.isoformat()))
@@ -336,6 +479,120 @@ def delete_food_log(log_id):
     
     return redirect(url_for('food_log'))
 
+@app.route('/assets/<path:filename>')
+@query_budget(0)
+def static_asset(filename):
+    """Serve fingerprinted assets as immutable, using a precompressed variant when accepted"""
+    dist_folder = AssetPipeline.dist_folder(app.static_folder)
+    send_name, encoding = AssetPipeline.negotiate(dist_folder, filename, request.accept_encodings)
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    
+    response = send_from_directory(dist_folder, send_name, mimetype=mimetype, max_age=AssetPipeline.MAX_AGE)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.headers['Cache-Control'] = f'public, max-age={AssetPipeline.MAX_AGE}, immutable'
+    response.vary.add('Accept-Encoding')
+    return response
+
+@app.route('/metrics')
+@query_budget(0)
+def metrics():
+    """Prometheus metrics aggregated over all worker processes"""
+    token = os.environ.get('METRICS_TOKEN')
+    # Per-route traffic and timings are not public: without a token there is no endpoint
+    if not token:
+        abort(404)
+    if not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        abort(403)
+    return app.response_class(PerformanceMetrics.render(), mimetype='text/plain; version=0.0.4')
+
+def _user_etag(*parts) -> str:
+    """Strong ETag for the current user's data at its current data version"""
+    key = ':'.join(str(part) for part in (
+        current_user.id,
+        current_user.data_version or 0,
+        date.today().isoformat(),
+        *parts
+    ))
+    return hashlib.sha1(key.encode()).hexdigest()
+
+def _conditional_json(etag, build):
+    """Answer 304 when the client already has ``etag``, otherwise jsonify ``build()``"""
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+    else:
+        response = jsonify(build())
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+@app.route('/api/nutrition/summary')
+@query_budget(7)
+@read_replica
+@require_login
+def api_nutrition_summary():
+    """Daily nutrition summary as JSON for the dashboard charts"""
+    target_date = request.args.get('date', date.today().isoformat())
+    try:
+        target_date = datetime.strptime(target_date, '%Y-%m-%d').date()
+    except ValueError:
+        target_date = date.today()
+    
+    def build():
+        summary = NutritionCalculator.get_daily_nutrition_summary(current_user, target_date)
+        summary['date'] = summary['date'].isoformat()
+        return summary
+    
+    return _conditional_json(_user_etag('nutrition-summary', target_date.isoformat()), build)
+
+@app.route('/api/weight/progress')
+@query_budget(4)
+@read_replica
+@require_login
+def api_weight_progress():
+    """Weight progress as JSON for the weight charts"""
+    days = request.args.get('days', 30, type=int)
+    days = min(max(days, 1), 3650)
+    
+    return _conditional_json(
+        _user_etag('weight-progress', days),
+        lambda: NutritionCalculator.get_weight_progress(current_user, days=days)
+    )
+
+@app.route('/api/recommendations/foods')
+@query_budget(8)
+@read_replica
+@require_login
+def api_food_recommendations():
+    """Foods and portions that best fit what is left of today's calories and macros"""
+    limit = min(max(request.args.get('limit', 5, type=int), 1), 20)
+    remaining = FoodRecommender.remaining(NutritionCalculator.get_daily_nutrition_summary(current_user))
+    return jsonify({
+        'remaining': remaining,
+        'foods': FoodRecommender.recommend(remaining, limit=limit),
+    })
+
+@app.route('/api/sync', methods=['POST'])
+@query_budget(16)
+@require_login
+def api_sync():
+    """Apply a batch of writes queued by the client while offline"""
+    payload = request.get_json(silent=True) or {}
+    try:
+        result = SyncBatch.apply(current_user, payload.get('mutations'))
+    except SyncError as e:
+        return jsonify({'error': str(e)}), 400
+    except IntegrityError:
+        # The same batch is being applied by a concurrent request; the retry gets duplicates
+        db.session.rollback()
+        return jsonify({'error': 'Sync conflict, retry'}), 409
+    except Exception as e:
+        logger.error(f"Error syncing mutations: {str(e)}")
+        db.session.rollback()
+        return jsonify({'error': 'Error syncing changes'}), 500
+    
+    return jsonify(result)
+
 @app.errorhandler(404)
 def not_found(error):
     return render_template('404.html'), 404
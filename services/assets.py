@@ -0,0 +1,118 @@
+import gzip
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Dict, Optional
+
+from flask import url_for
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, gzip is always produced
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+class AssetPipeline:
+    """
+    Fingerprint and precompress static assets so they can be served immutable
+    """
+
+    # Source globs relative to the static folder
+    SOURCES = ('js/*.js', 'css/*.css')
+    DIST_DIR = 'dist'
+    MANIFEST = 'manifest.json'
+    MAX_AGE = 365 * 24 * 60 * 60
+
+    # Content-Encoding -> file suffix, in order of preference
+    ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+    _manifest: Dict[str, str] = {}
+    _manifest_mtime: Optional[float] = None
+
+    @staticmethod
+    def dist_folder(static_folder: str) -> Path:
+        return Path(static_folder) / AssetPipeline.DIST_DIR
+
+    @staticmethod
+    def build(static_folder: str) -> Dict[str, str]:
+        """
+        Write content-hashed copies (plus .gz/.br variants) of every source asset
+        and return the manifest mapping source names to fingerprinted names
+        """
+        static_path = Path(static_folder)
+        dist_path = AssetPipeline.dist_folder(static_folder)
+        manifest = {}
+
+        for pattern in AssetPipeline.SOURCES:
+            for source in sorted(static_path.glob(pattern)):
+                content = source.read_bytes()
+                digest = hashlib.sha256(content).hexdigest()[:12]
+                relative = source.relative_to(static_path)
+                fingerprinted = relative.with_name(f"{source.stem}.{digest}{source.suffix}")
+
+                target = dist_path / fingerprinted
+                target.parent.mkdir(parents=True, exist_ok=True)
+                target.write_bytes(content)
+                # mtime=0 keeps the gzip output byte-identical across builds
+                Path(f"{target}.gz").write_bytes(gzip.compress(content, compresslevel=9, mtime=0))
+                if brotli is not None:
+                    Path(f"{target}.br").write_bytes(brotli.compress(content, quality=11))
+
+                manifest[relative.as_posix()] = fingerprinted.as_posix()
+
+        manifest_path = dist_path / AssetPipeline.MANIFEST
+        manifest_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = manifest_path.with_suffix('.tmp')
+        tmp_path.write_text(json.dumps(manifest, indent=2, sort_keys=True))
+        os.replace(tmp_path, manifest_path)
+
+        logger.info(f"Built {len(manifest)} fingerprinted assets (brotli: {brotli is not None})")
+        return manifest
+
+    @staticmethod
+    def load_manifest(static_folder: str) -> Dict[str, str]:
+        """
+        Return the build manifest, re-reading it when a new build replaced it
+        """
+        manifest_path = AssetPipeline.dist_folder(static_folder) / AssetPipeline.MANIFEST
+        try:
+            mtime = manifest_path.stat().st_mtime
+        except OSError:
+            AssetPipeline._manifest, AssetPipeline._manifest_mtime = {}, None
+            return AssetPipeline._manifest
+
+        if mtime != AssetPipeline._manifest_mtime:
+            try:
+                AssetPipeline._manifest = json.loads(manifest_path.read_text())
+            except (OSError, ValueError) as e:
+                logger.error(f"Error reading asset manifest: {str(e)}")
+                AssetPipeline._manifest = {}
+            AssetPipeline._manifest_mtime = mtime
+        return AssetPipeline._manifest
+
+    @staticmethod
+    def url(filename: str, **values) -> str:
+        """
+        Drop-in for url_for('static', filename=...) that emits the fingerprinted
+        URL when the asset has been built, and the plain static URL otherwise
+        """
+        from flask import current_app
+
+        fingerprinted = AssetPipeline.load_manifest(current_app.static_folder).get(filename)
+        if fingerprinted:
+            return url_for('static_asset', filename=fingerprinted, **values)
+        return url_for('static', filename=filename, **values)
+
+    @staticmethod
+    def negotiate(dist_folder: Path, filename: str, accept_encodings) -> tuple:
+        """
+        Pick the best precompressed variant of ``filename`` the client accepts.
+        Returns (file name to send, Content-Encoding or None).
+        """
+        for encoding, suffix in AssetPipeline.ENCODINGS:
+            if accept_encodings.quality(encoding) > 0 and (dist_folder / f"{filename}{suffix}").is_file():
+                return f"{filename}{suffix}", encoding
+        return filename, None
@@ -0,0 +1,40 @@
+import logging
+from typing import Iterable
+
+from blinker import Namespace
+from sqlalchemy import func, update
+
+from models import User
+
+logger = logging.getLogger(__name__)
+
+_signals = Namespace()
+
+# Sent with ``user_ids`` after the data version of those users was bumped
+data_changed = _signals.signal('data-changed')
+
+class DataVersion:
+    """
+    Per-user data version used to key and invalidate derived views
+    """
+
+    @staticmethod
+    def bump(user_ids: Iterable[str]) -> None:
+        """
+        Increment the data version of the given users in the current transaction
+        """
+        from app import db
+
+        user_ids = sorted(set(user_ids))
+        if not user_ids:
+            return
+
+        db.session.execute(
+            update(User)
+            .where(User.id.in_(user_ids))
+            .values(data_version=func.coalesce(User.data_version, 0) + 1),
+            execution_options={'synchronize_session': False}
+        )
+
+        logger.debug(f"Bumped data version for {len(user_ids)} users")
+        data_changed.send(DataVersion, user_ids=user_ids)
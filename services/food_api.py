@@ -2,11 +2,33 @@ import requests
 import logging
 from typing import Optional, Dict, Any
 
+from services.metrics import PerformanceMetrics
+
 logger = logging.getLogger(__name__)
 
 class OpenFoodFactsAPI:
     BASE_URL = "https://world.openfoodfacts.org/api/v0"
     
+    @staticmethod
+    def parse_product(product: Dict[str, Any], barcode: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Map an Open Food Facts product to Food column values
+        """
+        nutriments = product.get('nutriments', {})
+        
+        return {
+            'barcode': barcode or product.get('code'),
+            'name': product.get('product_name', 'Unknown Product'),
+            'brand': product.get('brands', '').split(',')[0].strip() if product.get('brands') else None,
+            'calories_per_100g': nutriments.get('energy-kcal_100g'),
+            'protein_per_100g': nutriments.get('proteins_100g'),
+            'carbs_per_100g': nutriments.get('carbohydrates_100g'),
+            'fat_per_100g': nutriments.get('fat_100g'),
+            'fiber_per_100g': nutriments.get('fiber_100g'),
+            'sugar_per_100g': nutriments.get('sugars_100g'),
+            'sodium_per_100g': nutriments.get('sodium_100g')
+        }
+    
     @staticmethod
     def get_product_by_barcode(barcode: str) -> Optional[Dict[str, Any]]:
         """
@@ -14,30 +36,15 @@ class OpenFoodFactsAPI:
         """
         try:
             url = f"{OpenFoodFactsAPI.BASE_URL}/product/{barcode}.json"
-            response = requests.get(url, timeout=10)
+            with PerformanceMetrics.timed('off_api_seconds'):
+                response = requests.get(url, timeout=10)
             response.raise_for_status()
             
             data = response.json()
             
             if data.get('status') == 1 and 'product' in data:
-                product = data['product']
-                
-                # Extract nutrition information
-                nutriments = product.get('nutriments', {})
-                
                 # Convert to our standard format
-                food_data = {
-                    'barcode': barcode,
-                    'name': product.get('product_name', 'Unknown Product'),
-                    'brand': product.get('brands', '').split(',')[0].strip() if product.get('brands') else None,
-                    'calories_per_100g': nutriments.get('energy-kcal_100g'),
-                    'protein_per_100g': nutriments.get('proteins_100g'),
-                    'carbs_per_100g': nutriments.get('carbohydrates_100g'),
-                    'fat_per_100g': nutriments.get('fat_100g'),
-                    'fiber_per_100g': nutriments.get('fiber_100g'),
-                    'sugar_per_100g': nutriments.get('sugars_100g'),
-                    'sodium_per_100g': nutriments.get('sodium_100g')
-                }
+                food_data = OpenFoodFactsAPI.parse_product(data['product'], barcode)
                 
                 logger.info(f"Successfully fetched product data for barcode: {barcode}")
                 return food_data
@@ -68,7 +75,8 @@ class OpenFoodFactsAPI:
                 'page_size': page_size
             }
             
-            response = requests.get(url, params=params, timeout=10)
+            with PerformanceMetrics.timed('off_api_seconds'):
+                response = requests.get(url, params=params, timeout=10)
             response.raise_for_status()
             
             data = response.json()
@@ -76,21 +84,7 @@ class OpenFoodFactsAPI:
             
             for product in data.get('products', []):
                 if 'product_name' in product:
-                    nutriments = product.get('nutriments', {})
-                    
-                    food_data = {
-                        'barcode': product.get('code'),
-                        'name': product.get('product_name', 'Unknown Product'),
-                        'brand': product.get('brands', '').split(',')[0].strip() if product.get('brands') else None,
-                        'calories_per_100g': nutriments.get('energy-kcal_100g'),
-                        'protein_per_100g': nutriments.get('proteins_100g'),
-                        'carbs_per_100g': nutriments.get('carbohydrates_100g'),
-                        'fat_per_100g': nutriments.get('fat_100g'),
-                        'fiber_per_100g': nutriments.get('fiber_100g'),
-                        'sugar_per_100g': nutriments.get('sugars_100g'),
-                        'sodium_per_100g': nutriments.get('sodium_100g')
-                    }
-                    products.append(food_data)
+                    products.append(OpenFoodFactsAPI.parse_product(product))
             
             logger.info(f"Found {len(products)} products for query: {query}")
             return products
@@ -0,0 +1,342 @@
+import logging
+import warnings
+from datetime import date
+from typing import Dict, Any, List
+
+from sqlalchemy import DDL, MetaData, PrimaryKeyConstraint, Table, event, exc, inspect, text
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.schema import CreateIndex, CreateTable
+
+from models import FoodLog
+
+logger = logging.getLogger(__name__)
+
+PARENT_TABLE = 'food_logs'
+DEFAULT_PARTITION = 'food_logs_default'
+
+# Arbitrary key serializing partition maintenance across app workers
+_ADVISORY_LOCK_KEY = 727001
+
+class FoodLogPartitions:
+    """
+    Monthly range partitioning of food_logs on PostgreSQL. Other databases keep
+    the plain table; every method is a no-op there.
+
+    Rows land in food_logs_<yyyy>_<mm>; rows with no matching month yet go to
+    food_logs_default until ``ensure_partitions`` moves them into their own month.
+    Indexes declared on FoodLog are created on the parent and so on every partition.
+    """
+
+    MONTHS_AHEAD = 3
+
+    @staticmethod
+    def is_supported(bind) -> bool:
+        return bind.dialect.name == 'postgresql'
+
+    @staticmethod
+    def partition_name(month: date) -> str:
+        return f'{PARENT_TABLE}_{month:%Y_%m}'
+
+    @staticmethod
+    def add_months(month: date, months: int) -> date:
+        index = month.year * 12 + month.month - 1 + months
+        return date(index // 12, index % 12 + 1, 1)
+
+    @staticmethod
+    def partitioned_table() -> Table:
+        """
+        Copy of the food_logs table as PostgreSQL needs it when partitioned:
+        the primary key has to include the partition key
+        """
+        from app import db
+
+        metadata = MetaData()
+        for table in db.metadata.sorted_tables:
+            table.to_metadata(metadata)
+        table = metadata.tables[PARENT_TABLE]
+        table.c.id.autoincrement = True
+        table.c.log_date.nullable = False
+        with warnings.catch_warnings():
+            # Replacing the primary key of the copy is intended
+            warnings.simplefilter('ignore', exc.SAWarning)
+            table.append_constraint(PrimaryKeyConstraint(table.c.id, table.c.log_date))
+        table.dialect_kwargs['postgresql_partition_by'] = 'RANGE (log_date)'
+        return table
+
+    @staticmethod
+    def is_partitioned(bind) -> bool:
+        return bind.execute(text(
+            "SELECT relkind FROM pg_class WHERE oid = to_regclass(:table)"
+        ), {'table': PARENT_TABLE}).scalar() == 'p'
+
+    @staticmethod
+    def partitions(bind) -> List[Dict[str, Any]]:
+        """
+        Attached partitions with their month (None for the default partition),
+        tablespace and table access method
+        """
+        rows = bind.execute(text(
+            "SELECT c.relname, ts.spcname, am.amname "
+            "FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid "
+            "LEFT JOIN pg_tablespace ts ON ts.oid = c.reltablespace "
+            "LEFT JOIN pg_am am ON am.oid = c.relam "
+            "WHERE i.inhparent = to_regclass(:table) "
+            "ORDER BY c.relname"
+        ), {'table': PARENT_TABLE}).all()
+
+        partitions = []
+        for name, tablespace, access_method in rows:
+            month = None
+            if name != DEFAULT_PARTITION:
+                year, month_number = name[len(PARENT_TABLE) + 1:].split('_')
+                month = date(int(year), int(month_number), 1)
+            partitions.append({
+                'name': name,
+                'month': month,
+                'tablespace': tablespace,
+                'access_method': access_method,
+            })
+        return partitions
+
+    @staticmethod
+    def ensure_indexes(connection) -> List[str]:
+        """
+        Create FoodLog indexes missing from databases created before they were
+        declared. ``connection`` must be in autocommit mode: on PostgreSQL the
+        indexes are built CONCURRENTLY so writes to food_logs carry on, under the
+        partition maintenance lock. Returns the names of the indexes created.
+        """
+        existing = {index['name'] for index in inspect(connection).get_indexes(PARENT_TABLE)}
+        if not FoodLogPartitions.is_supported(connection):
+            for index in FoodLog.__table__.indexes:
+                connection.execute(CreateIndex(index, if_not_exists=True))
+            return [index.name for index in FoodLog.__table__.indexes if index.name not in existing]
+
+        created = []
+        connection.execute(text("SELECT pg_advisory_lock(:key)"), {'key': _ADVISORY_LOCK_KEY})
+        try:
+            partitioned = FoodLogPartitions.is_partitioned(connection)
+            for index in FoodLog.__table__.indexes:
+                if not partitioned:
+                    if FoodLogPartitions._create_index_concurrently(connection, index, index.name, PARENT_TABLE):
+                        created.append(index.name)
+                    continue
+
+                # Partitioned tables cannot be indexed CONCURRENTLY: create the parent
+                # index alone, build each partition's concurrently and attach them
+                columns = ', '.join(column.name for column in index.columns)
+                connection.execute(text(
+                    f"CREATE {'UNIQUE ' if index.unique else ''}INDEX IF NOT EXISTS {index.name} "
+                    f"ON ONLY {PARENT_TABLE} ({columns})"
+                ))
+                attached = set(connection.execute(text(
+                    "SELECT t.relname FROM pg_inherits i "
+                    "JOIN pg_index x ON x.indexrelid = i.inhrelid "
+                    "JOIN pg_class t ON t.oid = x.indrelid "
+                    "WHERE i.inhparent = to_regclass(:index)"
+                ), {'index': index.name}).scalars())
+                for partition in FoodLogPartitions.partitions(connection):
+                    if partition['name'] in attached:
+                        continue
+                    partition_index = f"{partition['name']}_{index.name}"[:63]
+                    FoodLogPartitions._create_index_concurrently(connection, index, partition_index, partition['name'])
+                    connection.execute(text(f"ALTER INDEX {index.name} ATTACH PARTITION {partition_index}"))
+                if index.name not in existing:
+                    created.append(index.name)
+        finally:
+            connection.execute(text("SELECT pg_advisory_unlock(:key)"), {'key': _ADVISORY_LOCK_KEY})
+
+        if created:
+            logger.info(f"Created food_logs indexes: {', '.join(created)}")
+        return created
+
+    @staticmethod
+    def _create_index_concurrently(connection, index, name: str, table: str) -> bool:
+        """
+        Build ``index`` as ``name`` on ``table`` without blocking writes, replacing
+        an invalid leftover of an interrupted build. Returns whether it was built.
+        """
+        valid = connection.execute(text(
+            "SELECT indisvalid FROM pg_index WHERE indexrelid = to_regclass(:name)"
+        ), {'name': name}).scalar()
+        if valid:
+            return False
+        if valid is not None:
+            connection.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+
+        columns = ', '.join(column.name for column in index.columns)
+        connection.execute(text(
+            f"CREATE {'UNIQUE ' if index.unique else ''}INDEX CONCURRENTLY IF NOT EXISTS {name} ON {table} ({columns})"
+        ))
+        return True
+
+    @staticmethod
+    def ensure_partitions(months_ahead: int = MONTHS_AHEAD) -> List[str]:
+        """
+        Create the partitions of the current and next ``months_ahead`` months, plus
+        those of any month that has rows waiting in the default partition.
+        Returns the names of the partitions created.
+        """
+        from app import db
+
+        if not FoodLogPartitions.is_supported(db.engine):
+            return []
+
+        created = []
+        with db.engine.begin() as connection:
+            if not FoodLogPartitions.is_partitioned(connection):
+                logger.warning("food_logs is not partitioned, run `flask food-logs partition` to convert it")
+                return []
+            connection.execute(text("SELECT pg_advisory_xact_lock(:key)"), {'key': _ADVISORY_LOCK_KEY})
+
+            existing = {partition['month'] for partition in FoodLogPartitions.partitions(connection)}
+            this_month = date.today().replace(day=1)
+            wanted = {FoodLogPartitions.add_months(this_month, n) for n in range(months_ahead + 1)}
+            wanted.update(connection.execute(text(
+                f"SELECT DISTINCT date_trunc('month', log_date)::date FROM {DEFAULT_PARTITION}"
+            )).scalars())
+
+            for month in sorted(wanted - existing):
+                FoodLogPartitions._create_partition(connection, month)
+                created.append(FoodLogPartitions.partition_name(month))
+
+        if created:
+            logger.info(f"Created food_logs partitions: {', '.join(created)}")
+        return created
+
+    @staticmethod
+    def _create_partition(connection, month: date) -> None:
+        """
+        Create the partition of ``month``, moving in any of its rows that were
+        routed to the default partition (PostgreSQL refuses to attach otherwise)
+        """
+        name = FoodLogPartitions.partition_name(month)
+        lower = month.isoformat()
+        upper = FoodLogPartitions.add_months(month, 1).isoformat()
+
+        connection.execute(text(
+            f"CREATE TABLE {name} (LIKE {PARENT_TABLE} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"
+        ))
+        connection.execute(text(
+            f"WITH moved AS (DELETE FROM {DEFAULT_PARTITION} "
+            f"WHERE log_date >= '{lower}' AND log_date < '{upper}' RETURNING *) "
+            f"INSERT INTO {name} SELECT * FROM moved"
+        ))
+        # Attaching also creates the parent's indexes on the new partition
+        connection.execute(text(
+            f"ALTER TABLE {PARENT_TABLE} ATTACH PARTITION {name} FOR VALUES FROM ('{lower}') TO ('{upper}')"
+        ))
+
+    @staticmethod
+    def convert(months_ahead: int = MONTHS_AHEAD) -> Dict[str, Any]:
+        """
+        Rebuild an existing unpartitioned food_logs table as a partitioned one,
+        in a single transaction. Writes to food_logs block until it finishes.
+        """
+        from app import db
+
+        if not FoodLogPartitions.is_supported(db.engine):
+            raise ValueError("Partitioning food_logs requires PostgreSQL")
+
+        old_table = f'{PARENT_TABLE}_unpartitioned'
+        partitioned = FoodLogPartitions.partitioned_table()
+        columns = ', '.join(column.name for column in partitioned.columns)
+        # Rows predating the NOT NULL partition key are dated by when they were logged
+        log_date = 'COALESCE(log_date, logged_at::date, CURRENT_DATE)'
+        source_columns = ', '.join(
+            log_date if column.name == 'log_date' else column.name for column in partitioned.columns
+        )
+
+        with db.engine.begin() as connection:
+            if FoodLogPartitions.is_partitioned(connection):
+                raise ValueError("food_logs is already partitioned")
+            connection.execute(text(f"LOCK TABLE {PARENT_TABLE} IN EXCLUSIVE MODE"))
+
+            connection.execute(text(f"ALTER TABLE {PARENT_TABLE} RENAME TO {old_table}"))
+            connection.execute(text(f"ALTER INDEX IF EXISTS {PARENT_TABLE}_pkey RENAME TO {old_table}_pkey"))
+            for index in FoodLog.__table__.indexes:
+                connection.execute(text(f"DROP INDEX IF EXISTS {index.name}"))
+
+            # Creates the indexes too
+            partitioned.create(connection)
+            connection.execute(text(
+                f"CREATE TABLE IF NOT EXISTS {DEFAULT_PARTITION} PARTITION OF {PARENT_TABLE} DEFAULT"
+            ))
+
+            this_month = date.today().replace(day=1)
+            months = set(connection.execute(text(
+                f"SELECT DISTINCT date_trunc('month', {log_date})::date FROM {old_table}"
+            )).scalars())
+            months.update(FoodLogPartitions.add_months(this_month, n) for n in range(months_ahead + 1))
+            for month in sorted(months):
+                FoodLogPartitions._create_partition(connection, month)
+
+            rows = connection.execute(text(
+                f"INSERT INTO {PARENT_TABLE} ({columns}) SELECT {source_columns} FROM {old_table}"
+            )).rowcount
+            connection.execute(text(
+                f"SELECT setval(pg_get_serial_sequence('{PARENT_TABLE}', 'id'), "
+                f"(SELECT COALESCE(MAX(id), 0) + 1 FROM {PARENT_TABLE}), false)"
+            ))
+            connection.execute(text(f"DROP TABLE {old_table}"))
+
+        stats = {'rows': rows, 'partitions': len(months)}
+        logger.info(f"Partitioned food_logs: {stats}")
+        return stats
+
+    @staticmethod
+    def archive(older_than_months: int, tablespace: str) -> List[str]:
+        """
+        Move partitions of months older than ``older_than_months``, with their
+        indexes, to ``tablespace`` on cheaper (e.g. compressed) disks. The
+        partitions stay attached and writable, so queries on food_logs keep reading
+        them transparently and recomputes and deletes of old logs keep working.
+        Columnar access methods are deliberately not offered: they reject UPDATE
+        and DELETE. Returns the names of the partitions archived.
+        """
+        from app import db
+
+        if not FoodLogPartitions.is_supported(db.engine):
+            raise ValueError("Archiving food_logs partitions requires PostgreSQL")
+        if not tablespace:
+            raise ValueError("Give an archive tablespace")
+
+        quote = db.engine.dialect.identifier_preparer.quote
+        cutoff = FoodLogPartitions.add_months(date.today().replace(day=1), -older_than_months)
+        with db.engine.connect() as connection:
+            candidates = [
+                partition for partition in FoodLogPartitions.partitions(connection)
+                if partition['month'] is not None and partition['month'] < cutoff
+            ]
+
+        archived = []
+        for partition in candidates:
+            name = partition['name']
+            if partition['tablespace'] == tablespace:
+                continue
+
+            # One partition per transaction: each rewrite locks only its own partition
+            with db.engine.begin() as connection:
+                indexes = connection.execute(text(
+                    "SELECT indexname FROM pg_indexes WHERE tablename = :table"
+                ), {'table': name}).scalars().all()
+                connection.execute(text(f"ALTER TABLE {name} SET TABLESPACE {quote(tablespace)}"))
+                for index in indexes:
+                    connection.execute(text(f"ALTER INDEX {quote(index)} SET TABLESPACE {quote(tablespace)}"))
+            archived.append(name)
+            logger.info(f"Archived {name}")
+        return archived
+
+@compiles(CreateTable, 'postgresql')
+def _create_partitioned_food_logs(create, compiler, **kw):
+    # db.create_all() creates food_logs partitioned on PostgreSQL
+    if create.element is FoodLog.__table__:
+        create = CreateTable(FoodLogPartitions.partitioned_table())
+    return compiler.visit_create_table(create, **kw)
+
+event.listen(
+    FoodLog.__table__, 'after_create',
+    DDL(f"CREATE TABLE IF NOT EXISTS {DEFAULT_PARTITION} PARTITION OF {PARENT_TABLE} DEFAULT")
+    .execute_if(dialect='postgresql')
+)
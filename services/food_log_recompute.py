@@ -0,0 +1,116 @@
+import logging
+import time
+from datetime import datetime
+from typing import Dict, Any, Optional
+
+from sqlalchemy import func, or_, select, update
+
+from models import Food, FoodLog
+from services.data_version import DataVersion
+from services.food_recommender import FoodRecommender
+
+logger = logging.getLogger(__name__)
+
+# FoodLog column -> Food column holding the per-100g value
+NUTRIENT_COLUMNS = {
+    'calories': 'calories_per_100g',
+    'protein': 'protein_per_100g',
+    'carbs': 'carbs_per_100g',
+    'fat': 'fat_per_100g',
+    'fiber': 'fiber_per_100g',
+    'sugar': 'sugar_per_100g',
+    'sodium': 'sodium_per_100g',
+}
+
+class FoodLogRecompute:
+    """
+    Recompute the denormalized nutrition values stored on FoodLog rows
+    from the current per-100g values of their Food
+    """
+
+    DEFAULT_BATCH_SIZE = 5000
+
+    @staticmethod
+    def recompute(food_id: Optional[int] = None, batch_size: int = DEFAULT_BATCH_SIZE) -> Dict[str, Any]:
+        """
+        Update FoodLog nutrition for one food (or all foods) in id-ordered chunks.
+        Each chunk is a single set-based UPDATE ... FROM foods committed on its own
+        so locks are held only briefly. The food recommendation matrix is brought
+        up to date as well.
+        """
+        from app import db
+
+        multiplier = FoodLog.quantity / 100.0
+        new_values = {
+            log_column: func.coalesce(getattr(Food, food_column), 0.0) * multiplier
+            for log_column, food_column in NUTRIENT_COLUMNS.items()
+        }
+        # Skip rows that are already up to date to avoid needless writes
+        is_stale = or_(*(
+            getattr(FoodLog, log_column).is_distinct_from(value)
+            for log_column, value in new_values.items()
+        ))
+
+        start = time.perf_counter()
+        if food_id is not None:
+            # Corrections made in SQL leave updated_at alone; other hosts' matrices go by it
+            db.session.execute(update(Food).where(Food.id == food_id).values(updated_at=datetime.now()))
+            db.session.commit()
+        last_id = 0
+        scanned = 0
+        updated = 0
+        batches = 0
+        affected_users = set()
+
+        while True:
+            id_query = select(FoodLog.id).where(FoodLog.id > last_id)
+            if food_id is not None:
+                id_query = id_query.where(FoodLog.food_id == food_id)
+            ids = db.session.execute(
+                id_query.order_by(FoodLog.id).limit(batch_size)
+            ).scalars().all()
+
+            if not ids:
+                break
+
+            stmt = update(FoodLog).where(
+                FoodLog.food_id == Food.id,
+                FoodLog.id.between(ids[0], ids[-1]),
+                is_stale
+            ).values(**new_values)
+            if food_id is not None:
+                stmt = stmt.where(FoodLog.food_id == food_id)
+
+            changed_user_ids = db.session.execute(
+                stmt.returning(FoodLog.user_id),
+                execution_options={'synchronize_session': False}
+            ).scalars().all()
+
+            # Invalidate anything derived from the rewritten logs
+            DataVersion.bump(changed_user_ids)
+            db.session.commit()
+
+            scanned += len(ids)
+            updated += len(changed_user_ids)
+            batches += 1
+            affected_users.update(changed_user_ids)
+            last_id = ids[-1]
+
+        # The recommendation matrix holds the same per-100g values
+        if food_id is not None:
+            FoodRecommender.update_foods([food_id])
+        elif FoodRecommender.is_available():
+            FoodRecommender.build()
+
+        elapsed = time.perf_counter() - start
+        stats = {
+            'food_id': food_id,
+            'batches': batches,
+            'scanned': scanned,
+            'updated': updated,
+            'users': len(affected_users),
+            'seconds': round(elapsed, 3),
+            'rows_per_second': round(scanned / elapsed, 1) if elapsed > 0 else 0,
+        }
+        logger.info(f"Recomputed food logs: {stats}")
+        return stats
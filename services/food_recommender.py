@@ -0,0 +1,408 @@
+import fcntl
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Any, Iterator, List, Optional
+
+from flask import Flask
+from sqlalchemy import select
+
+from models import Food
+
+try:
+    import numpy as np
+except ImportError:  # numpy is optional; without it there are no food recommendations
+    np = None
+
+logger = logging.getLogger(__name__)
+
+# Matrix columns, per 100g
+MACROS = ('calories', 'protein', 'carbs', 'fat')
+MACRO_COLUMNS = ('calories_per_100g', 'protein_per_100g', 'carbs_per_100g', 'fat_per_100g')
+
+class FoodRecommender:
+    """
+    Recommend foods, with portion sizes, that best fill the calories and macros
+    a user has left for the day.
+
+    Foods are packed into a float32 matrix (one row of calories, protein, carbs
+    and fat per 100g per food) plus a parallel array of food ids, in files under
+    FOOD_MATRIX_DIR that every worker memory-maps, so the page cache holds one
+    copy for all of them. The directory is local to each host, so every host
+    keeps its own matrix: a thread in each serving process builds it when it is
+    missing, then every FOOD_MATRIX_REFRESH seconds appends new foods and
+    rewrites the rows of foods whose Food.updated_at moved, and rebuilds it
+    daily. The writer lock and the refresh time in meta.json make one process
+    per host do the work. A rebuild writes a new generation of files that
+    workers switch to when meta.json changes.
+    """
+
+    MATRIX_DIR = Path(os.environ.get('FOOD_MATRIX_DIR') or
+                      os.path.join(tempfile.gettempdir(), 'nutritracker-food-matrix'))
+    META = 'meta.json'
+    BATCH_SIZE = 50000
+    # A full rebuild also picks up changes that bypassed Food.updated_at, e.g. made in SQL
+    REBUILD_INTERVAL = 86400
+    # How far behind this host the clocks of hosts writing Food.updated_at may run
+    CLOCK_SKEW = 60
+
+    MIN_PORTION = 10.0
+    MAX_PORTION = 400.0
+    # With more left than this, aim for a meal of this size with the same macro split
+    MEAL_CALORIES = 800.0
+    # Going over the calories left counts this much more than falling short
+    OVERSHOOT_WEIGHT = 3.0
+    # Smallest remaining amount per macro used for scaling, so a macro that is used up still counts
+    REMAINING_FLOOR = (20.0, 2.0, 2.0, 1.0)
+
+    _lock = threading.Lock()
+    # (generation, rows) of the matrix this process has mapped, and its (ids, nutrients) arrays
+    _mapped: Optional[tuple] = None
+    _mapped_arrays: Optional[tuple] = None
+    _meta_mtime: Optional[float] = None
+    _refresh_started_pid = None
+    _refresh_lock = threading.Lock()
+
+    @staticmethod
+    def is_available() -> bool:
+        return np is not None
+
+    @staticmethod
+    def init_app(app: Flask) -> None:
+        """
+        Start the matrix refresh thread in each serving process on its first request
+        """
+        interval = app.config.get('FOOD_MATRIX_REFRESH', 0)
+        if np is None or interval <= 0:
+            return
+
+        @app.before_request
+        def start_food_matrix_refresh():
+            # Per pid: threads do not survive the fork into gunicorn workers
+            if FoodRecommender._refresh_started_pid == os.getpid():
+                return
+            with FoodRecommender._refresh_lock:
+                if FoodRecommender._refresh_started_pid == os.getpid():
+                    return
+                FoodRecommender._refresh_started_pid = os.getpid()
+                threading.Thread(target=FoodRecommender.keep_fresh, args=(app, interval),
+                                 name='food-matrix-refresh', daemon=True).start()
+
+    @staticmethod
+    def keep_fresh(app: Flask, interval: float, stop: Optional[threading.Event] = None) -> None:
+        """
+        Refresh this host's matrix every ``interval`` seconds until ``stop`` is set
+        """
+        stop = stop or threading.Event()
+        while not stop.is_set():
+            try:
+                with app.app_context():
+                    FoodRecommender.refresh(max_age=interval)
+            except Exception as e:
+                logger.error(f"Food matrix refresh error: {str(e)}")
+            stop.wait(interval)
+
+    @staticmethod
+    def _paths(generation: int) -> tuple:
+        return (FoodRecommender.MATRIX_DIR / f'foods-{generation}.ids',
+                FoodRecommender.MATRIX_DIR / f'foods-{generation}.f32')
+
+    @staticmethod
+    def _read_meta() -> Optional[Dict[str, Any]]:
+        try:
+            return json.loads((FoodRecommender.MATRIX_DIR / FoodRecommender.META).read_text())
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def _write_meta(meta: Dict[str, Any]) -> None:
+        path = FoodRecommender.MATRIX_DIR / FoodRecommender.META
+        tmp_path = path.with_suffix('.tmp')
+        tmp_path.write_text(json.dumps(meta))
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def _writer_lock():
+        """
+        Exclusive lock serializing matrix writers across processes; close the file to release it
+        """
+        FoodRecommender.MATRIX_DIR.mkdir(parents=True, exist_ok=True)
+        lock_file = open(FoodRecommender.MATRIX_DIR / 'write.lock', 'w')
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        return lock_file
+
+    @staticmethod
+    def _rows(after_id: int = 0, food_ids: Optional[List[int]] = None,
+              changed_since: Optional[datetime] = None) -> Iterator[tuple]:
+        """
+        Yield (ids, nutrients) arrays of foods in id order, BATCH_SIZE at a time.
+        Missing values are NaN so those foods never rank.
+        """
+        from app import db
+
+        last_id = after_id
+        while True:
+            stmt = select(Food.id, *(getattr(Food, column) for column in MACRO_COLUMNS)) \
+                .where(Food.id > last_id).order_by(Food.id).limit(FoodRecommender.BATCH_SIZE)
+            if food_ids is not None:
+                stmt = stmt.where(Food.id.in_(food_ids))
+            if changed_since is not None:
+                stmt = stmt.where(Food.updated_at >= changed_since)
+            rows = db.session.execute(stmt).all()
+            if not rows:
+                return
+            ids = np.array([row[0] for row in rows], dtype=np.int64)
+            nutrients = np.array([row[1:] for row in rows], dtype=np.float64).astype(np.float32)
+            yield ids, nutrients
+            last_id = rows[-1][0]
+
+    @staticmethod
+    def build() -> Dict[str, Any]:
+        """
+        Write a new generation of the matrix from all foods
+        """
+        if np is None:
+            raise RuntimeError("Food recommendations need numpy")
+
+        lock_file = FoodRecommender._writer_lock()
+        try:
+            return FoodRecommender._build()
+        finally:
+            lock_file.close()
+
+    @staticmethod
+    def _build() -> Dict[str, Any]:
+        """
+        build() for callers holding the writer lock
+        """
+        start = time.perf_counter()
+        started_at = time.time()
+        old_meta = FoodRecommender._read_meta()
+        generation = (old_meta['generation'] + 1) if old_meta else 1
+        ids_path, nutrients_path = FoodRecommender._paths(generation)
+        rows, max_food_id = 0, 0
+        with open(ids_path, 'wb') as ids_file, open(nutrients_path, 'wb') as nutrients_file:
+            for ids, nutrients in FoodRecommender._rows():
+                ids.tofile(ids_file)
+                nutrients.tofile(nutrients_file)
+                rows += len(ids)
+                max_food_id = int(ids[-1])
+        FoodRecommender._write_meta({'generation': generation, 'rows': rows, 'max_food_id': max_food_id,
+                                     'built_at': started_at, 'refreshed_at': started_at})
+
+        # Workers that still map the old files keep them alive until they switch
+        if old_meta:
+            for path in FoodRecommender._paths(old_meta['generation']):
+                path.unlink(missing_ok=True)
+
+        stats = {'generation': generation, 'rows': rows, 'seconds': round(time.perf_counter() - start, 3)}
+        logger.info(f"Built food matrix: {stats}")
+        return stats
+
+    @staticmethod
+    def refresh(max_age: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Append foods added and rewrite foods changed since the last build or refresh.
+        Builds the matrix if there is none or the last build is older than
+        REBUILD_INTERVAL, and does nothing if it was refreshed less than ``max_age``
+        seconds ago.
+        """
+        if np is None:
+            raise RuntimeError("Food recommendations need numpy")
+
+        lock_file = FoodRecommender._writer_lock()
+        try:
+            meta = FoodRecommender._read_meta()
+            ids_path, nutrients_path = FoodRecommender._paths(meta['generation']) if meta else (None, None)
+            if (meta is None or not (ids_path.exists() and nutrients_path.exists())
+                    or time.time() - meta.get('built_at', 0) >= FoodRecommender.REBUILD_INTERVAL):
+                return FoodRecommender._build()
+            if max_age is not None and time.time() - meta['refreshed_at'] < max_age:
+                # Another process on this host just did it
+                return {'generation': meta['generation'], 'rows': meta['rows'], 'added': 0, 'updated': 0}
+
+            started_at = time.time()
+            # Changed here or on another host since the last refresh; before appending,
+            # so the foods about to be appended are not rewritten as well
+            changed_since = datetime.fromtimestamp(meta['refreshed_at'] - FoodRecommender.CLOCK_SKEW)
+            updated = FoodRecommender._rewrite(meta, FoodRecommender._rows(changed_since=changed_since))
+            added = 0
+            with open(ids_path, 'r+b') as ids_file, open(nutrients_path, 'r+b') as nutrients_file:
+                # Drop anything past the committed row count left by an interrupted refresh
+                ids_file.truncate(meta['rows'] * 8)
+                nutrients_file.truncate(meta['rows'] * len(MACROS) * 4)
+                ids_file.seek(0, os.SEEK_END)
+                nutrients_file.seek(0, os.SEEK_END)
+                for ids, nutrients in FoodRecommender._rows(after_id=meta['max_food_id']):
+                    ids.tofile(ids_file)
+                    nutrients.tofile(nutrients_file)
+                    added += len(ids)
+                    meta['max_food_id'] = int(ids[-1])
+            meta['rows'] += added
+            meta['refreshed_at'] = started_at
+            FoodRecommender._write_meta(meta)
+        finally:
+            lock_file.close()
+
+        if added or updated:
+            logger.info(f"Added {added} and updated {updated} foods in the food matrix")
+        return {'generation': meta['generation'], 'rows': meta['rows'], 'added': added, 'updated': updated}
+
+    @staticmethod
+    def update_foods(food_ids: List[int]) -> int:
+        """
+        Rewrite the rows of foods whose nutrients changed, in place
+        """
+        if np is None or not food_ids:
+            return 0
+
+        lock_file = FoodRecommender._writer_lock()
+        try:
+            meta = FoodRecommender._read_meta()
+            if meta is None:
+                return 0
+            return FoodRecommender._rewrite(meta, FoodRecommender._rows(food_ids=food_ids))
+        finally:
+            lock_file.close()
+
+    @staticmethod
+    def _rewrite(meta: Dict[str, Any], batches: Iterator[tuple]) -> int:
+        """
+        Overwrite the rows of the (ids, nutrients) ``batches`` that are in the matrix;
+        the caller holds the writer lock. Returns the number of rows rewritten.
+        """
+        if not meta['rows']:
+            return 0
+        ids_path, nutrients_path = FoodRecommender._paths(meta['generation'])
+        matrix_ids = np.memmap(ids_path, dtype=np.int64, mode='r', shape=(meta['rows'],))
+        nutrients = np.memmap(nutrients_path, dtype=np.float32, mode='r+', shape=(meta['rows'], len(MACROS)))
+        updated = 0
+        for ids, values in batches:
+            # Ids are appended in increasing order, so rows can be found by bisection
+            positions = np.searchsorted(matrix_ids, ids)
+            found = (positions < len(matrix_ids)) & (matrix_ids[np.minimum(positions, len(matrix_ids) - 1)] == ids)
+            nutrients[positions[found]] = values[found]
+            updated += int(found.sum())
+        nutrients.flush()
+        del matrix_ids, nutrients
+        return updated
+
+    @staticmethod
+    def _matrix() -> Optional[tuple]:
+        """
+        The mapped (ids, nutrients) arrays, remapped when a refresh or build changed meta.json
+        """
+        try:
+            mtime = (FoodRecommender.MATRIX_DIR / FoodRecommender.META).stat().st_mtime
+        except OSError:
+            return None
+
+        with FoodRecommender._lock:
+            if mtime != FoodRecommender._meta_mtime:
+                meta = FoodRecommender._read_meta()
+                if meta is None:
+                    return FoodRecommender._mapped_arrays
+                key = (meta['generation'], meta['rows'])
+                if key != FoodRecommender._mapped and meta['rows']:
+                    ids_path, nutrients_path = FoodRecommender._paths(meta['generation'])
+                    try:
+                        FoodRecommender._mapped_arrays = (
+                            np.memmap(ids_path, dtype=np.int64, mode='r', shape=(meta['rows'],)),
+                            np.memmap(nutrients_path, dtype=np.float32, mode='r', shape=(meta['rows'], len(MACROS))),
+                        )
+                    except (OSError, ValueError) as e:
+                        logger.error(f"Error mapping the food matrix: {str(e)}")
+                        return FoodRecommender._mapped_arrays
+                    FoodRecommender._mapped = key
+                FoodRecommender._meta_mtime = mtime
+            return FoodRecommender._mapped_arrays
+
+    @staticmethod
+    def remaining(summary: Dict[str, Any]) -> Dict[str, float]:
+        """
+        What is left of today's goals, from NutritionCalculator.get_daily_nutrition_summary
+        """
+        return {macro: max(summary['goals'][macro] - summary['totals'][macro], 0) for macro in MACROS}
+
+    @staticmethod
+    def score(nutrients, remaining: Dict[str, float]) -> tuple:
+        """
+        Best portion (grams) of every food and how far that portion lands from
+        ``remaining`` (or a meal-sized share of it), in one vectorized pass over
+        the matrix. Lower scores fit better.
+        """
+        target = np.array([remaining[macro] for macro in MACROS], dtype=np.float32)
+        if target[0] > FoodRecommender.MEAL_CALORIES:
+            target *= np.float32(FoodRecommender.MEAL_CALORIES / target[0])
+        np.maximum(target, np.array(FoodRecommender.REMAINING_FLOOR, dtype=np.float32), out=target)
+        # Per gram, as a fraction of what is left of each macro
+        weights = np.float32(0.01) / target
+        nutrients = np.asarray(nutrients)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            # Row-wise sums as matrix-vector products, which BLAS does far faster
+            # than reductions along the short axis of a (foods, 4) array
+            fractions = nutrients @ weights
+            squares = np.einsum('ij,ij,j->i', nutrients, nutrients, weights * weights)
+            # Least squares portion for hitting every remaining macro exactly
+            grams = fractions / squares
+            np.clip(grams, FoodRecommender.MIN_PORTION, FoodRecommender.MAX_PORTION, out=grams)
+            # Sum of squared misses (grams * fraction - 1), expanded so no (foods, 4) temporary is needed
+            scores = grams * squares
+            scores -= 2 * fractions
+            scores *= grams
+            scores += len(MACROS)
+            calories_over = nutrients[:, 0] * weights[0]
+            calories_over *= grams
+            calories_over -= 1
+            np.maximum(calories_over, 0, out=calories_over)
+            calories_over *= calories_over
+            calories_over *= FoodRecommender.OVERSHOOT_WEIGHT ** 2 - 1
+            scores += calories_over
+        return grams, scores
+
+    @staticmethod
+    def recommend(remaining: Dict[str, float], limit: int = 5) -> List[Dict[str, Any]]:
+        """
+        The ``limit`` foods whose best portion comes closest to ``remaining``
+        calories, protein, carbs and fat
+        """
+        if np is None or remaining['calories'] < FoodRecommender.REMAINING_FLOOR[0]:
+            return []
+        matrix = FoodRecommender._matrix()
+        if matrix is None:
+            return []
+        ids, nutrients = matrix
+
+        grams, scores = FoodRecommender.score(nutrients, remaining)
+        # NaN scores (missing nutrients, zero-calorie foods) sort last; a few extra
+        # candidates cover foods deleted since the matrix was built
+        candidates = min(limit * 2, len(scores))
+        top = np.argpartition(scores, candidates - 1)[:candidates]
+        top = top[np.isfinite(scores[top])]
+        top = top[np.argsort(scores[top])]
+
+        foods = {
+            food.id: food for food in Food.query.filter(Food.id.in_(ids[top].tolist()))
+        } if len(top) else {}
+        recommendations = []
+        for row in top:
+            food = foods.get(int(ids[row]))
+            if food is None:
+                continue
+            portion = float(round(grams[row] / 5) * 5) or FoodRecommender.MIN_PORTION
+            recommendations.append({
+                'food_id': food.id,
+                'name': food.name,
+                'brand': food.brand,
+                'grams': portion,
+                **{macro: round(float(nutrients[row, i]) * portion / 100, 1) for i, macro in enumerate(MACROS)},
+                'score': round(max(float(scores[row]), 0.0), 4),
+            })
+            if len(recommendations) == limit:
+                break
+        return recommendations
@@ -0,0 +1,133 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import date
+from typing import Callable, Dict, Any
+
+from flask import render_template
+from markupsafe import Markup
+
+from models import User
+from services.data_version import data_changed
+from services.metrics import PerformanceMetrics
+
+class FragmentCache:
+    """
+    Per-process LRU cache of rendered template partials, bounded by a byte budget.
+    Entries are keyed on (fragment, user, date, data version), so a write that
+    bumps the user's data version makes stale fragments unreachable in every worker.
+    """
+
+    MAX_BYTES = int(os.environ.get('FRAGMENT_CACHE_MAX_BYTES', 8 * 1024 * 1024))
+
+    _entries: 'OrderedDict[tuple, tuple]' = OrderedDict()
+    _user_keys: Dict[str, set] = {}
+    _bytes = 0
+    _lock = threading.Lock()
+    _stats = {
+        'hits': 0,
+        'misses': 0,
+        'evictions': 0,
+        'invalidations': 0,
+        'render_seconds': 0.0,
+        'saved_seconds': 0.0,
+    }
+
+    @staticmethod
+    def get_or_render(name: str, user: User, target_date: date, template: str,
+                      context_fn: Callable[[], Dict[str, Any]]) -> Markup:
+        """
+        Return the cached fragment or render ``template`` with ``context_fn()``.
+        ``context_fn`` is only called on a miss, so the queries behind it are skipped on a hit.
+        """
+        key = (name, user.id, target_date.isoformat(), user.data_version or 0)
+
+        with FragmentCache._lock:
+            entry = FragmentCache._entries.get(key)
+            if entry is not None:
+                FragmentCache._entries.move_to_end(key)
+                FragmentCache._stats['hits'] += 1
+                FragmentCache._stats['saved_seconds'] += entry[1]
+                return entry[0]
+            FragmentCache._stats['misses'] += 1
+
+        start = time.perf_counter()
+        html = Markup(render_template(template, **context_fn()))
+        elapsed = time.perf_counter() - start
+        size = len(html.encode('utf-8'))
+
+        with FragmentCache._lock:
+            FragmentCache._stats['render_seconds'] += elapsed
+            if size <= FragmentCache.MAX_BYTES and key not in FragmentCache._entries:
+                FragmentCache._entries[key] = (html, elapsed, size)
+                FragmentCache._user_keys.setdefault(user.id, set()).add(key)
+                FragmentCache._bytes += size
+                while FragmentCache._bytes > FragmentCache.MAX_BYTES:
+                    old_key, old_entry = FragmentCache._entries.popitem(last=False)
+                    FragmentCache._forget(old_key, old_entry)
+                    FragmentCache._stats['evictions'] += 1
+
+        return html
+
+    @staticmethod
+    def invalidate_user(user_id: str) -> None:
+        """
+        Drop every fragment cached for ``user_id``
+        """
+        with FragmentCache._lock:
+            for key in list(FragmentCache._user_keys.get(user_id, ())):
+                entry = FragmentCache._entries.pop(key, None)
+                if entry is not None:
+                    FragmentCache._forget(key, entry)
+                    FragmentCache._stats['invalidations'] += 1
+
+    @staticmethod
+    def _forget(key: tuple, entry: tuple) -> None:
+        # Caller holds the lock and has already removed ``key`` from _entries
+        user_id = key[1]
+        FragmentCache._bytes -= entry[2]
+        keys = FragmentCache._user_keys.get(user_id)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del FragmentCache._user_keys[user_id]
+
+    @staticmethod
+    def stats() -> Dict[str, Any]:
+        with FragmentCache._lock:
+            stats = dict(FragmentCache._stats)
+            stats['entries'] = len(FragmentCache._entries)
+            stats['bytes'] = FragmentCache._bytes
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = round(stats['hits'] / lookups, 4) if lookups else 0.0
+        return stats
+
+def _on_data_changed(sender, user_ids=(), **kwargs):
+    for user_id in user_ids:
+        FragmentCache.invalidate_user(user_id)
+
+data_changed.connect(_on_data_changed)
+
+def _collect_metrics():
+    stats = FragmentCache.stats()
+    yield 'nutritracker_fragment_cache_hits_total', {}, stats['hits']
+    yield 'nutritracker_fragment_cache_misses_total', {}, stats['misses']
+    yield 'nutritracker_fragment_cache_evictions_total', {}, stats['evictions']
+    yield 'nutritracker_fragment_cache_saved_seconds_total', {}, stats['saved_seconds']
+    yield 'nutritracker_fragment_cache_render_seconds_total', {}, stats['render_seconds']
+    yield 'nutritracker_fragment_cache_bytes', {}, stats['bytes']
+
+PerformanceMetrics.describe('nutritracker_fragment_cache_hits_total', 'counter',
+                            'Fragment cache hits')
+PerformanceMetrics.describe('nutritracker_fragment_cache_misses_total', 'counter',
+                            'Fragment cache misses')
+PerformanceMetrics.describe('nutritracker_fragment_cache_evictions_total', 'counter',
+                            'Fragments evicted to stay within the byte budget')
+PerformanceMetrics.describe('nutritracker_fragment_cache_saved_seconds_total', 'counter',
+                            'Render time avoided by fragment cache hits')
+PerformanceMetrics.describe('nutritracker_fragment_cache_render_seconds_total', 'counter',
+                            'Time spent rendering fragments on cache misses')
+PerformanceMetrics.describe('nutritracker_fragment_cache_bytes', 'gauge',
+                            'Bytes held by the fragment cache of each worker process')
+PerformanceMetrics.register_collector(_collect_metrics)
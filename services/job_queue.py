@@ -0,0 +1,314 @@
+import logging
+import os
+import socket
+import threading
+import time
+import traceback
+from datetime import datetime, timedelta
+from typing import Dict, Any, Optional
+
+from flask import Flask
+from sqlalchemy import and_, delete, func, or_, select, update
+from sqlalchemy.exc import IntegrityError
+
+from models import Job
+from services.metrics import PerformanceMetrics, DURATION_BUCKETS
+
+logger = logging.getLogger(__name__)
+
+class JobQueue:
+    """
+    Background jobs stored in the jobs table, so no broker is needed.
+
+    Handlers are registered with ``@JobQueue.task('name')`` and receive the job
+    payload as keyword arguments. Delivery is at-least-once: a job whose worker
+    dies is retried once its visibility timeout expires, so handlers must be
+    idempotent. Failed attempts are retried with exponential backoff up to
+    ``max_attempts``.
+
+    Jobs are processed by ``flask jobs work`` processes and/or by worker threads
+    inside the web processes (JOB_WORKER_THREADS). Tasks registered with ``every``
+    are enqueued by the workers once per interval.
+    """
+
+    DEFAULT_MAX_ATTEMPTS = 5
+    DEFAULT_TIMEOUT = 300
+    RETRY_BASE_SECONDS = 10
+    POLL_INTERVAL = 2.0
+    # Polling slows down to this while the queue stays empty
+    MAX_POLL_INTERVAL = 30.0
+    # Finished jobs are deleted after this many days by the jobs.purge task
+    RETENTION_DAYS = int(os.environ.get('JOB_RETENTION_DAYS', 7))
+    PERIODIC_CHECK_INTERVAL = 60.0
+
+    # name -> (handler, max_attempts, timeout seconds)
+    _tasks: Dict[str, tuple] = {}
+    # name -> interval seconds
+    _periodic: Dict[str, int] = {}
+    _threads_started_pid = None
+    _threads_lock = threading.Lock()
+
+    @staticmethod
+    def task(name: str, max_attempts: int = DEFAULT_MAX_ATTEMPTS, timeout: int = DEFAULT_TIMEOUT,
+             every: Optional[int] = None):
+        """
+        Register the decorated function as the handler of jobs called ``name``,
+        run without payload every ``every`` seconds if given
+        """
+        def decorator(f):
+            JobQueue._tasks[name] = (f, max_attempts, timeout)
+            if every:
+                JobQueue._periodic[name] = every
+            return f
+
+        return decorator
+
+    @staticmethod
+    def enqueue(name: str, payload: Optional[Dict[str, Any]] = None, idempotency_key: Optional[str] = None,
+                delay: float = 0) -> Job:
+        """
+        Add a job in the current transaction; it becomes visible to workers when
+        the caller commits. With ``idempotency_key`` an existing job with that key
+        is returned instead of adding another.
+        """
+        from app import db
+
+        if name not in JobQueue._tasks:
+            raise ValueError(f"Unknown job {name}")
+
+        if idempotency_key is not None:
+            existing = Job.query.filter_by(idempotency_key=idempotency_key).first()
+            if existing is not None:
+                return existing
+
+        job = Job(
+            name=name,
+            payload=payload or {},
+            idempotency_key=idempotency_key,
+            max_attempts=JobQueue._tasks[name][1],
+            run_at=datetime.now() + timedelta(seconds=delay)
+        )
+        if idempotency_key is None:
+            db.session.add(job)
+            return job
+
+        # Another request may have enqueued the same key since the lookup
+        try:
+            with db.session.begin_nested():
+                db.session.add(job)
+        except IntegrityError:
+            return Job.query.filter_by(idempotency_key=idempotency_key).one()
+        return job
+
+    @staticmethod
+    def enqueue_periodic() -> None:
+        """
+        Enqueue the current run of every periodic task. Keyed by interval slot, so
+        all workers together enqueue each run once.
+        """
+        from app import db
+
+        now = time.time()
+        for name, interval in JobQueue._periodic.items():
+            JobQueue.enqueue(name, idempotency_key=f"{name}@{int(now // interval)}")
+        db.session.commit()
+
+    @staticmethod
+    def _due(now: datetime):
+        return and_(
+            Job.run_at <= now,
+            or_(
+                Job.status == 'queued',
+                and_(Job.status == 'running', Job.locked_until < now, Job.attempts < Job.max_attempts)
+            )
+        )
+
+    @staticmethod
+    def claim(worker_id: str) -> Optional[Job]:
+        """
+        Lease the next due job to ``worker_id`` and commit, or return None
+        """
+        from app import db
+
+        now = datetime.now()
+        # A job whose worker died during its last attempt (OOM, crash, timeout) is not run again
+        abandoned = db.session.execute(
+            update(Job).where(
+                Job.status == 'running', Job.locked_until < now, Job.attempts >= Job.max_attempts
+            ).values(
+                status='failed',
+                finished_at=now,
+                locked_until=None,
+                last_error='Lease expired: the worker running the last attempt died or timed out'
+            ),
+            execution_options={'synchronize_session': False}
+        ).rowcount
+        if abandoned:
+            logger.error(f"Marked {abandoned} jobs with expired leases and no attempts left as failed")
+
+        # SKIP LOCKED keeps PostgreSQL workers from queueing up behind each other;
+        # the conditional UPDATE below is what makes the claim safe everywhere
+        candidates = db.session.execute(
+            select(Job.id, Job.name).where(JobQueue._due(now))
+            .order_by(Job.run_at, Job.id).limit(10)
+            .with_for_update(skip_locked=True)
+        ).all()
+
+        for job_id, name in candidates:
+            timeout = JobQueue._tasks.get(name, (None, None, JobQueue.DEFAULT_TIMEOUT))[2]
+            claimed = db.session.execute(
+                update(Job).where(Job.id == job_id, JobQueue._due(now)).values(
+                    status='running',
+                    attempts=Job.attempts + 1,
+                    locked_by=worker_id,
+                    locked_until=now + timedelta(seconds=timeout)
+                ),
+                execution_options={'synchronize_session': False}
+            ).rowcount
+            if claimed:
+                db.session.commit()
+                return db.session.get(Job, job_id, populate_existing=True)
+
+        db.session.commit()
+        return None
+
+    @staticmethod
+    def run(job: Job, worker_id: str) -> bool:
+        """
+        Run a claimed job and record the outcome. Returns whether it succeeded.
+        """
+        from app import db
+
+        job_id, name, attempts, max_attempts = job.id, job.name, job.attempts, job.max_attempts
+        handler = JobQueue._tasks.get(name, (None,))[0]
+        start = time.perf_counter()
+        error = None
+        try:
+            if handler is None:
+                raise LookupError(f"No handler registered for job {name}")
+            handler(**job.payload)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            error = traceback.format_exc()
+        elapsed = time.perf_counter() - start
+
+        now = datetime.now()
+        if error is None:
+            values = {'status': 'done', 'finished_at': now, 'locked_until': None, 'last_error': None}
+            outcome = 'done'
+        elif attempts >= max_attempts:
+            values = {'status': 'failed', 'finished_at': now, 'locked_until': None, 'last_error': error}
+            outcome = 'failed'
+        else:
+            backoff = JobQueue.RETRY_BASE_SECONDS * 2 ** (attempts - 1)
+            values = {'status': 'queued', 'run_at': now + timedelta(seconds=backoff),
+                      'locked_until': None, 'last_error': error}
+            outcome = 'retry'
+
+        # Only record the outcome if our lease was not taken over meanwhile
+        db.session.execute(
+            update(Job).where(Job.id == job_id, Job.locked_by == worker_id, Job.status == 'running')
+            .values(**values),
+            execution_options={'synchronize_session': False}
+        )
+        db.session.commit()
+
+        PerformanceMetrics.observe('nutritracker_job_duration_seconds', elapsed, job=name)
+        PerformanceMetrics.inc('nutritracker_jobs_total', job=name, outcome=outcome)
+        if error is None:
+            logger.info(f"Job {job_id} ({name}) done in {elapsed:.3f}s")
+        else:
+            logger.error(f"Job {job_id} ({name}) attempt {attempts}/{max_attempts} failed: {error}")
+        return error is None
+
+    @staticmethod
+    def work(app: Flask, worker_id: Optional[str] = None, stop: Optional[threading.Event] = None,
+             once: bool = False, poll_interval: float = POLL_INTERVAL) -> int:
+        """
+        Process jobs until ``stop`` is set, or until the queue is empty with ``once``.
+        An idle worker doubles its wait between polls up to MAX_POLL_INTERVAL, so
+        web processes with worker threads rarely query an empty queue.
+        Returns the number of jobs processed.
+        """
+        worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}-{threading.get_ident()}"
+        stop = stop or threading.Event()
+        processed = 0
+        periodic_checked = 0.0
+        idle_wait = poll_interval
+        while not stop.is_set():
+            try:
+                with app.app_context():
+                    if JobQueue._periodic and time.monotonic() - periodic_checked >= JobQueue.PERIODIC_CHECK_INTERVAL:
+                        periodic_checked = time.monotonic()
+                        JobQueue.enqueue_periodic()
+                    job = JobQueue.claim(worker_id)
+                    if job is not None:
+                        JobQueue.run(job, worker_id)
+                        processed += 1
+            except Exception as e:
+                logger.error(f"Job worker {worker_id} error: {str(e)}")
+                job = None
+
+            if time.perf_counter() - PerformanceMetrics._last_flush > PerformanceMetrics.FLUSH_INTERVAL:
+                PerformanceMetrics.flush()
+            if job is None:
+                if once:
+                    break
+                stop.wait(idle_wait)
+                idle_wait = min(idle_wait * 2, max(poll_interval, JobQueue.MAX_POLL_INTERVAL))
+            else:
+                idle_wait = poll_interval
+        return processed
+
+    @staticmethod
+    def init_app(app: Flask) -> None:
+        """
+        Start JOB_WORKER_THREADS worker threads in each serving process on its first request,
+        so the web deployment processes jobs without a separate worker process
+        """
+        threads = app.config.get('JOB_WORKER_THREADS', 0)
+        if threads <= 0:
+            return
+
+        @app.before_request
+        def start_job_workers():
+            # Per pid: threads do not survive the fork into gunicorn workers
+            if JobQueue._threads_started_pid == os.getpid():
+                return
+            with JobQueue._threads_lock:
+                if JobQueue._threads_started_pid == os.getpid():
+                    return
+                JobQueue._threads_started_pid = os.getpid()
+                for n in range(threads):
+                    threading.Thread(target=JobQueue.work, args=(app,), name=f'job-worker-{n}',
+                                     daemon=True).start()
+                logger.info(f"Started {threads} job worker threads in process {os.getpid()}")
+
+    @staticmethod
+    def stats() -> Dict[str, int]:
+        from app import db
+
+        return dict(db.session.execute(
+            select(Job.status, func.count()).group_by(Job.status)
+        ).all())
+
+    @staticmethod
+    def purge(older_than_days: int = RETENTION_DAYS) -> int:
+        """
+        Delete finished jobs older than ``older_than_days``; failed jobs are kept for inspection
+        """
+        from app import db
+
+        deleted = db.session.execute(
+            delete(Job).where(Job.status == 'done',
+                              Job.finished_at < datetime.now() - timedelta(days=older_than_days)),
+            execution_options={'synchronize_session': False}
+        ).rowcount
+        db.session.commit()
+        return deleted
+
+PerformanceMetrics.describe('nutritracker_jobs_total', 'counter',
+                            'Background job attempts by outcome (done, retry, failed)')
+PerformanceMetrics.describe('nutritracker_job_duration_seconds', 'histogram',
+                            'Background job run time', DURATION_BUCKETS)
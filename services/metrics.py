@@ -0,0 +1,349 @@
+import fcntl
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Tuple
+
+from flask import Flask, g, has_request_context, request, before_render_template, template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+DURATION_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 250)
+
+class PerformanceMetrics:
+    """
+    Per-request performance metrics exported in the Prometheus text format.
+    Every process periodically writes its own snapshot to METRICS_DIR and the
+    /metrics endpoint sums the snapshots of all live gunicorn workers. The
+    counters and histograms of workers that exited are folded into an archive
+    file, so totals never go down; their gauges are dropped. Gauges are
+    exported per process, with a pid label.
+    """
+
+    METRICS_DIR = Path(os.environ.get('METRICS_DIR') or
+                       os.path.join(tempfile.gettempdir(), 'nutritracker-metrics'))
+    FLUSH_INTERVAL = float(os.environ.get('METRICS_FLUSH_INTERVAL', 5))
+    ARCHIVE = 'metrics-archive.json'
+
+    # name -> (type, help, buckets)
+    _definitions: Dict[str, Tuple[str, str, tuple]] = {}
+    # (name, labels) -> [per-bucket counts..., sum, count]
+    _histograms: Dict[Tuple[str, tuple], list] = {}
+    # (name, labels) -> value
+    _counters: Dict[Tuple[str, tuple], float] = {}
+    _collectors: list = []
+    _lock = threading.Lock()
+    _last_flush = 0.0
+    _snapshot_file = None
+    _snapshot_pid = None
+
+    @staticmethod
+    def describe(name: str, kind: str, help_text: str, buckets: tuple = ()) -> None:
+        PerformanceMetrics._definitions[name] = (kind, help_text, buckets)
+
+    @staticmethod
+    def observe(name: str, value: float, **labels) -> None:
+        """
+        Record ``value`` in histogram ``name``
+        """
+        buckets = PerformanceMetrics._definitions[name][2]
+        key = (name, tuple(sorted(labels.items())))
+        with PerformanceMetrics._lock:
+            series = PerformanceMetrics._histograms.get(key)
+            if series is None:
+                series = PerformanceMetrics._histograms[key] = [0] * (len(buckets) + 3)
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            else:
+                series[len(buckets)] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    @staticmethod
+    def inc(name: str, value: float = 1, **labels) -> None:
+        """
+        Increment counter ``name``
+        """
+        key = (name, tuple(sorted(labels.items())))
+        with PerformanceMetrics._lock:
+            PerformanceMetrics._counters[key] = PerformanceMetrics._counters.get(key, 0) + value
+
+    @staticmethod
+    def register_collector(collector: Callable[[], Iterable[Tuple[str, Dict[str, str], float]]]) -> None:
+        """
+        Register a callable returning (name, labels, value) samples taken at snapshot time,
+        for components that already keep their own per-process counters
+        """
+        PerformanceMetrics._collectors.append(collector)
+
+    @staticmethod
+    def add_to_request(field: str, value: float) -> None:
+        """
+        Accumulate ``value`` into the current request's measurements, if any
+        """
+        if has_request_context():
+            timings = g.get('_perf_metrics')
+            if timings is not None:
+                timings[field] = timings.get(field, 0) + value
+
+    @staticmethod
+    @contextmanager
+    def timed(field: str):
+        """
+        Time the enclosed block into the current request's ``field``
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            PerformanceMetrics.add_to_request(field, time.perf_counter() - start)
+
+    @staticmethod
+    def init_app(app: Flask) -> None:
+        """
+        Install the request hooks that feed the per-route histograms
+        """
+        @app.before_request
+        def start_request_metrics():
+            g._perf_metrics = {'start': time.perf_counter()}
+
+        @app.after_request
+        def record_request_metrics(response):
+            timings = g.pop('_perf_metrics', None)
+            if timings is None:
+                return response
+
+            endpoint = request.endpoint or 'unmatched'
+            PerformanceMetrics.observe('nutritracker_request_duration_seconds',
+                                       time.perf_counter() - timings['start'], endpoint=endpoint)
+            PerformanceMetrics.observe('nutritracker_request_sql_queries',
+                                       timings.get('sql_queries', 0), endpoint=endpoint)
+            PerformanceMetrics.observe('nutritracker_request_sql_duration_seconds',
+                                       timings.get('sql_seconds', 0), endpoint=endpoint)
+            PerformanceMetrics.observe('nutritracker_request_off_api_duration_seconds',
+                                       timings.get('off_api_seconds', 0), endpoint=endpoint)
+            PerformanceMetrics.observe('nutritracker_request_template_duration_seconds',
+                                       timings.get('template_seconds', 0), endpoint=endpoint)
+            PerformanceMetrics.inc('nutritracker_requests_total',
+                                   endpoint=endpoint, status=str(response.status_code))
+
+            if time.perf_counter() - PerformanceMetrics._last_flush > PerformanceMetrics.FLUSH_INTERVAL:
+                PerformanceMetrics.flush()
+            return response
+
+        before_render_template.connect(_on_before_render, app)
+        template_rendered.connect(_on_template_rendered, app)
+
+    @staticmethod
+    def _snapshot_path() -> Path:
+        # Resolved per pid so forked workers never share a snapshot file. Locked because
+        # job worker threads flush concurrently with requests, and two files for one
+        # pid would both be summed by render()
+        with PerformanceMetrics._lock:
+            if PerformanceMetrics._snapshot_pid != os.getpid():
+                PerformanceMetrics._snapshot_file = (
+                    PerformanceMetrics.METRICS_DIR / f"metrics-{os.getpid()}-{uuid.uuid4().hex[:8]}.json"
+                )
+                PerformanceMetrics._snapshot_pid = os.getpid()
+            return PerformanceMetrics._snapshot_file
+
+    @staticmethod
+    def flush() -> None:
+        """
+        Atomically write this process's metrics snapshot for the other workers to read
+        """
+        with PerformanceMetrics._lock:
+            snapshot = {
+                'histograms': [[name, labels, list(series)]
+                               for (name, labels), series in PerformanceMetrics._histograms.items()],
+                'counters': [[name, labels, value]
+                             for (name, labels), value in PerformanceMetrics._counters.items()],
+                'gauges': [],
+            }
+        for collector in PerformanceMetrics._collectors:
+            try:
+                for name, labels, value in collector():
+                    kind = PerformanceMetrics._definitions.get(name, ('counter',))[0]
+                    snapshot['gauges' if kind == 'gauge' else 'counters'].append([name, sorted(labels.items()), value])
+            except Exception as e:
+                logger.error(f"Error collecting metrics: {str(e)}")
+
+        path = PerformanceMetrics._snapshot_path()
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_suffix('.tmp')
+            tmp_path.write_text(json.dumps(snapshot))
+            os.replace(tmp_path, path)
+            PerformanceMetrics._last_flush = time.perf_counter()
+        except OSError as e:
+            logger.error(f"Error writing metrics snapshot {path}: {str(e)}")
+
+    @staticmethod
+    def _is_stale(path: Path) -> bool:
+        """
+        Whether snapshot ``path`` belongs to a process that has exited, e.g. a
+        gunicorn worker that was restarted
+        """
+        try:
+            pid = int(path.name.split('-')[1])
+        except (IndexError, ValueError):
+            return False
+        if pid == os.getpid():
+            # An earlier process that had this pid
+            return path != PerformanceMetrics._snapshot_path()
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return True
+        except PermissionError:
+            pass
+        return False
+
+    @staticmethod
+    def _read_snapshot(path: Path) -> Dict[str, list]:
+        try:
+            return json.loads(path.read_text())
+        except (OSError, ValueError):
+            return {}
+
+    @staticmethod
+    def _archive(path: Path) -> None:
+        """
+        Fold the counters and histograms of the exited process's snapshot ``path``
+        into the archive and delete the snapshot
+        """
+        with open(PerformanceMetrics.METRICS_DIR / 'archive.lock', 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            # Another /metrics request may have archived it while this one waited
+            if not path.exists():
+                return
+            histograms: Dict[Tuple[str, tuple], list] = {}
+            counters: Dict[Tuple[str, tuple], float] = {}
+            archive_path = PerformanceMetrics.METRICS_DIR / PerformanceMetrics.ARCHIVE
+            for snapshot in (PerformanceMetrics._read_snapshot(archive_path), PerformanceMetrics._read_snapshot(path)):
+                _merge(snapshot, histograms, counters)
+            tmp_path = archive_path.with_suffix('.tmp')
+            tmp_path.write_text(json.dumps({
+                'histograms': [[name, labels, series] for (name, labels), series in histograms.items()],
+                'counters': [[name, labels, value] for (name, labels), value in counters.items()],
+            }))
+            os.replace(tmp_path, archive_path)
+            path.unlink()
+
+    @staticmethod
+    def render() -> str:
+        """
+        Merge the snapshots of all processes into Prometheus text exposition format
+        """
+        PerformanceMetrics.flush()
+
+        histograms: Dict[Tuple[str, tuple], list] = {}
+        counters: Dict[Tuple[str, tuple], float] = {}
+        gauges: Dict[Tuple[str, tuple], float] = {}
+        for path in PerformanceMetrics.METRICS_DIR.glob('metrics-*.json'):
+            if path.name == PerformanceMetrics.ARCHIVE:
+                continue
+            if PerformanceMetrics._is_stale(path):
+                try:
+                    PerformanceMetrics._archive(path)
+                except OSError as e:
+                    logger.error(f"Error archiving metrics snapshot {path}: {str(e)}")
+                continue
+            snapshot = PerformanceMetrics._read_snapshot(path)
+            _merge(snapshot, histograms, counters)
+            pid = path.name.split('-')[1]
+            for name, labels, value in snapshot.get('gauges', []):
+                gauges[(name, tuple(tuple(pair) for pair in labels) + (('pid', pid),))] = value
+        # Read after archiving, so a snapshot is counted either live or archived
+        _merge(PerformanceMetrics._read_snapshot(PerformanceMetrics.METRICS_DIR / PerformanceMetrics.ARCHIVE),
+               histograms, counters)
+
+        lines = []
+        for name, (kind, help_text, buckets) in sorted(PerformanceMetrics._definitions.items()):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            if kind == 'histogram':
+                for (series_name, labels), series in sorted(histograms.items()):
+                    if series_name != name:
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(list(buckets) + ['+Inf'], series):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{_format_labels(labels + (('le', bound),))} {cumulative}")
+                    lines.append(f"{name}_sum{_format_labels(labels)} {series[-2]}")
+                    lines.append(f"{name}_count{_format_labels(labels)} {series[-1]}")
+            else:
+                for (series_name, labels), value in sorted((gauges if kind == 'gauge' else counters).items()):
+                    if series_name == name:
+                        lines.append(f"{name}{_format_labels(labels)} {value}")
+        return '\n'.join(lines) + '\n'
+
+def _merge(snapshot: Dict[str, list], histograms: Dict[Tuple[str, tuple], list],
+           counters: Dict[Tuple[str, tuple], float]) -> None:
+    """
+    Add the histograms and counters of ``snapshot`` to ``histograms`` and ``counters``
+    """
+    for name, labels, series in snapshot.get('histograms', []):
+        key = (name, tuple(tuple(pair) for pair in labels))
+        merged = histograms.setdefault(key, [0] * len(series))
+        if len(merged) == len(series):
+            histograms[key] = [a + b for a, b in zip(merged, series)]
+    for name, labels, value in snapshot.get('counters', []):
+        key = (name, tuple(tuple(pair) for pair in labels))
+        counters[key] = counters.get(key, 0) + value
+
+def _format_labels(labels: tuple) -> str:
+    if not labels:
+        return ''
+    pairs = ','.join(
+        f'{key}="{str(value).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+        for key, value in labels
+    )
+    return '{' + pairs + '}'
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('_perf_query_start', []).append(time.perf_counter())
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get('_perf_query_start')
+    if starts:
+        PerformanceMetrics.add_to_request('sql_seconds', time.perf_counter() - starts.pop())
+        PerformanceMetrics.add_to_request('sql_queries', 1)
+
+def _on_before_render(sender, template, context, **extra):
+    if has_request_context():
+        g.setdefault('_perf_template_starts', []).append(time.perf_counter())
+
+def _on_template_rendered(sender, template, context, **extra):
+    starts = g.get('_perf_template_starts') if has_request_context() else None
+    if starts:
+        elapsed = time.perf_counter() - starts.pop()
+        # Only count the outermost render so nested fragments are not counted twice
+        if not starts:
+            PerformanceMetrics.add_to_request('template_seconds', elapsed)
+
+PerformanceMetrics.describe('nutritracker_request_duration_seconds', 'histogram',
+                            'Request wall time per route', DURATION_BUCKETS)
+PerformanceMetrics.describe('nutritracker_request_sql_queries', 'histogram',
+                            'SQL statements executed per request', COUNT_BUCKETS)
+PerformanceMetrics.describe('nutritracker_request_sql_duration_seconds', 'histogram',
+                            'Time spent executing SQL per request', DURATION_BUCKETS)
+PerformanceMetrics.describe('nutritracker_request_off_api_duration_seconds', 'histogram',
+                            'Time spent in Open Food Facts API calls per request', DURATION_BUCKETS)
+PerformanceMetrics.describe('nutritracker_request_template_duration_seconds', 'histogram',
+                            'Template render time per request', DURATION_BUCKETS)
+PerformanceMetrics.describe('nutritracker_requests_total', 'counter',
+                            'Requests handled per route and status code')
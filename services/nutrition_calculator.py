@@ -45,6 +45,62 @@ class NutritionCalculator:
         multiplier = activity_multipliers.get(user.activity_level, 1.375)
         return bmr * multiplier
     
+    @staticmethod
+    def compute_targets(user: User) -> Dict[str, float]:
+        """
+        Calculate TDEE, calorie goal and macro goals from the profile and latest weight
+        """
+        # Get current weight and calculate targets
+        current_weight = NutritionCalculator.get_latest_weight(user)
+        tdee = NutritionCalculator.calculate_tdee(user, current_weight)
+        
+        # Adjust calorie goal based on user's goal
+        goal_adjustments = {
+            'lose_weight': -500,  # 500 calorie deficit
+            'maintain': 0,
+            'gain_weight': 300   # 300 calorie surplus
+        }
+        
+        calorie_goal = tdee + goal_adjustments.get(user.goal, 0)
+        
+        # Calculate macro targets (protein: 25%, carbs: 45%, fat: 30%)
+        return {
+            'tdee': tdee,
+            'calories': calorie_goal,
+            'protein': (calorie_goal * 0.25) / 4,  # 4 calories per gram
+            'carbs': (calorie_goal * 0.45) / 4,    # 4 calories per gram
+            'fat': (calorie_goal * 0.30) / 9       # 9 calories per gram
+        }
+    
+    @staticmethod
+    def refresh_targets(user: User) -> Dict[str, float]:
+        """
+        Recompute and store the user's targets. Call whenever the profile or weight
+        entries change; the caller commits.
+        """
+        targets = NutritionCalculator.compute_targets(user)
+        user.tdee_target = targets['tdee']
+        user.calorie_target = targets['calories']
+        user.protein_target = targets['protein']
+        user.carbs_target = targets['carbs']
+        user.fat_target = targets['fat']
+        return targets
+    
+    @staticmethod
+    def get_targets(user: User) -> Dict[str, float]:
+        """
+        The user's stored targets, computed on the fly for users who have none yet
+        """
+        if user.calorie_target is None:
+            return NutritionCalculator.compute_targets(user)
+        return {
+            'tdee': user.tdee_target,
+            'calories': user.calorie_target,
+            'protein': user.protein_target,
+            'carbs': user.carbs_target,
+            'fat': user.fat_target
+        }
+    
     @staticmethod
     def get_daily_nutrition_summary(user: User, target_date: date = None) -> Dict[str, Any]:
         """
@@ -69,23 +125,11 @@ class NutritionCalculator:
         total_sugar = sum(log.sugar or 0 for log in food_logs)
         total_sodium = sum(log.sodium or 0 for log in food_logs)
         
-        # Get current weight and calculate targets
-        current_weight = NutritionCalculator.get_latest_weight(user)
-        tdee = NutritionCalculator.calculate_tdee(user, current_weight)
-        
-        # Adjust calorie goal based on user's goal
-        goal_adjustments = {
-            'lose_weight': -500,  # 500 calorie deficit
-            'maintain': 0,
-            'gain_weight': 300   # 300 calorie surplus
-        }
-        
-        calorie_goal = tdee + goal_adjustments.get(user.goal, 0)
-        
-        # Calculate macro targets (protein: 25%, carbs: 45%, fat: 30%)
-        protein_goal = (calorie_goal * 0.25) / 4  # 4 calories per gram
-        carbs_goal = (calorie_goal * 0.45) / 4    # 4 calories per gram
-        fat_goal = (calorie_goal * 0.30) / 9      # 9 calories per gram
+        targets = NutritionCalculator.get_targets(user)
+        calorie_goal = targets['calories']
+        protein_goal = targets['protein']
+        carbs_goal = targets['carbs']
+        fat_goal = targets['fat']
         
         return {
             'date': target_date,
@@ -121,20 +165,30 @@ class NutritionCalculator:
         from app import db
         
         meal_types = ['breakfast', 'lunch', 'dinner', 'snack']
-        breakdown = {}
-        
-        for meal_type in meal_types:
-            logs = db.session.query(FoodLog).filter_by(
-                user_id=user.id,
-                log_date=target_date,
-                meal_type=meal_type
-            ).all()
-            
+        breakdown = {
+            meal_type: {'calories': 0, 'protein': 0, 'carbs': 0, 'fat': 0}
+            for meal_type in meal_types
+        }
+        
+        # One grouped query instead of one query per meal type
+        rows = db.session.query(
+            FoodLog.meal_type,
+            func.coalesce(func.sum(FoodLog.calories), 0),
+            func.coalesce(func.sum(FoodLog.protein), 0),
+            func.coalesce(func.sum(FoodLog.carbs), 0),
+            func.coalesce(func.sum(FoodLog.fat), 0)
+        ).filter(
+            FoodLog.user_id == user.id,
+            FoodLog.log_date == target_date,
+            FoodLog.meal_type.in_(meal_types)
+        ).group_by(FoodLog.meal_type).all()
+        
+        for meal_type, calories, protein, carbs, fat in rows:
             breakdown[meal_type] = {
-                'calories': sum(log.calories or 0 for log in logs),
-                'protein': sum(log.protein or 0 for log in logs),
-                'carbs': sum(log.carbs or 0 for log in logs),
-                'fat': sum(log.fat or 0 for log in logs)
+                'calories': calories,
+                'protein': protein,
+                'carbs': carbs,
+                'fat': fat
             }
         
         return breakdown
@@ -157,15 +211,36 @@ class NutritionCalculator:
         """
         Get weight progress over specified number of days
         """
+        return NutritionCalculator.get_weight_progress_for_periods(user, [days])[days]
+    
+    @staticmethod
+    def get_weight_progress_for_periods(user: User, periods: list) -> Dict[int, Dict[str, Any]]:
+        """
+        Get weight progress for several day ranges with a single query
+        """
         from app import db
         
-        start_date = date.today() - timedelta(days=days)
+        today = date.today()
+        start_date = today - timedelta(days=max(periods))
         
         weight_entries = db.session.query(WeightEntry).filter(
             WeightEntry.user_id == user.id,
             WeightEntry.entry_date >= start_date
         ).order_by(WeightEntry.entry_date).all()
         
+        return {
+            days: NutritionCalculator._summarize_weight_entries([
+                entry for entry in weight_entries
+                if entry.entry_date >= today - timedelta(days=days)
+            ])
+            for days in periods
+        }
+    
+    @staticmethod
+    def _summarize_weight_entries(weight_entries: list) -> Dict[str, Any]:
+        """
+        Build the progress summary for date-ordered weight entries
+        """
         if not weight_entries:
             return {'entries': [], 'trend': 'no_data', 'change': 0}
         
@@ -198,15 +273,19 @@ class NutritionCalculator:
         }
     
     @staticmethod
-    def get_fitness_recommendations(user: User) -> list:
+    def get_fitness_recommendations(user: User, recent_nutrition: Dict[str, Any] = None,
+                                    weight_progress: Dict[str, Any] = None) -> list:
         """
-        Generate fitness recommendations based on user data
+        Generate fitness recommendations based on user data.
+        Callers that already hold today's summary or the 30-day weight progress can pass them in.
         """
         recommendations = []
         
         # Get recent nutrition data
-        recent_nutrition = NutritionCalculator.get_daily_nutrition_summary(user)
-        weight_progress = NutritionCalculator.get_weight_progress(user)
+        if recent_nutrition is None:
+            recent_nutrition = NutritionCalculator.get_daily_nutrition_summary(user)
+        if weight_progress is None:
+            weight_progress = NutritionCalculator.get_weight_progress(user)
         
         # Calorie-based recommendations
         calories_percentage = recent_nutrition['percentages']['calories']
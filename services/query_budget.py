@@ -0,0 +1,111 @@
+import logging
+import re
+from collections import Counter
+from contextvars import ContextVar
+from functools import wraps
+from typing import List, Optional
+
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+_active_budgets: ContextVar[tuple] = ContextVar('active_query_budgets', default=())
+
+_IN_LIST = re.compile(r'\bIN\s*\((?:\s*[?%:$][\w()]*\s*,?)+\)', re.IGNORECASE)
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_WHITESPACE = re.compile(r'\s+')
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+class QueryBudget:
+    """
+    Count the SQL statements executed while active and flag budget overruns
+    and N+1 patterns (the same statement shape executed over and over).
+
+    Usable directly in tests or scripts:
+
+        with QueryBudget(max_queries=5, label='dashboard') as budget:
+            client.get('/dashboard')
+        assert budget.count <= 5
+    """
+
+    DEFAULT_MAX_REPEATS = 3
+
+    def __init__(self, max_queries: Optional[int] = None, max_repeats: int = DEFAULT_MAX_REPEATS,
+                 label: str = '', mode: str = 'raise'):
+        self.max_queries = max_queries
+        self.max_repeats = max_repeats
+        self.label = label
+        self.mode = mode
+        self.count = 0
+        self.shapes = Counter()
+        self._token = None
+
+    @staticmethod
+    def statement_shape(statement: str) -> str:
+        """
+        Normalize a statement so executions differing only in parameters compare equal
+        """
+        shape = _IN_LIST.sub('IN (?)', statement)
+        shape = _LITERALS.sub('?', shape)
+        return _WHITESPACE.sub(' ', shape).strip()
+
+    def record(self, statement: str) -> None:
+        self.count += 1
+        self.shapes[QueryBudget.statement_shape(statement)] += 1
+
+    def violations(self) -> List[str]:
+        problems = []
+        if self.max_queries is not None and self.count > self.max_queries:
+            problems.append(f"{self.count} queries exceed the budget of {self.max_queries}")
+        for shape, count in self.shapes.most_common():
+            if count <= self.max_repeats:
+                break
+            problems.append(f"possible N+1: statement executed {count} times: {shape[:200]}")
+        return problems
+
+    def check(self) -> None:
+        problems = self.violations()
+        if not problems or self.mode == 'off':
+            return
+        message = f"Query budget violated{f' in {self.label}' if self.label else ''}: " + '; '.join(problems)
+        if self.mode == 'raise':
+            raise QueryBudgetExceeded(message)
+        logger.warning(message)
+
+    def __enter__(self):
+        self._token = _active_budgets.set(_active_budgets.get() + (self,))
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _active_budgets.reset(self._token)
+        if exc_type is None:
+            self.check()
+        return False
+
+def query_budget(max_queries: int, max_repeats: int = QueryBudget.DEFAULT_MAX_REPEATS):
+    """
+    Declare the statement budget of a view. Enforced according to the
+    QUERY_BUDGET_MODE config value: 'raise', 'warn' or 'off'.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            mode = current_app.config.get('QUERY_BUDGET_MODE', 'off')
+            if mode == 'off':
+                return f(*args, **kwargs)
+            with QueryBudget(max_queries, max_repeats, label=f.__name__, mode=mode):
+                return f(*args, **kwargs)
+
+        decorated_function.query_budget = max_queries
+        return decorated_function
+
+    return decorator
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _count_statement(conn, cursor, statement, parameters, context, executemany):
+    for budget in _active_budgets.get():
+        budget.record(statement)
@@ -0,0 +1,145 @@
+import logging
+from typing import Callable, List, Tuple
+
+from sqlalchemy import Column, Date, cast, func, inspect, literal, text, update
+from sqlalchemy.schema import CreateIndex
+
+from models import Food, FoodLog, User
+from services.food_log_partitions import FoodLogPartitions
+
+logger = logging.getLogger(__name__)
+
+# Arbitrary key serializing schema upgrades across instances starting at once
+_ADVISORY_LOCK_KEY = 727002
+
+class SchemaUpgrade:
+    """
+    Brings an existing database up to the current models. ``db.create_all()``
+    creates missing tables but never alters existing ones, so columns and
+    constraints added to existing tables are applied here, by ``flask upgrade-db``
+    on every deploy before the web processes start.
+
+    Steps are registered with ``@SchemaUpgrade.step('name')``, run in registration
+    order and must be idempotent: they inspect the database and do nothing when
+    it is already up to date.
+    """
+
+    # (name, function)
+    _steps: List[Tuple[str, Callable]] = []
+
+    @staticmethod
+    def step(name: str):
+        """
+        Register the decorated function, called with a connection, as upgrade step ``name``
+        """
+        def decorator(f):
+            SchemaUpgrade._steps.append((name, f))
+            return f
+
+        return decorator
+
+    @staticmethod
+    def add_column(connection, column: Column) -> bool:
+        """
+        Add ``column`` of a model to its table unless it exists. NOT NULL columns are
+        added with their scalar default as the database default, so existing rows
+        get a value. Returns whether the column was added.
+        """
+        table = column.table.name
+        if column.name in {c['name'] for c in inspect(connection).get_columns(table)}:
+            return False
+
+        quote = connection.dialect.identifier_preparer.quote
+        ddl = f"ALTER TABLE {quote(table)} ADD COLUMN {quote(column.name)} {column.type.compile(connection.dialect)}"
+        default = column.default.arg if column.default is not None and column.default.is_scalar else None
+        if default is not None:
+            ddl += " DEFAULT " + str(literal(default, column.type).compile(
+                dialect=connection.dialect, compile_kwargs={'literal_binds': True}))
+        if not column.nullable:
+            if default is None:
+                raise ValueError(f"Cannot add NOT NULL column {table}.{column.name} without a default")
+            ddl += " NOT NULL"
+        connection.execute(text(ddl))
+        logger.info(f"Added column {table}.{column.name}")
+        return True
+
+    @staticmethod
+    def upgrade() -> List[str]:
+        """
+        Create missing tables, then run every step. Returns the names of the steps
+        that changed something.
+        """
+        from app import db
+
+        db.create_all()
+        changed = []
+        # Autocommit, so steps can run statements that refuse to run in a
+        # transaction (CREATE INDEX CONCURRENTLY) and a failing step keeps earlier ones
+        with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+            postgresql = connection.dialect.name == 'postgresql'
+            if postgresql:
+                connection.execute(text("SELECT pg_advisory_lock(:key)"), {'key': _ADVISORY_LOCK_KEY})
+            try:
+                for name, f in SchemaUpgrade._steps:
+                    if f(connection):
+                        changed.append(name)
+                        logger.info(f"Applied schema upgrade {name}")
+            finally:
+                if postgresql:
+                    connection.execute(text("SELECT pg_advisory_unlock(:key)"), {'key': _ADVISORY_LOCK_KEY})
+        return changed
+
+@SchemaUpgrade.step('users.data_version')
+def _add_user_data_version(connection) -> bool:
+    return SchemaUpgrade.add_column(connection, User.__table__.c.data_version)
+
+@SchemaUpgrade.step('food_logs.log_date')
+def _require_food_log_date(connection) -> bool:
+    # Once the column is NOT NULL there is nothing to backfill; skip the full-table scan
+    nullable = next(column['nullable'] for column in inspect(connection).get_columns('food_logs')
+                    if column['name'] == 'log_date')
+    if not nullable:
+        return False
+
+    # Rows from before log_date was required are dated by when they were logged
+    if connection.dialect.name == 'sqlite':
+        logged_on = func.date(FoodLog.logged_at)
+    else:
+        logged_on = cast(FoodLog.logged_at, Date)
+    backfilled = connection.execute(
+        update(FoodLog).where(FoodLog.log_date.is_(None))
+        .values(log_date=func.coalesce(logged_on, func.current_date()))
+    ).rowcount
+
+    # SQLite cannot add NOT NULL to an existing column; the model's default covers new rows
+    if connection.dialect.name != 'postgresql':
+        return backfilled > 0
+    connection.execute(text("ALTER TABLE food_logs ALTER COLUMN log_date SET NOT NULL"))
+    return True
+
+@SchemaUpgrade.step('food_logs.indexes')
+def _create_food_log_indexes(connection) -> bool:
+    return bool(FoodLogPartitions.ensure_indexes(connection))
+
+@SchemaUpgrade.step('food_logs.partitions')
+def _create_food_log_partitions(connection) -> bool:
+    return bool(FoodLogPartitions.ensure_partitions())
+
+@SchemaUpgrade.step('users.nutrition_targets')
+def _add_user_nutrition_targets(connection) -> bool:
+    # Users without stored targets get them computed on the fly until `flask refresh-nutrition-targets`
+    added = [SchemaUpgrade.add_column(connection, User.__table__.c[name])
+             for name in ('tdee_target', 'calorie_target', 'protein_target', 'carbs_target', 'fat_target')]
+    return any(added)
+
+@SchemaUpgrade.step('foods.updated_at')
+def _add_food_updated_at(connection) -> bool:
+    # Existing rows stay NULL: they are in every matrix built since
+    added = SchemaUpgrade.add_column(connection, Food.__table__.c.updated_at)
+    index = next(index for index in Food.__table__.indexes if index.name == 'ix_foods_updated_at')
+    if connection.dialect.name == 'postgresql':
+        return FoodLogPartitions._create_index_concurrently(connection, index, index.name, 'foods') or added
+    if index.name in {existing['name'] for existing in inspect(connection).get_indexes('foods')}:
+        return added
+    connection.execute(CreateIndex(index, if_not_exists=True))
+    return True
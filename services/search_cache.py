@@ -0,0 +1,266 @@
+import json
+import logging
+import os
+import random
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+import unicodedata
+from typing import Dict, Any, Iterable, List, Optional, Set
+
+from services.metrics import PerformanceMetrics
+
+logger = logging.getLogger(__name__)
+
+_WORD = re.compile(r'\w+')
+
+_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS search_cache ("
+    " query TEXT PRIMARY KEY, results TEXT NOT NULL, expires_at REAL NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS ix_search_cache_expires_at ON search_cache (expires_at)",
+    "CREATE TABLE IF NOT EXISTS search_cache_tokens ("
+    " token TEXT NOT NULL, query TEXT NOT NULL REFERENCES search_cache (query) ON DELETE CASCADE,"
+    " PRIMARY KEY (token, query)) WITHOUT ROWID",
+    "CREATE INDEX IF NOT EXISTS ix_search_cache_tokens_query ON search_cache_tokens (query)",
+    # Bumped by every invalidation, so a store can tell the database changed after its lookup
+    "CREATE TABLE IF NOT EXISTS search_cache_generation ("
+    " id INTEGER PRIMARY KEY CHECK (id = 0), generation INTEGER NOT NULL)",
+    "INSERT OR IGNORE INTO search_cache_generation (id, generation) VALUES (0, 0)",
+)
+
+class SearchCache:
+    """
+    Food search results shared by all worker processes of a host, stored in a
+    local SQLite file. Entries are keyed by the normalized query (case, whitespace
+    and accent folded) and expire after TTL seconds.
+
+    The cache and its invalidation are per host: a food added or enriched on one
+    instance only drops the entries of that instance, and the others serve their
+    cached results until they expire. TTL is kept short for that reason.
+
+    Adding or changing a food only drops the cached queries it could appear in:
+    a food matches a query when the query is a substring of its name, so every
+    token of such a query is a substring of one of the name's tokens.
+
+    A miss in ``get()`` records the invalidation generation, and the following
+    ``set()`` of the same query from that thread is dropped when an invalidation
+    happened in between: its results were read before the change. Invalidations
+    made by that same thread, after it wrote the foods, do not count.
+    """
+
+    PATH = os.environ.get('SEARCH_CACHE_PATH') or os.path.join(tempfile.gettempdir(),
+                                                               'nutritracker-search-cache.sqlite3')
+    # Bounds how long other instances serve results missing foods added on one of them
+    TTL = int(os.environ.get('SEARCH_CACHE_TTL', 300))
+    MAX_ENTRIES = int(os.environ.get('SEARCH_CACHE_MAX_ENTRIES', 10000))
+    # Queries with longer tokens are not cached, so invalidation can ignore the rest of a token
+    MAX_TOKEN_LENGTH = 40
+    # Fraction of writes that also prune expired and excess entries
+    PRUNE_PROBABILITY = 0.01
+
+    _local = threading.local()
+    _lock = threading.Lock()
+    _stats = {
+        'hits': 0,
+        'misses': 0,
+        'stores': 0,
+        'invalidations': 0,
+        'errors': 0,
+    }
+
+    @staticmethod
+    def normalize(query: str) -> str:
+        """
+        Fold case, accents and whitespace: "  Crème  Brûlée " -> "creme brulee"
+        """
+        decomposed = unicodedata.normalize('NFKD', query or '')
+        stripped = ''.join(char for char in decomposed if not unicodedata.combining(char))
+        return ' '.join(stripped.casefold().split())
+
+    @staticmethod
+    def tokens(text: str) -> Set[str]:
+        return set(_WORD.findall(SearchCache.normalize(text)))
+
+    @staticmethod
+    def _connection() -> sqlite3.Connection:
+        # One connection per thread, reopened after a fork
+        local = SearchCache._local
+        if getattr(local, 'pid', None) != os.getpid():
+            connection = sqlite3.connect(SearchCache.PATH, timeout=5, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute("PRAGMA foreign_keys=ON")
+            for statement in _SCHEMA:
+                connection.execute(statement)
+            local.connection = connection
+            local.pid = os.getpid()
+        return local.connection
+
+    @staticmethod
+    def _count(stat: str, amount: int = 1) -> None:
+        with SearchCache._lock:
+            SearchCache._stats[stat] += amount
+
+    @staticmethod
+    def get(query: str) -> Optional[List[Dict[str, Any]]]:
+        """
+        Cached results for ``query``, or None
+        """
+        key = SearchCache.normalize(query)
+        SearchCache._local.lookup = None
+        try:
+            results, generation = SearchCache._connection().execute(
+                "SELECT (SELECT results FROM search_cache WHERE query = ? AND expires_at > ?),"
+                " (SELECT generation FROM search_cache_generation)", (key, time.time())
+            ).fetchone()
+        except sqlite3.Error as e:
+            logger.error(f"Search cache read error: {str(e)}")
+            SearchCache._count('errors')
+            return None
+
+        if results is None:
+            SearchCache._local.lookup = (key, generation)
+        SearchCache._count('hits' if results is not None else 'misses')
+        return json.loads(results) if results is not None else None
+
+    @staticmethod
+    def set(query: str, results: List[Dict[str, Any]], ttl: Optional[int] = None) -> None:
+        """
+        Store ``results`` for ``query``, unless the cache was invalidated since this
+        thread's ``get()`` of the same query missed
+        """
+        key = SearchCache.normalize(query)
+        lookup = getattr(SearchCache._local, 'lookup', None)
+        SearchCache._local.lookup = None
+        tokens = SearchCache.tokens(key)
+        if not tokens or max(len(token) for token in tokens) > SearchCache.MAX_TOKEN_LENGTH:
+            return
+
+        try:
+            connection = SearchCache._connection()
+            with connection:
+                connection.execute("BEGIN IMMEDIATE")
+                if lookup is not None and lookup[0] == key:
+                    generation = connection.execute("SELECT generation FROM search_cache_generation").fetchone()[0]
+                    if generation != lookup[1]:
+                        logger.debug(f"Not caching search {key!r}: invalidated since the lookup")
+                        return
+                connection.execute(
+                    "INSERT INTO search_cache (query, results, expires_at) VALUES (?, ?, ?) "
+                    "ON CONFLICT (query) DO UPDATE SET results = excluded.results, expires_at = excluded.expires_at",
+                    (key, json.dumps(results), time.time() + (ttl or SearchCache.TTL))
+                )
+                connection.executemany(
+                    "INSERT OR IGNORE INTO search_cache_tokens (token, query) VALUES (?, ?)",
+                    [(token, key) for token in tokens]
+                )
+            SearchCache._count('stores')
+            if random.random() < SearchCache.PRUNE_PROBABILITY:
+                SearchCache.prune()
+        except sqlite3.Error as e:
+            logger.error(f"Search cache write error: {str(e)}")
+            SearchCache._count('errors')
+
+    @staticmethod
+    def invalidate(names: Iterable[str]) -> int:
+        """
+        Drop the cached queries whose results could include a food called one of
+        ``names``. Returns the number of entries dropped.
+        """
+        substrings = set()
+        for token in set().union(*(SearchCache.tokens(name) for name in names if name)):
+            token = token[:SearchCache.MAX_TOKEN_LENGTH]
+            substrings.update(token[start:end] for start in range(len(token))
+                              for end in range(start + 1, len(token) + 1))
+        if not substrings:
+            return 0
+
+        try:
+            connection = SearchCache._connection()
+            with connection:
+                connection.execute("BEGIN IMMEDIATE")
+                connection.execute("CREATE TEMP TABLE IF NOT EXISTS invalidated_tokens (token TEXT PRIMARY KEY)")
+                connection.execute("DELETE FROM invalidated_tokens")
+                connection.executemany("INSERT OR IGNORE INTO invalidated_tokens (token) VALUES (?)",
+                                       [(substring,) for substring in substrings])
+                # Bumped even when nothing is cached yet: a search may be about to store stale results
+                connection.execute("UPDATE search_cache_generation SET generation = generation + 1")
+                generation = connection.execute("SELECT generation FROM search_cache_generation").fetchone()[0]
+                # This thread's own search wrote the foods, so its results are current; unless
+                # another invalidation came first, its pending store stays valid
+                lookup = getattr(SearchCache._local, 'lookup', None)
+                if lookup is not None and lookup[1] == generation - 1:
+                    SearchCache._local.lookup = (lookup[0], generation)
+                deleted = connection.execute(
+                    "DELETE FROM search_cache WHERE query IN ("
+                    " SELECT t.query FROM search_cache_tokens t JOIN invalidated_tokens USING (token))"
+                ).rowcount
+        except sqlite3.Error as e:
+            logger.error(f"Search cache invalidation error: {str(e)}")
+            SearchCache._count('errors')
+            # Stale results for up to TTL are the worst case; fall back to dropping everything
+            return SearchCache.clear()
+
+        SearchCache._count('invalidations', deleted)
+        return deleted
+
+    @staticmethod
+    def prune() -> int:
+        """
+        Delete expired entries, then the entries closest to expiry beyond MAX_ENTRIES
+        """
+        connection = SearchCache._connection()
+        with connection:
+            connection.execute("BEGIN IMMEDIATE")
+            deleted = connection.execute("DELETE FROM search_cache WHERE expires_at <= ?", (time.time(),)).rowcount
+            deleted += connection.execute(
+                "DELETE FROM search_cache WHERE query IN ("
+                " SELECT query FROM search_cache ORDER BY expires_at DESC LIMIT -1 OFFSET ?)",
+                (SearchCache.MAX_ENTRIES,)
+            ).rowcount
+        return deleted
+
+    @staticmethod
+    def clear() -> int:
+        try:
+            connection = SearchCache._connection()
+            with connection:
+                connection.execute("BEGIN IMMEDIATE")
+                deleted = connection.execute("DELETE FROM search_cache").rowcount
+                connection.execute("UPDATE search_cache_generation SET generation = generation + 1")
+        except sqlite3.Error as e:
+            logger.error(f"Search cache clear error: {str(e)}")
+            SearchCache._count('errors')
+            return 0
+        SearchCache._count('invalidations', deleted)
+        return deleted
+
+    @staticmethod
+    def stats() -> Dict[str, Any]:
+        with SearchCache._lock:
+            stats = dict(SearchCache._stats)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = round(stats['hits'] / lookups, 4) if lookups else 0.0
+        return stats
+
+def _collect_metrics():
+    stats = SearchCache.stats()
+    yield 'nutritracker_search_cache_hits_total', {}, stats['hits']
+    yield 'nutritracker_search_cache_misses_total', {}, stats['misses']
+    yield 'nutritracker_search_cache_stores_total', {}, stats['stores']
+    yield 'nutritracker_search_cache_invalidations_total', {}, stats['invalidations']
+    yield 'nutritracker_search_cache_errors_total', {}, stats['errors']
+
+PerformanceMetrics.describe('nutritracker_search_cache_hits_total', 'counter',
+                            'Food searches answered from the search cache')
+PerformanceMetrics.describe('nutritracker_search_cache_misses_total', 'counter',
+                            'Food searches not in the search cache')
+PerformanceMetrics.describe('nutritracker_search_cache_stores_total', 'counter',
+                            'Food search results stored in the search cache')
+PerformanceMetrics.describe('nutritracker_search_cache_invalidations_total', 'counter',
+                            'Search cache entries dropped because matching foods changed')
+PerformanceMetrics.describe('nutritracker_search_cache_errors_total', 'counter',
+                            'Search cache SQLite errors')
+PerformanceMetrics.register_collector(_collect_metrics)
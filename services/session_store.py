@@ -0,0 +1,210 @@
+import hashlib
+import logging
+import secrets
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Any, Optional
+
+from flask import Flask, Request, Response
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
+from itsdangerous import BadSignature, Signer
+from sqlalchemy import delete, exists, insert, select, update
+from werkzeug.datastructures import CallbackDict
+
+from models import BrowserSession, OAuth
+
+logger = logging.getLogger(__name__)
+
+# Keys set on every request, even for anonymous visitors, that alone are not worth storing a session for
+TRANSIENT_KEYS = frozenset(('_browser_session_key', '_permanent', '_fresh'))
+
+class ServerSideSession(CallbackDict, SessionMixin):
+    def __init__(self, initial: Optional[Dict[str, Any]] = None, sid: Optional[str] = None,
+                 expires_at: Optional[datetime] = None, data: Optional[str] = None):
+        def on_update(self):
+            self.modified = True
+
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.new = sid is None
+        # Who the session belonged to when loaded; a change means a login or logout
+        self.loaded_user_id = self.get('_user_id')
+        self.expires_at = expires_at
+        # The stored serialization, to tell real changes from values set again unchanged
+        # (session.permanent = True on every request)
+        self.loaded_data = data
+        self.modified = False
+
+class DatabaseSessionInterface(SessionInterface):
+    """
+    Flask sessions stored in the browser_sessions table. The cookie carries only
+    a signed random id; the table stores its sha256, so ids cannot be read back
+    from the database.
+
+    A session is written only when its contents change, plus once every
+    REFRESH_INTERVAL to push the expiry of active sessions forward (instead of
+    re-sending the cookie on every response). When the signed-in user changes,
+    the session gets a new id, so an id planted before login is worthless after.
+    Static files are served without looking the session up.
+    """
+
+    SALT = 'nutritracker-session'
+    REFRESH_INTERVAL = timedelta(days=1)
+    STATIC_PREFIXES = ('/assets/',)
+
+    serializer = TaggedJSONSerializer()
+
+    def _signer(self, app: Flask) -> Optional[Signer]:
+        if not app.secret_key:
+            return None
+        return Signer(app.secret_key, salt=self.SALT, key_derivation='hmac')
+
+    @staticmethod
+    def _key(sid: str) -> str:
+        return hashlib.sha256(sid.encode()).hexdigest()
+
+    def open_session(self, app: Flask, request: Request) -> Optional[ServerSideSession]:
+        from app import db
+
+        signer = self._signer(app)
+        if signer is None:
+            return None
+
+        static_prefixes = self.STATIC_PREFIXES
+        if app.static_url_path:
+            static_prefixes += (app.static_url_path.rstrip('/') + '/',)
+        if request.path.startswith(static_prefixes):
+            # Empty and new, so save_session leaves both the cookie and the stored session alone
+            return ServerSideSession()
+
+        cookie = request.cookies.get(self.get_cookie_name(app))
+        if not cookie:
+            return ServerSideSession()
+        try:
+            sid = signer.unsign(cookie).decode()
+        except BadSignature:
+            return ServerSideSession()
+
+        # Outside the ORM session so it neither counts towards nor interferes with the request's queries
+        with db.engine.connect() as connection:
+            row = connection.execute(
+                select(BrowserSession.data, BrowserSession.expires_at)
+                .where(BrowserSession.id == self._key(sid), BrowserSession.expires_at > datetime.now())
+            ).first()
+        if row is None:
+            return ServerSideSession()
+        return ServerSideSession(self.serializer.loads(row.data), sid=sid, expires_at=row.expires_at, data=row.data)
+
+    def save_session(self, app: Flask, session: ServerSideSession, response: Response) -> None:
+        from app import db
+
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        if not any(key not in TRANSIENT_KEYS for key in session):
+            # Emptied, e.g. by logging out: forget it
+            if not session.new:
+                with db.engine.begin() as connection:
+                    connection.execute(delete(BrowserSession).where(BrowserSession.id == self._key(session.sid)))
+                response.delete_cookie(name, domain=domain, path=path,
+                                       secure=self.get_cookie_secure(app), httponly=self.get_cookie_httponly(app))
+            return
+
+        response.vary.add('Cookie')
+        now = datetime.now()
+        # Non-permanent sessions end with the browser, but still need a server-side expiry
+        expires_at = self.get_expiration_time(app, session) or datetime.now(timezone.utc) + app.permanent_session_lifetime
+        expires_at = expires_at.astimezone().replace(tzinfo=None)
+        refresh = not session.new and expires_at - session.expires_at >= self.REFRESH_INTERVAL
+        # Compared serialized: values changed in place (flash() appending to _flashes)
+        # are the same object before and after, so comparing values misses them
+        data = self.serializer.dumps(dict(session))
+        if not (session.new or data != session.loaded_data or refresh):
+            return
+        # Signed in or out: store it under a new id, against session fixation
+        rotate = not session.new and session.get('_user_id') != session.loaded_user_id
+
+        values = {
+            'data': data,
+            'user_id': session.get('_user_id'),
+            'browser_session_key': session.get('_browser_session_key'),
+            'updated_at': now,
+        }
+        if session.new or refresh or rotate:
+            values['expires_at'] = expires_at
+        with db.engine.begin() as connection:
+            if rotate:
+                connection.execute(delete(BrowserSession).where(BrowserSession.id == self._key(session.sid)))
+            if session.new or rotate:
+                session.sid = secrets.token_urlsafe(32)
+                connection.execute(insert(BrowserSession).values(id=self._key(session.sid), **values))
+            else:
+                updated = connection.execute(
+                    update(BrowserSession).where(BrowserSession.id == self._key(session.sid)).values(**values)
+                ).rowcount
+                if not updated:
+                    # Collected while the request ran
+                    values['expires_at'] = expires_at
+                    connection.execute(insert(BrowserSession).values(id=self._key(session.sid), **values))
+                    refresh = True
+
+        if session.new or refresh or rotate:
+            response.set_cookie(
+                name,
+                self._signer(app).sign(session.sid).decode(),
+                expires=self.get_expiration_time(app, session),
+                httponly=self.get_cookie_httponly(app),
+                domain=domain,
+                path=path,
+                secure=self.get_cookie_secure(app),
+                samesite=self.get_cookie_samesite(app),
+            )
+
+class SessionStore:
+    """
+    Installs the server-side session interface and garbage collects expired
+    sessions together with the OAuth tokens of browsers that no longer have one
+    """
+
+    GC_BATCH_SIZE = 1000
+    # OAuth rows this recent may belong to a login whose session is not saved yet
+    OAUTH_GRACE = timedelta(hours=1)
+
+    @staticmethod
+    def init_app(app: Flask) -> None:
+        app.session_interface = DatabaseSessionInterface()
+
+    @staticmethod
+    def gc(batch_size: int = GC_BATCH_SIZE) -> Dict[str, int]:
+        """
+        Delete expired sessions, then OAuth rows whose browser session is gone,
+        ``batch_size`` rows per transaction
+        """
+        from app import db
+
+        counts = {'sessions': 0, 'oauth': 0}
+        expired = select(BrowserSession.id).where(BrowserSession.expires_at <= datetime.now())
+        # OAuth.created_at is naive UTC
+        oauth_cutoff = datetime.now(timezone.utc).replace(tzinfo=None) - SessionStore.OAUTH_GRACE
+        orphaned = select(OAuth.id).where(
+            OAuth.created_at < oauth_cutoff,
+            ~exists().where(BrowserSession.browser_session_key == OAuth.browser_session_key)
+        )
+
+        for name, model, candidates in (
+            ('sessions', BrowserSession, expired),
+            ('oauth', OAuth, orphaned),
+        ):
+            while True:
+                deleted = db.session.execute(
+                    delete(model).where(model.id.in_(candidates.limit(batch_size))),
+                    execution_options={'synchronize_session': False}
+                ).rowcount
+                db.session.commit()
+                counts[name] += deleted
+                if deleted < batch_size:
+                    break
+
+        logger.info(f"Session GC: {counts}")
+        return counts
@@ -0,0 +1,309 @@
+import logging
+from datetime import date, datetime, timedelta
+from typing import Dict, Any, List, Optional
+
+from sqlalchemy import delete, insert, select
+
+from models import User, Food, FoodLog, WeightEntry, SyncMutation
+from services.data_version import DataVersion
+from services.food_log_recompute import NUTRIENT_COLUMNS
+from services.nutrition_calculator import NutritionCalculator
+from services.weight_import import WeightImport
+
+logger = logging.getLogger(__name__)
+
+MEAL_TYPES = ('breakfast', 'lunch', 'dinner', 'snack')
+# FoodLog columns telling apart the logs added by one batch
+ROW_IDENTITY = ('food_id', 'quantity', 'meal_type', 'log_date', 'logged_at')
+
+class SyncError(ValueError):
+    pass
+
+class SyncBatch:
+    """
+    Apply a batch of writes queued by an offline client in a single transaction.
+
+    Each mutation looks like:
+
+        {"key": "<client-generated idempotency key>", "op": "add_food",
+         "timestamp": "2024-05-01T12:30:00Z", "data": {...}}
+
+    with ``op`` one of add_food (food_id, quantity, meal_type, log_date),
+    add_weight (weight, entry_date) or delete_food_log (food_log_id, or
+    food_log_key: the key of the add_food that created the log).
+    Keys already applied for the user are answered from the stored result
+    instead of being applied again.
+    """
+
+    MAX_MUTATIONS = 100
+    # Length of SyncMutation.idempotency_key
+    MAX_KEY_LENGTH = 64
+    RETENTION_DAYS = 30
+
+    @staticmethod
+    def apply(user: User, mutations: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Apply ``mutations`` in order and commit. Returns the per-mutation results
+        and the user's data version afterwards.
+        """
+        from app import db
+
+        if not isinstance(mutations, list):
+            raise SyncError("mutations must be a list")
+        if len(mutations) > SyncBatch.MAX_MUTATIONS:
+            raise SyncError(f"At most {SyncBatch.MAX_MUTATIONS} mutations per batch")
+
+        # Keys are validated before they go into sets: a list or dict from the client is unhashable
+        keys = {SyncBatch._key(m.get('key')) for m in mutations if isinstance(m, dict)} - {None}
+        referenced_keys = {
+            SyncBatch._key(m['data'].get('food_log_key')) for m in SyncBatch._ops(mutations, 'delete_food_log')
+        } - {None}
+
+        # Load everything the batch touches up front, one query per table
+        applied = {
+            mutation.idempotency_key: mutation
+            for mutation in SyncMutation.query.filter(
+                SyncMutation.user_id == user.id,
+                SyncMutation.idempotency_key.in_(keys | referenced_keys)
+            )
+        } if keys or referenced_keys else {}
+        food_ids = {SyncBatch._int(m['data'].get('food_id')) for m in SyncBatch._ops(mutations, 'add_food')}
+        foods = {
+            food.id: food for food in Food.query.filter(Food.id.in_(food_ids - {None}))
+        } if food_ids - {None} else {}
+        log_ids = {SyncBatch._int(m['data'].get('food_log_id')) for m in SyncBatch._ops(mutations, 'delete_food_log')}
+        log_ids.update(
+            (mutation.result or {}).get('food_log_id') for mutation in applied.values()
+            if mutation.operation == 'add_food'
+        )
+        food_logs = {
+            food_log.id: food_log for food_log in FoodLog.query.filter(
+                FoodLog.user_id == user.id, FoodLog.id.in_(log_ids - {None})
+            )
+        } if log_ids - {None} else {}
+        # Same default as _add_weight, so an existing entry for today is updated rather than inserted again
+        weight_dates = {
+            SyncBatch._date(m['data'].get('entry_date')) or date.today() for m in SyncBatch._ops(mutations, 'add_weight')
+        }
+        weight_entries = {
+            entry.entry_date: entry for entry in WeightEntry.query.filter(
+                WeightEntry.user_id == user.id, WeightEntry.entry_date.in_(weight_dates)
+            )
+        } if weight_dates else {}
+
+        results = []
+        # Rows are inserted in bulk at the end: key -> FoodLog row, entry date -> WeightEntry row
+        new_logs: Dict[str, Dict[str, Any]] = {}
+        new_weights: Dict[date, Dict[str, Any]] = {}
+        new_mutations = []
+        weights_changed = False
+        for mutation in mutations:
+            key = SyncBatch._key(mutation.get('key')) if isinstance(mutation, dict) else None
+            if key is None:
+                results.append({'key': None, 'status': 'error', 'error': 'Missing or invalid key'})
+                continue
+            if key in applied:
+                results.append({'key': key, 'status': 'duplicate', 'result': applied[key].result})
+                continue
+
+            op = mutation.get('op')
+            data = mutation.get('data') if isinstance(mutation.get('data'), dict) else {}
+            client_timestamp = SyncBatch._timestamp(mutation)
+            try:
+                if op == 'add_food':
+                    new_logs[key] = SyncBatch._food_log_row(user, data, foods, client_timestamp)
+                    result = {'food_log_id': None}
+                elif op == 'add_weight':
+                    result = SyncBatch._add_weight(user, data, weight_entries, new_weights)
+                    weights_changed = True
+                elif op == 'delete_food_log':
+                    result = SyncBatch._delete_food_log(data, food_logs, new_logs, applied)
+                else:
+                    raise SyncError(f"Unknown op {op}")
+            except SyncError as e:
+                results.append({'key': key, 'status': 'error', 'error': str(e)})
+                continue
+
+            sync_mutation = SyncMutation(
+                user_id=user.id,
+                idempotency_key=key,
+                operation=op,
+                result=result,
+                client_timestamp=client_timestamp
+            )
+            applied[key] = sync_mutation
+            new_mutations.append(sync_mutation)
+            results.append({'key': key, 'status': 'applied', 'result': result})
+
+        if new_mutations:
+            if new_logs:
+                # A single multi-row INSERT; RETURNING order is not guaranteed, so the ids are
+                # matched back to keys by row content (rows that match are interchangeable)
+                keys_by_row = {}
+                for key, row in new_logs.items():
+                    keys_by_row.setdefault(SyncBatch._row_identity(row), []).append(key)
+                inserted = db.session.execute(
+                    insert(FoodLog).returning(FoodLog.id, *(FoodLog.__table__.c[column] for column in ROW_IDENTITY)),
+                    list(new_logs.values())
+                ).all()
+                for food_log_id, *identity in inserted:
+                    key = keys_by_row[tuple(identity)].pop()
+                    applied[key].result['food_log_id'] = food_log_id
+            if new_weights:
+                db.session.execute(insert(WeightEntry), list(new_weights.values()))
+            db.session.execute(insert(SyncMutation), [{
+                'user_id': mutation.user_id,
+                'idempotency_key': mutation.idempotency_key,
+                'operation': mutation.operation,
+                'result': mutation.result,
+                'client_timestamp': mutation.client_timestamp,
+                'created_at': datetime.now(),
+            } for mutation in new_mutations])
+            if weights_changed:
+                NutritionCalculator.refresh_targets(user)
+            DataVersion.bump([user.id])
+        db.session.commit()
+
+        data_version = db.session.execute(
+            select(User.data_version).where(User.id == user.id)
+        ).scalar()
+        logger.info(f"Synced {len(new_mutations)} of {len(mutations)} mutations for {user.id}")
+        return {'results': results, 'data_version': data_version}
+
+    @staticmethod
+    def purge(older_than_days: int = RETENTION_DAYS) -> int:
+        """
+        Forget applied keys older than ``older_than_days``. Clients retrying later
+        than that would have their mutations applied again.
+        """
+        from app import db
+
+        deleted = db.session.execute(
+            delete(SyncMutation).where(SyncMutation.created_at < datetime.now() - timedelta(days=older_than_days)),
+            execution_options={'synchronize_session': False}
+        ).rowcount
+        db.session.commit()
+        return deleted
+
+    @staticmethod
+    def _food_log_row(user: User, data: Dict[str, Any], foods: Dict[int, Food],
+                      logged_at: Optional[datetime]) -> Dict[str, Any]:
+        food = foods.get(SyncBatch._int(data.get('food_id')))
+        if food is None:
+            raise SyncError("Food item not found")
+        quantity = SyncBatch._float(data.get('quantity', 100))
+        if quantity is None or quantity <= 0:
+            raise SyncError("Invalid quantity")
+        meal_type = data.get('meal_type', 'snack')
+        if meal_type not in MEAL_TYPES:
+            raise SyncError("Invalid meal type")
+
+        # Nutrition is per 100g
+        multiplier = quantity / 100
+        return {
+            'user_id': user.id,
+            'food_id': food.id,
+            'quantity': quantity,
+            'meal_type': meal_type,
+            'log_date': SyncBatch._date(data.get('log_date')) or date.today(),
+            'logged_at': logged_at or datetime.now(),
+            **{
+                log_column: (getattr(food, food_column) or 0) * multiplier
+                for log_column, food_column in NUTRIENT_COLUMNS.items()
+            }
+        }
+
+    @staticmethod
+    def _add_weight(user: User, data: Dict[str, Any], weight_entries: Dict[date, WeightEntry],
+                    new_weights: Dict[date, Dict[str, Any]]) -> Dict[str, Any]:
+        weight = SyncBatch._float(data.get('weight'))
+        if weight is None or not WeightImport.MIN_WEIGHT <= weight <= WeightImport.MAX_WEIGHT:
+            raise SyncError("Invalid weight")
+        entry_date = SyncBatch._date(data.get('entry_date')) or date.today()
+
+        if entry_date in weight_entries:
+            weight_entries[entry_date].weight = weight
+        else:
+            new_weights[entry_date] = {
+                'user_id': user.id,
+                'weight': weight,
+                'entry_date': entry_date,
+                'created_at': datetime.now(),
+            }
+        return {'entry_date': entry_date.isoformat(), 'weight': weight}
+
+    @staticmethod
+    def _delete_food_log(data: Dict[str, Any], food_logs: Dict[int, FoodLog],
+                         new_logs: Dict[str, Dict[str, Any]], applied: Dict[str, SyncMutation]) -> Dict[str, Any]:
+        from app import db
+
+        food_log_key = data.get('food_log_key')
+        if food_log_key is not None and SyncBatch._key(food_log_key) is None:
+            raise SyncError("Invalid food_log_key")
+        if food_log_key in new_logs:
+            # Added and deleted within the same batch: never insert it
+            del new_logs[food_log_key]
+            applied[food_log_key].result['deleted'] = True
+            return {'food_log_id': None, 'deleted': True}
+
+        food_log_id = SyncBatch._int(data.get('food_log_id'))
+        if food_log_id is None and food_log_key in applied:
+            food_log_id = (applied[food_log_key].result or {}).get('food_log_id')
+        food_log = food_logs.pop(food_log_id, None)
+        if food_log is None:
+            # Already gone: deleting is idempotent
+            return {'food_log_id': food_log_id, 'deleted': False}
+        db.session.delete(food_log)
+        return {'food_log_id': food_log_id, 'deleted': True}
+
+    @staticmethod
+    def _row_identity(row: Dict[str, Any]) -> tuple:
+        return tuple(row[column] for column in ROW_IDENTITY)
+
+    @staticmethod
+    def _ops(mutations: List[Any], op: str) -> List[Dict[str, Any]]:
+        return [m for m in mutations
+                if isinstance(m, dict) and m.get('op') == op and isinstance(m.get('data'), dict)]
+
+    @staticmethod
+    def _key(value) -> Optional[str]:
+        """
+        ``value`` if it is a usable idempotency key, otherwise None
+        """
+        if isinstance(value, str) and 0 < len(value) <= SyncBatch.MAX_KEY_LENGTH:
+            return value
+        return None
+
+    @staticmethod
+    def _int(value) -> Optional[int]:
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            return None
+
+    @staticmethod
+    def _float(value) -> Optional[float]:
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return None
+
+    @staticmethod
+    def _date(value) -> Optional[date]:
+        try:
+            return datetime.strptime(value, '%Y-%m-%d').date()
+        except (TypeError, ValueError):
+            return None
+
+    @staticmethod
+    def _timestamp(mutation: Dict[str, Any]) -> Optional[datetime]:
+        """
+        The client's local time of the mutation, as a naive datetime like the rest of the schema
+        """
+        try:
+            timestamp = datetime.fromisoformat(str(mutation.get('timestamp')).replace('Z', '+00:00'))
+        except ValueError:
+            return None
+        if timestamp.tzinfo is not None:
+            timestamp = timestamp.astimezone().replace(tzinfo=None)
+        return timestamp
@@ -0,0 +1,283 @@
+import csv
+import io
+import logging
+import os
+import re
+import tempfile
+import time
+import uuid
+import zipfile
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import BinaryIO, Dict, Any, Iterator, Optional, Tuple
+from xml.etree import ElementTree
+
+from sqlalchemy import delete
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from models import User, WeightEntry, WeightUpload
+from services.data_version import DataVersion
+from services.nutrition_calculator import NutritionCalculator
+
+logger = logging.getLogger(__name__)
+
+# Unit -> kilograms
+UNIT_TO_KG = {
+    'kg': 1.0,
+    'kgs': 1.0,
+    'kilogram': 1.0,
+    'kilograms': 1.0,
+    'g': 0.001,
+    'lb': 0.45359237,
+    'lbs': 0.45359237,
+    'lb.': 0.45359237,
+    'pound': 0.45359237,
+    'pounds': 0.45359237,
+    'st': 6.35029318,
+    'stone': 6.35029318,
+    'stones': 6.35029318,
+}
+
+APPLE_HEALTH_BODY_MASS = 'HKQuantityTypeIdentifierBodyMass'
+
+_DATE_FORMATS = ('%m/%d/%Y', '%m/%d/%Y %H:%M', '%m/%d/%Y %I:%M %p',
+                 '%d.%m.%Y', '%d.%m.%Y %H:%M', '%Y/%m/%d', '%Y/%m/%d %H:%M:%S')
+_ISO_DAY = re.compile(r'\d{4}-\d{2}-\d{2}(?:$|[ T])')
+_UNIT_IN_HEADER = re.compile(r'\b(kgs?|kilograms?|lbs?|lb\.|pounds?|st|stones?)\b', re.IGNORECASE)
+
+class WeightImport:
+    """
+    Bulk import of weight readings from smart-scale CSV exports and Apple Health
+    export.xml (or the export.zip containing it). Files are parsed as streams;
+    readings are collapsed to one weight per day (their mean) and upserted.
+    """
+
+    # Uploads wait for the import job in the weight_uploads table
+    MAX_UPLOAD_BYTES = int(os.environ.get('WEIGHT_IMPORT_MAX_BYTES', 100 * 1024 * 1024))
+    # Uploads whose job never ran (e.g. its worker died) are deleted after this
+    UPLOAD_RETENTION = timedelta(days=1)
+    ALLOWED_EXTENSIONS = ('.csv', '.xml', '.zip')
+    BATCH_SIZE = 1000
+    # Readings outside this range (kg) are treated as typos or other people on the scale
+    MIN_WEIGHT = 20.0
+    MAX_WEIGHT = 400.0
+
+    @staticmethod
+    def store_upload(user: User, filename: str, stream: BinaryIO) -> Optional[str]:
+        """
+        Add ``stream`` to the session as an upload for the import job. Returns its
+        id, or None if it is larger than MAX_UPLOAD_BYTES.
+        """
+        from app import db
+
+        data = stream.read(WeightImport.MAX_UPLOAD_BYTES + 1)
+        if len(data) > WeightImport.MAX_UPLOAD_BYTES:
+            return None
+        upload_id = uuid.uuid4().hex
+        db.session.add(WeightUpload(id=upload_id, user_id=user.id, filename=filename, data=data))
+        return upload_id
+
+    @staticmethod
+    def import_upload(upload_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Import a stored upload and delete it, whether or not the import succeeds.
+        Returns None if the upload is gone.
+        """
+        from app import db
+
+        upload = db.session.get(WeightUpload, upload_id)
+        if upload is None:
+            logger.warning(f"Weight upload {upload_id} is gone")
+            return None
+        user, filename = db.session.get(User, upload.user_id), upload.filename
+        # ZIP archives need a seekable file
+        with tempfile.NamedTemporaryFile(suffix=os.path.splitext(filename)[1].lower(), delete=False) as tmp_file:
+            tmp_file.write(upload.data)
+        path = Path(tmp_file.name)
+        db.session.expunge(upload)
+        try:
+            return WeightImport.import_file(user, str(path), filename)
+        finally:
+            path.unlink(missing_ok=True)
+            db.session.rollback()
+            db.session.execute(delete(WeightUpload).where(WeightUpload.id == upload_id))
+            db.session.commit()
+
+    @staticmethod
+    def purge_uploads(older_than: timedelta = UPLOAD_RETENTION) -> int:
+        """
+        Delete uploads left behind by import jobs that never finished
+        """
+        from app import db
+
+        deleted = db.session.execute(
+            delete(WeightUpload).where(WeightUpload.created_at < datetime.now() - older_than)
+        ).rowcount
+        db.session.commit()
+        return deleted
+
+    @staticmethod
+    def import_file(user: User, path: str, filename: Optional[str] = None,
+                    batch_size: int = BATCH_SIZE) -> Dict[str, Any]:
+        """
+        Import the CSV, XML or ZIP file at ``path`` for ``user`` and commit
+        """
+        filename = (filename or path).lower()
+        with open(path, 'rb') as stream:
+            if filename.endswith('.zip'):
+                with zipfile.ZipFile(stream) as archive:
+                    member = next((name for name in archive.namelist()
+                                   if name.endswith('export.xml') and '__MACOSX' not in name), None)
+                    if member is None:
+                        raise ValueError("No Apple Health export.xml in the archive")
+                    with archive.open(member) as xml_stream:
+                        return WeightImport.import_readings(user, WeightImport.parse_apple_health(xml_stream),
+                                                            batch_size)
+            if filename.endswith('.xml'):
+                return WeightImport.import_readings(user, WeightImport.parse_apple_health(stream), batch_size)
+            return WeightImport.import_readings(user, WeightImport.parse_csv(stream), batch_size)
+
+    @staticmethod
+    def parse_apple_health(stream: BinaryIO) -> Iterator[Tuple[date, float]]:
+        """
+        Yield (day, kg) for every body mass record of an Apple Health export,
+        in constant memory
+        """
+        root = None
+        depth = 0
+        for event, element in ElementTree.iterparse(stream, events=('start', 'end')):
+            if event == 'start':
+                if root is None:
+                    root = element
+                depth += 1
+                continue
+
+            depth -= 1
+            if element.tag == 'Record' and element.get('type') == APPLE_HEALTH_BODY_MASS:
+                reading = WeightImport._reading(element.get('startDate'), element.get('value'),
+                                                element.get('unit', 'kg'))
+                if reading:
+                    yield reading
+            # Drop each finished top-level element so memory does not grow with the file
+            if depth == 1:
+                root.clear()
+
+    @staticmethod
+    def parse_csv(stream: BinaryIO) -> Iterator[Tuple[date, float]]:
+        """
+        Yield (day, kg) from a CSV export with a date/time column and a weight
+        column. The unit is taken from the weight header, e.g. "Weight (lb)",
+        or from a separate unit column, and defaults to kg.
+        """
+        text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+        reader = csv.DictReader(text)
+        headers = reader.fieldnames or []
+        date_column = next((h for h in headers if re.search(r'date|time', h, re.IGNORECASE)), None)
+        weight_column = next((h for h in headers if 'weight' in h.lower()), None)
+        unit_column = next((h for h in headers if h.strip().lower() == 'unit'), None)
+        if date_column is None or weight_column is None:
+            raise ValueError("The CSV needs a date and a weight column")
+
+        header_unit = _UNIT_IN_HEADER.search(weight_column)
+        default_unit = header_unit.group(1) if header_unit else 'kg'
+        for row in reader:
+            unit = (row.get(unit_column) or default_unit) if unit_column else default_unit
+            reading = WeightImport._reading(row.get(date_column), row.get(weight_column), unit)
+            if reading:
+                yield reading
+
+    @staticmethod
+    def _reading(when: Optional[str], value: Optional[str], unit: str) -> Optional[Tuple[date, float]]:
+        day = WeightImport._parse_day(when)
+        factor = UNIT_TO_KG.get((unit or 'kg').strip().lower())
+        try:
+            weight = float(value.strip().replace(',', '.')) * factor if value and factor else None
+        except ValueError:
+            weight = None
+        if day is None or weight is None:
+            return None
+        return day, weight
+
+    @staticmethod
+    def _parse_day(value: Optional[str]) -> Optional[date]:
+        """
+        The local calendar day of a timestamp, as written in the export
+        """
+        if not value:
+            return None
+        value = value.strip()
+        # Fast path for ISO dates and Apple Health's "2024-01-31 07:02:11 +0100"
+        if _ISO_DAY.match(value):
+            try:
+                return date.fromisoformat(value[:10])
+            except ValueError:
+                return None
+        for date_format in _DATE_FORMATS:
+            try:
+                return datetime.strptime(value, date_format).date()
+            except ValueError:
+                continue
+        return None
+
+    @staticmethod
+    def import_readings(user: User, readings: Iterator[Tuple[date, float]],
+                        batch_size: int = BATCH_SIZE) -> Dict[str, Any]:
+        """
+        Collapse ``readings`` to one mean weight per day and upsert them in batches.
+        Readings outside MIN_WEIGHT..MAX_WEIGHT are skipped and counted.
+        """
+        from app import db
+
+        start = time.perf_counter()
+        # day -> [sum, count]; bounded by the number of days, not the file size
+        days: Dict[date, list] = {}
+        readings_count = 0
+        out_of_range = 0
+        for day, weight in readings:
+            readings_count += 1
+            if not WeightImport.MIN_WEIGHT <= weight <= WeightImport.MAX_WEIGHT:
+                out_of_range += 1
+                continue
+            totals = days.setdefault(day, [0.0, 0])
+            totals[0] += weight
+            totals[1] += 1
+
+        dialect = db.engine.dialect.name
+        if dialect == 'postgresql':
+            insert = postgresql_insert
+        elif dialect == 'sqlite':
+            insert = sqlite_insert
+        else:
+            raise ValueError(f"Weight import does not support {dialect}")
+
+        rows = [{
+            'user_id': user.id,
+            'entry_date': day,
+            'weight': round(total / count, 1),
+            'created_at': datetime.now(),
+        } for day, (total, count) in sorted(days.items())]
+        for offset in range(0, len(rows), batch_size):
+            stmt = insert(WeightEntry).values(rows[offset:offset + batch_size])
+            db.session.execute(stmt.on_conflict_do_update(
+                index_elements=[WeightEntry.user_id, WeightEntry.entry_date],
+                set_={'weight': stmt.excluded.weight}
+            ))
+
+        if rows:
+            NutritionCalculator.refresh_targets(user)
+            DataVersion.bump([user.id])
+        db.session.commit()
+
+        elapsed = time.perf_counter() - start
+        stats = {
+            'readings': readings_count,
+            'out_of_range': out_of_range,
+            'days': len(rows),
+            'first_day': rows[0]['entry_date'].isoformat() if rows else None,
+            'last_day': rows[-1]['entry_date'].isoformat() if rows else None,
+            'seconds': round(elapsed, 3),
+            'rows_per_second': round(readings_count / elapsed, 1) if elapsed > 0 else 0,
+        }
+        logger.info(f"Imported weights for {user.id}: {stats}")
+        return stats
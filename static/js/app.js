@@ -167,6 +167,104 @@ const NutriTracker = {
         clear: function() {
             this.cache.clear();
         }
+    },
+
+    // Writes queued in local storage and sent to /api/sync in batches, so entries
+    // made while offline are kept and applied once the connection returns
+    syncQueue: {
+        storageKey: 'nutritracker.syncQueue',
+        batchSize: 50,
+        flushDelay: 300,
+        maxRetryDelay: 60000,
+        retryDelay: 0,
+        timer: null,
+        flushing: false,
+
+        pending: function() {
+            return NutriTracker.storage.get(this.storageKey) || [];
+        },
+
+        newKey: function() {
+            if (window.crypto && crypto.randomUUID) {
+                return crypto.randomUUID();
+            }
+            return Date.now().toString(36) + '-' + Math.random().toString(36).slice(2);
+        },
+
+        // Queue a mutation and schedule a flush; returns its idempotency key
+        push: function(op, data) {
+            const mutation = {
+                key: this.newKey(),
+                op: op,
+                timestamp: new Date().toISOString(),
+                data: data
+            };
+            const queue = this.pending();
+            queue.push(mutation);
+            NutriTracker.storage.set(this.storageKey, queue);
+            this.schedule(this.flushDelay);
+            return mutation.key;
+        },
+
+        schedule: function(delay) {
+            clearTimeout(this.timer);
+            this.timer = setTimeout(() => this.flush(), delay);
+        },
+
+        // Send queued mutations oldest first. Mutations stay queued until the server
+        // has answered for them; resending is safe because keys are deduplicated.
+        flush: async function() {
+            if (this.flushing || !navigator.onLine) {
+                return;
+            }
+            this.flushing = true;
+            let applied = 0;
+            try {
+                let batch = this.pending().slice(0, this.batchSize);
+                while (batch.length) {
+                    const response = await fetch('/api/sync', {
+                        method: 'POST',
+                        headers: {'Content-Type': 'application/json'},
+                        credentials: 'same-origin',
+                        body: JSON.stringify({mutations: batch})
+                    });
+                    if (response.status === 400) {
+                        // Not retryable as a whole: drop the batch rather than block the queue
+                        const error = await response.json();
+                        console.warn('Sync batch rejected:', error.error);
+                    } else if (!response.ok) {
+                        throw new Error(`Sync failed with status ${response.status}`);
+                    } else {
+                        const result = await response.json();
+                        result.results.forEach(item => {
+                            if (item.status === 'applied') {
+                                applied++;
+                            } else if (item.status === 'error') {
+                                NutriTracker.showError(item.error);
+                            }
+                        });
+                    }
+
+                    const sent = new Set(batch.map(mutation => mutation.key));
+                    const queue = this.pending().filter(mutation => !sent.has(mutation.key));
+                    NutriTracker.storage.set(this.storageKey, queue);
+                    batch = queue.slice(0, this.batchSize);
+                }
+                this.retryDelay = 0;
+            } catch (e) {
+                // Offline or server trouble: back off and try again
+                console.warn('Sync error:', e);
+                this.retryDelay = Math.min(Math.max(this.retryDelay * 2, 2000), this.maxRetryDelay);
+                this.schedule(this.retryDelay);
+            } finally {
+                this.flushing = false;
+            }
+
+            if (applied) {
+                // Show the server's view of the data, now including the synced entries
+                window.location.reload();
+            }
+        }
     }
 };
 
@@ -185,12 +283,48 @@ if ('serviceWorker' in navigator) {
 // Handle network status
 window.addEventListener('online', function() {
     NutriTracker.showSuccess('Connection restored');
+    NutriTracker.syncQueue.flush();
 });
 
 window.addEventListener('offline', function() {
     NutriTracker.showError('No internet connection. Some features may be limited.');
 });
 
+// Forms marked with data-sync-op are sent through the sync queue instead of a page
+// submit, so they keep working offline
+document.addEventListener('submit', function(e) {
+    const form = e.target;
+    const op = form.dataset.syncOp;
+    if (!op || !window.fetch) {
+        return;
+    }
+    if (!NutriTracker.validateForm(form)) {
+        return;
+    }
+    e.preventDefault();
+
+    const data = Object.fromEntries(new FormData(form).entries());
+    if (form.dataset.foodLogId) {
+        data.food_log_id = Number(form.dataset.foodLogId);
+    }
+    NutriTracker.syncQueue.push(op, data);
+
+    const modal = form.closest('.modal');
+    if (modal) {
+        bootstrap.Modal.getOrCreateInstance(modal).hide();
+    }
+    if (!navigator.onLine) {
+        NutriTracker.showSuccess('Saved offline. It will sync when you are back online.');
+    }
+});
+
+document.addEventListener('DOMContentLoaded', function() {
+    // Send anything left over from an earlier visit
+    if (NutriTracker.syncQueue.pending().length) {
+        NutriTracker.syncQueue.flush();
+    }
+});
+
 // Keyboard shortcuts
 document.addEventListener('keydown', function(e) {
     // Ctrl/Cmd + K to focus search
@@ -0,0 +1,175 @@
+// Barcode decode benchmark: decode FPS and UI-thread stalls, decoding in the
+// worker versus on the main thread, from the camera or a still image
+
+const BarcodeBenchmark = {
+    source: null,
+    stream: null,
+
+    // Longest gap between animation frames while decoding, i.e. visible jank
+    watchMainThread: function() {
+        const stats = { longestFrameMs: 0, longFrames: 0, running: true };
+        let last = performance.now();
+        const tick = (now) => {
+            const gap = now - last;
+            last = now;
+            stats.longestFrameMs = Math.max(stats.longestFrameMs, gap);
+            if (gap > 50) {
+                stats.longFrames++;
+            }
+            if (stats.running) {
+                requestAnimationFrame(tick);
+            }
+        };
+        requestAnimationFrame(tick);
+        return stats;
+    },
+
+    useCamera: async function() {
+        this.stopCamera();
+        const video = document.getElementById('benchmarkVideo');
+        this.stream = await navigator.mediaDevices.getUserMedia({
+            video: { facingMode: { ideal: 'environment' }, width: { ideal: 1280 }, height: { ideal: 720 } }
+        });
+        video.srcObject = this.stream;
+        await video.play();
+        video.style.display = '';
+        document.getElementById('benchmarkImage').style.display = 'none';
+        this.source = video;
+    },
+
+    useImage: function(file) {
+        this.stopCamera();
+        const image = document.getElementById('benchmarkImage');
+        image.src = URL.createObjectURL(file);
+        image.style.display = '';
+        document.getElementById('benchmarkVideo').style.display = 'none';
+        this.source = image;
+    },
+
+    stopCamera: function() {
+        if (this.stream) {
+            this.stream.getTracks().forEach(track => track.stop());
+            this.stream = null;
+        }
+    },
+
+    // Decode frames as fast as the worker allows for ``seconds``
+    runWorker: async function(maxWidth, seconds, record) {
+        const decoder = new BarcodeDecoder(this.source, () => {}, {
+            maxWidth: maxWidth,
+            minInterval: 0,
+            idleAfterFrames: Infinity,
+            onFrame: record
+        });
+        await decoder.start();
+        await new Promise(resolve => setTimeout(resolve, seconds * 1000));
+        decoder.stop();
+    },
+
+    // The same decoding on the UI thread, yielding between frames
+    runMainThread: async function(maxWidth, seconds, record) {
+        const ZXing = await loadZXingLibrary();
+        if (!BarcodeDecodeCore.reader) {
+            BarcodeDecodeCore.init(ZXing);
+        }
+        const sizer = new BarcodeDecoder(this.source, () => {}, { maxWidth: maxWidth });
+        const canvas = document.createElement('canvas');
+        const context = canvas.getContext('2d', { willReadFrequently: true });
+        const end = performance.now() + seconds * 1000;
+
+        while (performance.now() < end) {
+            const { width, height } = sizer.frameSize();
+            const start = performance.now();
+            canvas.width = width;
+            canvas.height = height;
+            context.drawImage(this.source, 0, 0, width, height);
+            const rgba = context.getImageData(0, 0, width, height).data;
+            const text = BarcodeDecodeCore.decode(ZXing, rgba, width, height);
+            record(performance.now() - start, text);
+            await new Promise(resolve => setTimeout(resolve, 0));
+        }
+    },
+
+    run: async function() {
+        const button = document.getElementById('runBenchmark');
+        const originalText = button.innerHTML;
+        if (!this.source) {
+            NutriTracker.showError('Start the camera or choose an image first.');
+            return;
+        }
+
+        const mode = document.getElementById('benchmarkMode').value;
+        const maxWidth = Number(document.getElementById('benchmarkWidth').value);
+        const seconds = Number(document.getElementById('benchmarkSeconds').value);
+        const timings = [];
+        let detections = 0;
+        const record = (decodeMs, text) => {
+            timings.push(decodeMs);
+            if (text) {
+                detections++;
+            }
+        };
+
+        NutriTracker.showLoading(button);
+        const mainThread = this.watchMainThread();
+        const start = performance.now();
+        try {
+            if (mode === 'worker') {
+                await this.runWorker(maxWidth, seconds, record);
+            } else {
+                await this.runMainThread(maxWidth, seconds, record);
+            }
+        } catch (e) {
+            console.error('Benchmark error:', e);
+            NutriTracker.showError(`Benchmark failed: ${e.message}`);
+            return;
+        } finally {
+            mainThread.running = false;
+            NutriTracker.hideLoading(button, originalText);
+        }
+        const elapsed = (performance.now() - start) / 1000;
+
+        timings.sort((a, b) => a - b);
+        const mean = timings.reduce((sum, ms) => sum + ms, 0) / (timings.length || 1);
+        const p95 = timings.length ? timings[Math.min(timings.length - 1, Math.floor(timings.length * 0.95))] : 0;
+        this.report({
+            mode: mode === 'worker' ? 'Worker' : 'Main thread',
+            width: maxWidth,
+            frames: timings.length,
+            fps: timings.length / elapsed,
+            mean: mean,
+            p95: p95,
+            detections: detections,
+            longestFrameMs: mainThread.longestFrameMs,
+            longFrames: mainThread.longFrames
+        });
+    },
+
+    report: function(result) {
+        const row = document.createElement('tr');
+        row.innerHTML = `
+            <td>${result.mode}</td>
+            <td>${result.width}px</td>
+            <td>${result.frames}</td>
+            <td><strong>${NutriTracker.formatNumber(result.fps)}</strong></td>
+            <td>${NutriTracker.formatNumber(result.mean)}</td>
+            <td>${NutriTracker.formatNumber(result.p95)}</td>
+            <td>${result.detections}</td>
+            <td>${NutriTracker.formatNumber(result.longestFrameMs, 0)} ms (${result.longFrames} &gt; 50 ms)</td>
+        `;
+        document.getElementById('benchmarkResults').appendChild(row);
+    }
+};
+
+document.addEventListener('DOMContentLoaded', function() {
+    document.getElementById('useCamera').addEventListener('click', () => {
+        BarcodeBenchmark.useCamera().catch(e => NutriTracker.showError(`Camera not available: ${e.message}`));
+    });
+    document.getElementById('benchmarkFile').addEventListener('change', (e) => {
+        if (e.target.files.length) {
+            BarcodeBenchmark.useImage(e.target.files[0]);
+        }
+    });
+    document.getElementById('runBenchmark').addEventListener('click', () => BarcodeBenchmark.run());
+    window.addEventListener('pagehide', () => BarcodeBenchmark.stopCamera());
+});
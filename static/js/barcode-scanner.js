@@ -1,4 +1,9 @@
-// Barcode Scanner functionality using getUserMedia and ZXing library
+// Barcode Scanner functionality using getUserMedia and ZXing library.
+// Frames are downscaled and decoded in a Web Worker (barcode-worker.js).
+
+const ZXING_LIBRARY_URL = 'https://unpkg.com/@zxing/library@latest/umd/index.min.js';
+const BARCODE_WORKER_URL = (document.currentScript && document.currentScript.dataset.workerUrl) ||
+    '/static/js/barcode-worker.js';
 
 let barcodeStream = null;
 let barcodeScanner = null;
@@ -12,7 +17,7 @@ function loadZXingLibrary() {
         }
 
         const script = document.createElement('script');
-        script.src = 'https://unpkg.com/@zxing/library@latest/umd/index.min.js';
+        script.src = ZXING_LIBRARY_URL;
         script.onload = () => {
             if (window.ZXing) {
                 resolve(window.ZXing);
@@ -25,67 +30,266 @@ function loadZXingLibrary() {
     });
 }
 
+// Feeds video frames to the decode worker, one frame in flight at a time, at a rate
+// adapted to how fast the device decodes and slowed down while nothing is found
+class BarcodeDecoder {
+    constructor(video, onResult, options = {}) {
+        this.video = video;
+        this.onResult = onResult;
+        // Downscale frames to this width before decoding; 1D barcodes stay readable
+        this.maxWidth = options.maxWidth || 640;
+        this.minInterval = options.minInterval || 1000 / 15;
+        this.idleInterval = options.idleInterval || 250;
+        this.idleAfterFrames = options.idleAfterFrames || 45;
+        // Called with (decodeMs, text) for every decoded frame, e.g. by the benchmark page
+        this.onFrame = options.onFrame || null;
+        this.running = false;
+        this.timer = null;
+        this.missed = 0;
+        this.frameId = 0;
+        this.canvas = null;
+    }
+
+    static supported() {
+        return Boolean(window.Worker && window.createImageBitmap);
+    }
+
+    // One worker per page, kept across scans so ZXing is only loaded once
+    static worker() {
+        if (!BarcodeDecoder.workerReady) {
+            BarcodeDecoder.workerReady = new Promise((resolve, reject) => {
+                const worker = new Worker(BARCODE_WORKER_URL);
+                worker.onmessage = (event) => {
+                    if (event.data.type === 'ready') {
+                        resolve(worker);
+                    } else if (event.data.type === 'error') {
+                        BarcodeDecoder.workerReady = null;
+                        worker.terminate();
+                        reject(new Error(event.data.error));
+                    }
+                };
+                worker.postMessage({ type: 'init', libraryUrl: ZXING_LIBRARY_URL });
+            });
+        }
+        return BarcodeDecoder.workerReady;
+    }
+
+    async start() {
+        this.worker = await BarcodeDecoder.worker();
+        this.worker.onmessage = (event) => this.handleMessage(event.data);
+        this.running = true;
+        this.missed = 0;
+        this.schedule(0);
+    }
+
+    stop() {
+        this.running = false;
+        clearTimeout(this.timer);
+    }
+
+    schedule(delay) {
+        clearTimeout(this.timer);
+        this.timer = setTimeout(() => this.captureFrame(), delay);
+    }
+
+    // Video elements, or images when benchmarking with a still
+    frameSize() {
+        const sourceWidth = this.video.videoWidth || this.video.naturalWidth;
+        const sourceHeight = this.video.videoHeight || this.video.naturalHeight;
+        const scale = Math.min(1, this.maxWidth / sourceWidth);
+        return {
+            width: Math.round(sourceWidth * scale),
+            height: Math.round(sourceHeight * scale)
+        };
+    }
+
+    sourceReady() {
+        return this.video instanceof HTMLVideoElement ? this.video.readyState >= 2 : this.video.complete;
+    }
+
+    async captureFrame() {
+        if (!this.running) {
+            return;
+        }
+        // Nothing to decode while the camera warms up or the tab is in the background
+        if (!this.sourceReady() || document.hidden) {
+            this.schedule(this.idleInterval);
+            return;
+        }
+
+        const { width, height } = this.frameSize();
+        const message = { type: 'frame', id: ++this.frameId, width: width, height: height };
+        this.capturedAt = performance.now();
+        try {
+            if (window.OffscreenCanvas) {
+                // Scaled by the browser, handed to the worker without a copy
+                message.bitmap = await createImageBitmap(this.video, {
+                    resizeWidth: width, resizeHeight: height, resizeQuality: 'low'
+                });
+                this.worker.postMessage(message, [message.bitmap]);
+            } else {
+                // No canvas in workers: read the pixels here and transfer the buffer
+                if (!this.canvas) {
+                    this.canvas = document.createElement('canvas');
+                }
+                this.canvas.width = width;
+                this.canvas.height = height;
+                const context = this.canvas.getContext('2d', { willReadFrequently: true });
+                context.drawImage(this.video, 0, 0, width, height);
+                message.buffer = context.getImageData(0, 0, width, height).data.buffer;
+                this.worker.postMessage(message, [message.buffer]);
+            }
+        } catch (e) {
+            console.warn('Frame capture error:', e);
+            this.schedule(this.idleInterval);
+        }
+    }
+
+    handleMessage(message) {
+        if (message.type === 'error') {
+            console.warn('Barcode decode error:', message.error);
+            return;
+        }
+        if (!this.running || message.id !== this.frameId) {
+            return;
+        }
+
+        if (this.onFrame) {
+            this.onFrame(message.decodeMs, message.text);
+        }
+        if (message.text) {
+            this.missed = 0;
+            this.onResult(message.text);
+        } else {
+            this.missed++;
+        }
+        if (!this.running) {
+            return;
+        }
+
+        // Leave the worker some slack on slow devices, and back off while idle
+        const interval = this.missed > this.idleAfterFrames
+            ? this.idleInterval
+            : Math.max(this.minInterval, message.decodeMs * 1.5);
+        this.schedule(Math.max(0, interval - (performance.now() - this.capturedAt)));
+    }
+}
+
+// Server lookups by barcode, kept briefly so a barcode held in front of the
+// camera (or scanned again) is looked up only once
+const barcodeLookups = {
+    ttl: 60000,
+    entries: new Map(),
+
+    lookup: function(barcode) {
+        const entry = this.entries.get(barcode);
+        if (entry && entry.expires > Date.now()) {
+            return entry.promise;
+        }
+
+        const promise = fetch('/scan-barcode', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+            },
+            body: JSON.stringify({ barcode: barcode })
+        }).then(response => response.json());
+        this.entries.set(barcode, { promise: promise, expires: Date.now() + this.ttl });
+        // Let failed lookups be retried
+        promise.catch(() => this.entries.delete(barcode));
+        return promise;
+    }
+};
+
 // Start barcode scanner
 async function startBarcodeScanner() {
     try {
         // Show the modal
-        const modal = new bootstrap.Modal(document.getElementById('barcodeModal'));
+        const modal = bootstrap.Modal.getOrCreateInstance(document.getElementById('barcodeModal'));
         modal.show();
 
         // Clear any previous results
         document.getElementById('barcodeResult').innerHTML = '';
 
-        // Load ZXing library
-        const ZXing = await loadZXingLibrary();
-        
-        // Initialize code reader
-        barcodeScanner = new ZXing.BrowserMultiFormatReader();
-
         // Get video element
         const videoElement = document.getElementById('barcodeVideo');
 
+        if (!BarcodeDecoder.supported()) {
+            await startMainThreadScanner(videoElement);
+            return;
+        }
+
+        // Load ZXing into the worker before turning the camera on
+        await BarcodeDecoder.worker();
+
         // Start scanning
         try {
-            const devices = await barcodeScanner.listVideoInputDevices();
-            
-            if (devices.length === 0) {
-                throw new Error('No camera devices found');
-            }
-
             // Prefer back camera on mobile devices
-            let selectedDevice = devices[0];
-            for (const device of devices) {
-                if (device.label.toLowerCase().includes('back') || device.label.toLowerCase().includes('rear')) {
-                    selectedDevice = device;
-                    break;
-                }
-            }
-
-            // Start decoding
-            barcodeScanner.decodeFromVideoDevice(
-                selectedDevice.deviceId,
-                videoElement,
-                (result, error) => {
-                    if (result) {
-                        handleBarcodeResult(result.text);
-                    }
-                    if (error && error.name !== 'NotFoundException') {
-                        console.warn('Barcode scan error:', error);
-                    }
-                }
-            );
-
+            barcodeStream = await navigator.mediaDevices.getUserMedia({
+                video: { facingMode: { ideal: 'environment' }, width: { ideal: 1280 }, height: { ideal: 720 } }
+            });
+            videoElement.setAttribute('playsinline', '');
+            videoElement.srcObject = barcodeStream;
+            await videoElement.play();
         } catch (err) {
             console.error('Camera access error:', err);
             showBarcodeError('Camera access denied or not available. Please ensure you have granted camera permissions.');
+            return;
         }
 
+        barcodeScanner = new BarcodeDecoder(videoElement, handleBarcodeResult);
+        await barcodeScanner.start();
+
     } catch (error) {
         console.error('Barcode scanner initialization error:', error);
         showBarcodeError('Failed to initialize barcode scanner. Please try again.');
     }
 }
 
+// Decoding on the UI thread, for browsers without workers or ImageBitmap
+async function startMainThreadScanner(videoElement) {
+    // Load ZXing library
+    const ZXing = await loadZXingLibrary();
+    
+    // Initialize code reader
+    barcodeScanner = new ZXing.BrowserMultiFormatReader();
+
+    try {
+        const devices = await barcodeScanner.listVideoInputDevices();
+        
+        if (devices.length === 0) {
+            throw new Error('No camera devices found');
+        }
+
+        // Prefer back camera on mobile devices
+        let selectedDevice = devices[0];
+        for (const device of devices) {
+            if (device.label.toLowerCase().includes('back') || device.label.toLowerCase().includes('rear')) {
+                selectedDevice = device;
+                break;
+            }
+        }
+
+        // Start decoding
+        barcodeScanner.decodeFromVideoDevice(
+            selectedDevice.deviceId,
+            videoElement,
+            (result, error) => {
+                if (result) {
+                    handleBarcodeResult(result.text);
+                }
+                if (error && error.name !== 'NotFoundException') {
+                    console.warn('Barcode scan error:', error);
+                }
+            }
+        );
+
+    } catch (err) {
+        console.error('Camera access error:', err);
+        showBarcodeError('Camera access denied or not available. Please ensure you have granted camera permissions.');
+    }
+}
+
 // Handle successful barcode scan
 function handleBarcodeResult(barcode) {
     console.log('Barcode detected:', barcode);
@@ -102,14 +306,7 @@ function handleBarcodeResult(barcode) {
     `;
 
     // Send barcode to server
-    fetch('/scan-barcode', {
-        method: 'POST',
-        headers: {
-            'Content-Type': 'application/json',
-        },
-        body: JSON.stringify({ barcode: barcode })
-    })
-    .then(response => response.json())
+    barcodeLookups.lookup(barcode)
     .then(data => {
         if (data.error) {
             showBarcodeError(data.error);
@@ -189,7 +386,11 @@ function addScannedFood(foodId, foodName) {
 // Stop barcode scanner
 function stopBarcodeScanner() {
     if (barcodeScanner) {
-        barcodeScanner.reset();
+        if (barcodeScanner instanceof BarcodeDecoder) {
+            barcodeScanner.stop();
+        } else {
+            barcodeScanner.reset();
+        }
         barcodeScanner = null;
     }
     
@@ -200,6 +401,7 @@ function stopBarcodeScanner() {
         tracks.forEach(track => track.stop());
         videoElement.srcObject = null;
     }
+    barcodeStream = null;
 }
 
 // Handle modal close
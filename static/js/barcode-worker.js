@@ -0,0 +1,85 @@
+// Barcode decoding with ZXing, run in a Web Worker so camera frames are decoded
+// off the UI thread. Also loadable as a plain script (the benchmark page uses
+// it that way to compare against decoding on the main thread).
+
+const BarcodeDecodeCore = {
+    reader: null,
+    canvas: null,
+    context: null,
+
+    // Product barcodes only: fewer formats to try per frame
+    formats: ['EAN_13', 'EAN_8', 'UPC_A', 'UPC_E', 'CODE_128'],
+
+    init: function(ZXing) {
+        const hints = new Map();
+        hints.set(ZXing.DecodeHintType.POSSIBLE_FORMATS, this.formats.map(format => ZXing.BarcodeFormat[format]));
+        this.reader = new ZXing.MultiFormatReader();
+        this.reader.setHints(hints);
+    },
+
+    // RGBA pixels -> luminance, as ZXing's canvas luminance source does it
+    luminance: function(rgba, width, height) {
+        const pixels = width * height;
+        const gray = new Uint8ClampedArray(pixels);
+        for (let i = 0, j = 0; i < pixels; i++, j += 4) {
+            gray[i] = (rgba[j] * 306 + rgba[j + 1] * 601 + rgba[j + 2] * 117) >> 10;
+        }
+        return gray;
+    },
+
+    // Pixels of an ImageBitmap, drawn on a reused OffscreenCanvas
+    bitmapPixels: function(bitmap) {
+        if (!this.canvas || this.canvas.width !== bitmap.width || this.canvas.height !== bitmap.height) {
+            this.canvas = new OffscreenCanvas(bitmap.width, bitmap.height);
+            this.context = this.canvas.getContext('2d', { willReadFrequently: true });
+        }
+        this.context.drawImage(bitmap, 0, 0);
+        bitmap.close();
+        return this.context.getImageData(0, 0, this.canvas.width, this.canvas.height).data;
+    },
+
+    // Decode one frame; returns the barcode text or null
+    decode: function(ZXing, rgba, width, height) {
+        const source = new ZXing.RGBLuminanceSource(this.luminance(rgba, width, height), width, height);
+        try {
+            return this.reader.decodeWithState(new ZXing.BinaryBitmap(new ZXing.HybridBinarizer(source))).getText();
+        } catch (e) {
+            // NotFound/Checksum/Format exceptions just mean no barcode in this frame
+            return null;
+        } finally {
+            this.reader.reset();
+        }
+    }
+};
+
+if (typeof WorkerGlobalScope !== 'undefined' && self instanceof WorkerGlobalScope) {
+    self.onmessage = function(event) {
+        const message = event.data;
+
+        if (message.type === 'init') {
+            try {
+                importScripts(message.libraryUrl);
+                BarcodeDecodeCore.init(self.ZXing);
+                self.postMessage({ type: 'ready' });
+            } catch (e) {
+                self.postMessage({ type: 'error', error: `Failed to load ZXing library: ${e.message}` });
+            }
+            return;
+        }
+
+        if (message.type === 'frame') {
+            const start = performance.now();
+            let text = null;
+            try {
+                // Frames arrive either as a transferred ImageBitmap or as a transferred RGBA buffer
+                const rgba = message.bitmap
+                    ? BarcodeDecodeCore.bitmapPixels(message.bitmap)
+                    : new Uint8ClampedArray(message.buffer);
+                text = BarcodeDecodeCore.decode(self.ZXing, rgba, message.width, message.height);
+            } catch (e) {
+                self.postMessage({ type: 'error', error: e.message });
+            }
+            self.postMessage({ type: 'result', id: message.id, text: text, decodeMs: performance.now() - start });
+        }
+    };
+}
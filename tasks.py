@@ -0,0 +1,60 @@
+from app import db
+from models import Food
+from services.food_api import OpenFoodFactsAPI
+from services.food_log_partitions import FoodLogPartitions
+from services.food_log_recompute import FoodLogRecompute, NUTRIENT_COLUMNS
+from services.job_queue import JobQueue
+from services.search_cache import SearchCache
+from services.session_store import SessionStore
+from services.weight_import import WeightImport
+
+@JobQueue.task('food_logs.recompute', timeout=3600)
+def recompute_food_logs(food_id=None):
+    """Recompute stored FoodLog nutrition, e.g. after food data was corrected"""
+    FoodLogRecompute.recompute(food_id=food_id)
+
+@JobQueue.task('food_logs.ensure_partitions', every=86400)
+def ensure_food_log_partitions():
+    """Create upcoming monthly food_logs partitions"""
+    FoodLogPartitions.ensure_partitions()
+
+@JobQueue.task('foods.enrich', timeout=120)
+def enrich_foods(food_ids):
+    """Fill in nutrition values missing from Open Food Facts search results from the full product"""
+    foods = Food.query.filter(Food.id.in_(food_ids), Food.barcode.isnot(None)).all()
+    for food in foods:
+        food_data = OpenFoodFactsAPI.get_product_by_barcode(food.barcode)
+        if not food_data:
+            continue
+
+        changed = False
+        for column in NUTRIENT_COLUMNS.values():
+            if getattr(food, column) is None and food_data[column] is not None:
+                setattr(food, column, food_data[column])
+                changed = True
+        db.session.commit()
+
+        # Logs of the food were computed with the missing values as zero
+        if changed:
+            SearchCache.invalidate([food.name])
+            FoodLogRecompute.recompute(food_id=food.id)
+
+@JobQueue.task('weights.import', max_attempts=1, timeout=3600)
+def import_weights(upload_id):
+    """Import an uploaded weight export, then delete the upload"""
+    WeightImport.import_upload(upload_id)
+
+@JobQueue.task('weights.purge_uploads', every=86400)
+def purge_weight_uploads():
+    """Delete weight uploads whose import job never finished"""
+    WeightImport.purge_uploads()
+
+@JobQueue.task('jobs.purge', every=86400)
+def purge_jobs():
+    """Delete finished jobs older than JOB_RETENTION_DAYS"""
+    JobQueue.purge()
+
+@JobQueue.task('sessions.gc', every=3600, timeout=600)
+def collect_sessions():
+    """Delete expired sessions and the OAuth tokens left behind by them"""
+    SessionStore.gc()
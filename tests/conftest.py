@@ -0,0 +1,100 @@
+import os
+import tempfile
+from datetime import date, timedelta
+
+import pytest
+
+_TMP_DIR = tempfile.mkdtemp(prefix='nutritracker-tests-')
+
+# app.py reads its configuration at import, so the environment comes first
+os.environ.update({
+    'DATABASE_URL': f"sqlite:///{os.path.join(_TMP_DIR, 'test.db')}",
+    'SESSION_SECRET': 'test-secret',
+    'REPL_ID': 'test-repl',
+    'JOB_WORKER_THREADS': '0',
+    'FOOD_MATRIX_REFRESH': '0',
+    'METRICS_DIR': os.path.join(_TMP_DIR, 'metrics'),
+    'SEARCH_CACHE_PATH': os.path.join(_TMP_DIR, 'search-cache.sqlite3'),
+    'FOOD_MATRIX_DIR': os.path.join(_TMP_DIR, 'food-matrix'),
+})
+os.environ.pop('DATABASE_REPLICA_URL', None)
+
+import main  # noqa: E402,F401  (registers routes, commands and tasks)
+from app import app as flask_app, db as flask_db  # noqa: E402
+from models import Food, FoodLog, OAuth, User, WeightEntry  # noqa: E402
+from services.fragment_cache import FragmentCache  # noqa: E402
+from services.search_cache import SearchCache  # noqa: E402
+
+TEST_USER_ID = 'test-user'
+
+@pytest.fixture(scope='session')
+def app():
+    flask_app.config['TESTING'] = True
+    return flask_app
+
+@pytest.fixture
+def db(app):
+    """
+    Empty tables for every test, in an application context
+    """
+    with app.app_context():
+        flask_db.drop_all()
+        flask_db.create_all()
+        SearchCache.clear()
+        FragmentCache.invalidate_user(TEST_USER_ID)
+        yield flask_db
+        flask_db.session.remove()
+
+@pytest.fixture
+def strict_query_budgets(app):
+    """
+    Make every @query_budget view raise QueryBudgetExceeded when it overruns its budget
+    """
+    previous = app.config['QUERY_BUDGET_MODE']
+    app.config['QUERY_BUDGET_MODE'] = 'raise'
+    yield
+    app.config['QUERY_BUDGET_MODE'] = previous
+
+@pytest.fixture
+def seeded(db):
+    """
+    A user with a profile, foods, a week of food logs and weight entries
+    """
+    user = User(id=TEST_USER_ID, email='test@example.com', age=30, gender='female', height=170,
+                activity_level='moderate', goal='maintain', daily_calorie_goal=2000)
+    db.session.add(user)
+    db.session.add(OAuth(user_id=user.id, browser_session_key='test-browser', provider='replit_auth',
+                         token={'access_token': 'test', 'expires_in': 3600}))
+    foods = [
+        Food(name='Banana', barcode='0000000000017', calories_per_100g=89, protein_per_100g=1.1,
+             carbs_per_100g=22.8, fat_per_100g=0.3),
+        Food(name='Greek yogurt', calories_per_100g=97, protein_per_100g=9, carbs_per_100g=3.9,
+             fat_per_100g=5),
+        Food(name='Chicken breast', calories_per_100g=165, protein_per_100g=31, carbs_per_100g=0,
+             fat_per_100g=3.6),
+    ]
+    db.session.add_all(foods)
+    db.session.flush()
+
+    today = date.today()
+    for day in range(7):
+        for meal_type, food in zip(('breakfast', 'lunch', 'dinner', 'snack'), foods + foods[:1]):
+            db.session.add(FoodLog(user_id=user.id, food_id=food.id, quantity=150, meal_type=meal_type,
+                                   log_date=today - timedelta(days=day),
+                                   calories=food.calories_per_100g * 1.5, protein=food.protein_per_100g * 1.5,
+                                   carbs=food.carbs_per_100g * 1.5, fat=food.fat_per_100g * 1.5))
+        db.session.add(WeightEntry(user_id=user.id, weight=70 - day * 0.1, entry_date=today - timedelta(days=day)))
+    db.session.commit()
+    return {'user_id': user.id, 'food_ids': [food.id for food in foods]}
+
+@pytest.fixture
+def client(app, seeded):
+    """
+    Test client signed in as the seeded user
+    """
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = seeded['user_id']
+        session['_fresh'] = True
+        session['_browser_session_key'] = 'test-browser'
+    return client
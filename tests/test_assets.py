@@ -0,0 +1,60 @@
+import gzip
+import hashlib
+
+import pytest
+from werkzeug.datastructures import Accept
+
+from services.assets import AssetPipeline
+
+SCRIPT = b'console.log("dashboard");\n'
+
+@pytest.fixture
+def static_folder(app, tmp_path, monkeypatch):
+    """
+    A static folder with one built script and one unbuilt stylesheet
+    """
+    (tmp_path / 'js').mkdir()
+    (tmp_path / 'js' / 'app.js').write_bytes(SCRIPT)
+    AssetPipeline.build(str(tmp_path))
+    (tmp_path / 'css').mkdir()
+    (tmp_path / 'css' / 'new.css').write_text('body {}\n')
+
+    monkeypatch.setattr(app, 'static_folder', str(tmp_path))
+    monkeypatch.setattr(AssetPipeline, '_manifest', {})
+    monkeypatch.setattr(AssetPipeline, '_manifest_mtime', None)
+    return tmp_path
+
+def test_url_points_at_the_fingerprinted_file(app, static_folder):
+    digest = hashlib.sha256(SCRIPT).hexdigest()[:12]
+
+    with app.test_request_context():
+        assert AssetPipeline.url('js/app.js') == f'/assets/js/app.{digest}.js'
+        # Not built yet: served as is
+        assert AssetPipeline.url('css/new.css') == '/static/css/new.css'
+
+@pytest.mark.parametrize('accept, variants, expected', [
+    ([('br', 1), ('gzip', 1)], ['.br', '.gz'], ('app.js.br', 'br')),
+    ([('br', 0), ('gzip', 1)], ['.br', '.gz'], ('app.js.gz', 'gzip')),
+    ([('br', 1), ('gzip', 1)], ['.gz'], ('app.js.gz', 'gzip')),
+    ([('identity', 1)], ['.br', '.gz'], ('app.js', None)),
+    ([], ['.br', '.gz'], ('app.js', None)),
+])
+def test_negotiate_prefers_brotli_then_gzip(tmp_path, accept, variants, expected):
+    (tmp_path / 'app.js').write_bytes(SCRIPT)
+    for suffix in variants:
+        (tmp_path / f'app.js{suffix}').write_bytes(b'compressed')
+
+    assert AssetPipeline.negotiate(tmp_path, 'app.js', Accept(accept)) == expected
+
+def test_fingerprinted_asset_is_served_compressed_and_immutable(app, static_folder):
+    client = app.test_client()
+    with app.test_request_context():
+        url = AssetPipeline.url('js/app.js')
+
+    response = client.get(url, headers={'Accept-Encoding': 'gzip'})
+
+    assert response.status_code == 200
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(response.data) == SCRIPT
+    assert 'immutable' in response.headers['Cache-Control']
+    assert 'Accept-Encoding' in response.headers['Vary']
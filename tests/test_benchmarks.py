@@ -0,0 +1,40 @@
+import json
+
+import pytest
+
+from tools.benchmarks import Benchmarks
+
+def _results(**medians):
+    return {'benchmarks': {name: {'loops': 1, 'min_us': median, 'median_us': median}
+                           for name, median in medians.items()}}
+
+@pytest.mark.parametrize('current, regressed', [
+    (100.0, False),
+    (110.0, False),
+    (111.0, True),
+    (50.0, False),
+])
+def test_compare_flags_slowdowns_over_the_threshold(current, regressed):
+    lines, regressions = Benchmarks.compare(_results(summary=current), _results(summary=100.0), threshold=0.10)
+
+    assert regressions == (['summary'] if regressed else [])
+    assert lines[0].endswith('REGRESSION') == regressed
+
+def test_compare_reports_new_benchmarks_without_flagging_them():
+    lines, regressions = Benchmarks.compare(_results(summary=100.0, search=5.0), _results(summary=100.0))
+
+    assert regressions == []
+    assert lines[1] == 'search: 5.0 us (no baseline)'
+
+def test_compare_command_fails_on_a_regression(app, tmp_path):
+    current, baseline = tmp_path / 'current.json', tmp_path / 'baseline.json'
+    current.write_text(json.dumps(_results(summary=130.0, search=5.0)))
+    baseline.write_text(json.dumps(_results(summary=100.0, search=5.0)))
+    runner = app.test_cli_runner()
+
+    failed = runner.invoke(args=['benchmark', 'compare', str(current), str(baseline)])
+    passed = runner.invoke(args=['benchmark', 'compare', str(current), str(baseline), '--threshold', '0.5'])
+
+    assert failed.exit_code == 1
+    assert '1 benchmark(s) regressed by more than 10%: summary' in failed.output
+    assert passed.exit_code == 0
@@ -0,0 +1,46 @@
+import pytest
+from sqlalchemy import event
+
+from services.nutrition_calculator import NutritionCalculator
+
+ENDPOINTS = [
+    ('/api/nutrition/summary', 'get_daily_nutrition_summary'),
+    ('/api/weight/progress?days=7', 'get_weight_progress'),
+]
+
+@pytest.mark.parametrize('url, builder', ENDPOINTS)
+def test_matching_etag_answers_304_without_the_summary_queries(db, client, monkeypatch, url, builder):
+    first = client.get(url)
+    assert first.status_code == 200
+    etag = first.headers['ETag']
+
+    def fail(*args, **kwargs):
+        raise AssertionError(f"{builder} ran for a 304")
+
+    monkeypatch.setattr(NutritionCalculator, builder, fail)
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        second = client.get(url, headers={'If-None-Match': etag})
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+
+    assert second.status_code == 304
+    assert second.data == b''
+    assert second.headers['ETag'] == etag
+    assert not [statement for statement in statements
+                if 'food_logs' in statement or 'weight_entries' in statement]
+
+@pytest.mark.parametrize('url, builder', ENDPOINTS)
+def test_data_change_invalidates_the_etag(client, url, builder):
+    etag = client.get(url).headers['ETag']
+
+    client.post('/add-weight', data={'weight': '71.5'})
+
+    response = client.get(url, headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
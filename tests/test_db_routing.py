@@ -0,0 +1,107 @@
+import time
+
+import pytest
+from flask import Flask
+from sqlalchemy import func, insert, select
+
+import db_routing
+from app import db
+from db_routing import REPLICA_BIND, read_replica
+from models import Food
+
+@pytest.fixture
+def routed_app(tmp_path):
+    """
+    An app whose primary and replica are separate SQLite files, each holding one
+    food named after its database
+    """
+    had_replica_metadata = REPLICA_BIND in db.metadatas
+    app = Flask(__name__)
+    app.secret_key = 'test-secret'
+    app.config.update(
+        TESTING=True,
+        SQLALCHEMY_DATABASE_URI=f"sqlite:///{tmp_path / 'primary.db'}",
+        SQLALCHEMY_BINDS={REPLICA_BIND: f"sqlite:///{tmp_path / 'replica.db'}"},
+    )
+    db.init_app(app)
+    db_routing.init_app(app)
+
+    @app.route('/read')
+    @read_replica
+    def read():
+        return db.session.execute(select(Food.name).order_by(Food.id)).scalar()
+
+    @app.route('/read-after-write', methods=['POST'])
+    @read_replica
+    def read_after_write():
+        db.session.add(Food(name='written'))
+        db.session.flush()
+        name = db.session.execute(select(Food.name).order_by(Food.id)).scalar()
+        db.session.commit()
+        return name
+
+    @app.route('/autoflush', methods=['POST'])
+    @read_replica
+    def autoflush():
+        db.session.add(Food(name='pending'))
+        # The query autoflushes the pending food first
+        count = db.session.execute(select(func.count(Food.id)).where(Food.name == 'pending')).scalar()
+        db.session.commit()
+        return str(count)
+
+    @app.route('/write', methods=['POST'])
+    def write():
+        db.session.add(Food(name='written'))
+        db.session.commit()
+        return 'ok'
+
+    with app.app_context():
+        db.create_all()
+        db.metadata.create_all(db.engines[REPLICA_BIND])
+        for bind, name in ((None, 'primary'), (REPLICA_BIND, 'replica')):
+            with db.engines[bind].begin() as connection:
+                connection.execute(insert(Food).values(name=name))
+    yield app
+
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose()
+    # init_app registered a metadata for the replica bind, which the main app does not have
+    if not had_replica_metadata:
+        db.metadatas.pop(REPLICA_BIND, None)
+
+def _names(app, bind):
+    with app.app_context(), db.engines[bind].connect() as connection:
+        return set(connection.execute(select(Food.name)).scalars())
+
+def test_read_replica_views_read_from_the_replica(routed_app):
+    assert routed_app.test_client().get('/read').text == 'replica'
+
+def test_writes_go_to_the_primary(routed_app):
+    routed_app.test_client().post('/write')
+
+    assert _names(routed_app, None) == {'primary', 'written'}
+    assert _names(routed_app, REPLICA_BIND) == {'replica'}
+
+def test_read_replica_view_writes_and_later_reads_use_the_primary(routed_app):
+    assert routed_app.test_client().post('/read-after-write').text == 'primary'
+    assert _names(routed_app, None) == {'primary', 'written'}
+    assert _names(routed_app, REPLICA_BIND) == {'replica'}
+
+def test_autoflush_in_read_replica_view_goes_to_the_primary(routed_app):
+    assert routed_app.test_client().post('/autoflush').text == '1'
+    assert _names(routed_app, None) == {'primary', 'pending'}
+    assert _names(routed_app, REPLICA_BIND) == {'replica'}
+
+def test_reads_stay_on_the_primary_shortly_after_a_write(routed_app, monkeypatch):
+    client = routed_app.test_client()
+    client.post('/write')
+    assert client.get('/read').text == 'primary'
+
+    later = time.time() + db_routing.READ_YOUR_WRITES_SECONDS + 1
+    monkeypatch.setattr(db_routing.time, 'time', lambda: later)
+    assert client.get('/read').text == 'replica'
+
+def test_other_clients_keep_reading_from_the_replica_after_a_write(routed_app):
+    routed_app.test_client().post('/write')
+    assert routed_app.test_client().get('/read').text == 'replica'
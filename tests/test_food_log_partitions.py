@@ -0,0 +1,72 @@
+from contextlib import contextmanager
+from datetime import date
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy.dialects import postgresql
+
+import app as app_module
+from services.food_log_partitions import FoodLogPartitions
+
+class RecordingEngine:
+    """
+    Stands in for a PostgreSQL engine: records statements, and lists one index per table
+    """
+
+    dialect = postgresql.dialect()
+
+    def __init__(self):
+        self.statements = []
+
+    @contextmanager
+    def connect(self):
+        yield self
+
+    begin = connect
+
+    def execute(self, statement, parameters=None):
+        self.statements.append(str(statement))
+        return SimpleNamespace(scalars=lambda: SimpleNamespace(all=lambda: [f"{parameters['table']}_pkey"]))
+
+@pytest.fixture
+def postgresql_engine(monkeypatch):
+    engine = RecordingEngine()
+    monkeypatch.setattr(app_module, 'db', SimpleNamespace(engine=engine))
+    monkeypatch.setattr(FoodLogPartitions, 'is_supported', lambda bind: True)
+    monkeypatch.setattr(FoodLogPartitions, 'partitions', lambda bind: [
+        {'name': 'food_logs_2020_01', 'month': date(2020, 1, 1), 'tablespace': None, 'access_method': 'heap'},
+        {'name': 'food_logs_2020_02', 'month': date(2020, 2, 1), 'tablespace': 'archive', 'access_method': 'heap'},
+        {'name': 'food_logs_default', 'month': None, 'tablespace': None, 'access_method': 'heap'},
+        {'name': f"food_logs_{date.today():%Y_%m}", 'month': date.today().replace(day=1),
+         'tablespace': None, 'access_method': 'heap'},
+    ])
+    return engine
+
+def test_archive_only_moves_old_partitions_to_the_tablespace(postgresql_engine):
+    archived = FoodLogPartitions.archive(24, tablespace='archive')
+
+    assert archived == ['food_logs_2020_01']
+    alters = [statement for statement in postgresql_engine.statements if statement.startswith('ALTER')]
+    assert alters == [
+        'ALTER TABLE food_logs_2020_01 SET TABLESPACE archive',
+        'ALTER INDEX food_logs_2020_01_pkey SET TABLESPACE archive',
+    ]
+    # Columnar partitions would reject the UPDATEs of recomputes and DELETEs of food logs
+    assert not any('ACCESS METHOD' in statement for statement in postgresql_engine.statements)
+
+def test_archive_needs_a_tablespace(postgresql_engine):
+    with pytest.raises(ValueError):
+        FoodLogPartitions.archive(24, tablespace='')
+
+def test_archive_needs_postgresql(db):
+    with pytest.raises(ValueError, match='PostgreSQL'):
+        FoodLogPartitions.archive(24, tablespace='archive')
+
+def test_archive_command_offers_no_access_method(app, postgresql_engine):
+    result = app.test_cli_runner().invoke(args=[
+        'food-logs', 'archive', '--tablespace', 'archive', '--access-method', 'columnar'
+    ])
+
+    assert result.exit_code != 0
+    assert 'No such option' in result.output
+    assert postgresql_engine.statements == []
@@ -0,0 +1,67 @@
+from datetime import date
+
+import pytest
+from sqlalchemy import select, update
+
+from models import Food, FoodLog, User
+from services.food_log_recompute import FoodLogRecompute
+
+def _data_versions(db):
+    return dict(db.session.execute(select(User.id, User.data_version)).all())
+
+def _calories(db, food_id):
+    return db.session.execute(
+        select(FoodLog.calories).where(FoodLog.food_id == food_id).order_by(FoodLog.id)
+    ).scalars().all()
+
+@pytest.fixture
+def other_user(db, seeded):
+    """
+    A second user who only logged chicken
+    """
+    chicken_id = seeded['food_ids'][2]
+    db.session.add(User(id='other-user'))
+    db.session.add(FoodLog(user_id='other-user', food_id=chicken_id, quantity=200, meal_type='dinner',
+                           log_date=date.today(), calories=330.0))
+    db.session.commit()
+    # Bring every log up to date: the seeded ones leave fiber, sugar and sodium empty
+    FoodLogRecompute.recompute()
+    return 'other-user'
+
+@pytest.mark.parametrize('batch_size', [1, 5, 28, 1000])
+def test_every_log_is_recomputed_across_chunk_boundaries(db, seeded, batch_size):
+    db.session.execute(update(Food).values(calories_per_100g=Food.calories_per_100g + 10))
+    db.session.commit()
+
+    stats = FoodLogRecompute.recompute(batch_size=batch_size)
+
+    assert stats['scanned'] == stats['updated'] == 28
+    assert stats['batches'] == -(-28 // batch_size)
+    for food_id, calories in zip(seeded['food_ids'], (99, 107, 175)):
+        assert _calories(db, food_id) == pytest.approx([calories * 1.5] * len(_calories(db, food_id)))
+
+def test_current_logs_are_not_rewritten(db, other_user):
+    versions = _data_versions(db)
+
+    stats = FoodLogRecompute.recompute(batch_size=5)
+
+    assert stats['scanned'] == 29
+    assert stats['updated'] == 0
+    assert _data_versions(db) == versions
+
+def test_food_id_limits_the_recompute_and_the_version_bumps(db, seeded, other_user):
+    banana_id, _, chicken_id = seeded['food_ids']
+    # A correction to banana, and stale chicken logs that are out of scope, one between banana logs
+    db.session.execute(update(Food).where(Food.id == banana_id).values(calories_per_100g=100))
+    db.session.execute(update(FoodLog).where(FoodLog.food_id == chicken_id).values(calories=1.0))
+    db.session.commit()
+    versions = _data_versions(db)
+
+    stats = FoodLogRecompute.recompute(food_id=banana_id, batch_size=3)
+
+    assert stats['scanned'] == stats['updated'] == 14
+    assert _calories(db, banana_id) == [150.0] * 14
+    assert _calories(db, chicken_id) == [1.0] * 8
+    after = _data_versions(db)
+    assert after[seeded['user_id']] > versions[seeded['user_id']]
+    assert after[other_user] == versions[other_user]
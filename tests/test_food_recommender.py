@@ -0,0 +1,89 @@
+import numpy as np
+import pytest
+from sqlalchemy import update
+
+from models import Food
+from services.food_log_recompute import FoodLogRecompute
+from services.food_recommender import MACROS, FoodRecommender
+
+REMAINING = {'calories': 1400.0, 'protein': 60.0, 'carbs': 150.0, 'fat': 1.0}
+
+@pytest.fixture
+def matrix_dir(tmp_path, monkeypatch):
+    """
+    An empty matrix directory, and no matrix mapped by this process
+    """
+    monkeypatch.setattr(FoodRecommender, 'MATRIX_DIR', tmp_path)
+    monkeypatch.setattr(FoodRecommender, '_mapped', None)
+    monkeypatch.setattr(FoodRecommender, '_mapped_arrays', None)
+    monkeypatch.setattr(FoodRecommender, '_meta_mtime', None)
+    return tmp_path
+
+def _brute_force(nutrients, remaining):
+    """
+    score() spelled out row by row in float64: the least squares portion, clipped,
+    and the squared misses of every macro at that portion
+    """
+    target = np.array([remaining[macro] for macro in MACROS], dtype=np.float64)
+    if target[0] > FoodRecommender.MEAL_CALORIES:
+        target *= FoodRecommender.MEAL_CALORIES / target[0]
+    target = np.maximum(target, FoodRecommender.REMAINING_FLOOR)
+
+    grams, scores = [], []
+    for row in nutrients.astype(np.float64):
+        per_gram = row / 100 / target
+        portion, *_ = np.linalg.lstsq(per_gram[:, None], np.ones(len(MACROS)), rcond=None)
+        portion = min(max(portion[0], FoodRecommender.MIN_PORTION), FoodRecommender.MAX_PORTION)
+        misses = portion * per_gram - 1
+        misses[0] *= FoodRecommender.OVERSHOOT_WEIGHT if misses[0] > 0 else 1
+        grams.append(portion)
+        scores.append(np.sum(misses ** 2))
+    return np.array(grams), np.array(scores)
+
+@pytest.mark.parametrize('remaining', [REMAINING, {'calories': 300.0, 'protein': 0.0, 'carbs': 40.0, 'fat': 12.0}])
+def test_score_matches_brute_force(remaining):
+    rng = np.random.default_rng(7)
+    nutrients = np.column_stack([
+        rng.uniform(5, 900, 5000), rng.uniform(0, 90, 5000), rng.uniform(0, 100, 5000), rng.uniform(0, 100, 5000),
+    ]).astype(np.float32)
+
+    grams, scores = FoodRecommender.score(nutrients, remaining)
+    expected_grams, expected_scores = _brute_force(nutrients, remaining)
+
+    np.testing.assert_allclose(grams, expected_grams, rtol=1e-5)
+    np.testing.assert_allclose(scores, expected_scores, rtol=1e-5, atol=1e-5)
+
+def test_refresh_appends_new_foods_and_rewrites_changed_ones(db, seeded, matrix_dir, monkeypatch):
+    monkeypatch.setattr(FoodRecommender, 'CLOCK_SKEW', 0)
+    assert FoodRecommender.refresh()['rows'] == 3
+
+    banana = db.session.get(Food, seeded['food_ids'][0])
+    banana.protein_per_100g = 5.0
+    db.session.add(Food(name='Oats', calories_per_100g=389, protein_per_100g=17, carbs_per_100g=66,
+                        fat_per_100g=7))
+    db.session.commit()
+    stats = FoodRecommender.refresh()
+
+    assert (stats['rows'], stats['added'], stats['updated']) == (4, 1, 1)
+    ids, nutrients = FoodRecommender._matrix()
+    assert nutrients[list(ids).index(banana.id)][1] == 5.0
+
+def test_recent_refresh_by_another_process_is_not_repeated(db, seeded, matrix_dir):
+    FoodRecommender.refresh()
+    db.session.add(Food(name='Oats', calories_per_100g=389))
+    db.session.commit()
+
+    assert FoodRecommender.refresh(max_age=300)['added'] == 0
+    assert FoodRecommender.refresh()['added'] == 1
+
+def test_recompute_updates_the_matrix(db, seeded, matrix_dir):
+    FoodRecommender.build()
+    food_id = seeded['food_ids'][1]
+    # A correction made directly in SQL
+    db.session.execute(update(Food).where(Food.id == food_id).values(fat_per_100g=0.4))
+    db.session.commit()
+
+    FoodLogRecompute.recompute(food_id=food_id)
+
+    ids, nutrients = FoodRecommender._matrix()
+    assert nutrients[list(ids).index(food_id)][3] == pytest.approx(0.4)
@@ -0,0 +1,95 @@
+from collections import OrderedDict
+from datetime import date
+from types import SimpleNamespace
+
+import pytest
+
+from services.data_version import DataVersion, data_changed
+from services.fragment_cache import FragmentCache
+
+TEMPLATE = 'partials/dashboard_meal_breakdown.html'
+
+@pytest.fixture
+def cache(app, monkeypatch):
+    """
+    An empty fragment cache, rendering inside an app context
+    """
+    monkeypatch.setattr(FragmentCache, '_entries', OrderedDict())
+    monkeypatch.setattr(FragmentCache, '_user_keys', {})
+    monkeypatch.setattr(FragmentCache, '_bytes', 0)
+    monkeypatch.setattr(FragmentCache, '_stats', dict.fromkeys(FragmentCache._stats, 0))
+    with app.app_context():
+        yield FragmentCache
+
+def _render(user, renders, meals=('breakfast',)):
+    """
+    The meal breakdown fragment of ``user``, counting context builds in ``renders``
+    """
+    def context():
+        renders.append(user.id)
+        return {'nutrition': {'meal_breakdown': {meal: {'calories': 100} for meal in meals}}}
+
+    return FragmentCache.get_or_render('meal_breakdown', user, date(2024, 1, 31), TEMPLATE, context)
+
+def test_hit_skips_the_context(cache):
+    user = SimpleNamespace(id='a', data_version=1)
+    renders = []
+
+    first = _render(user, renders)
+    second = _render(user, renders)
+
+    assert second == first
+    assert renders == ['a']
+    assert cache.stats()['hits'] == 1
+
+def test_data_version_bump_is_a_miss(cache):
+    user = SimpleNamespace(id='a', data_version=1)
+    renders = []
+    _render(user, renders)
+
+    user.data_version = 2
+    _render(user, renders)
+
+    assert renders == ['a', 'a']
+
+def test_data_changed_drops_only_that_users_fragments(cache):
+    a, b = SimpleNamespace(id='a', data_version=1), SimpleNamespace(id='b', data_version=1)
+    renders = []
+    _render(a, renders)
+    _render(b, renders)
+
+    data_changed.send(DataVersion, user_ids=['a'])
+
+    assert cache.stats()['invalidations'] == 1
+    _render(a, renders)
+    _render(b, renders)
+    assert renders == ['a', 'b', 'a']
+
+def test_least_recently_used_fragments_are_evicted_to_fit_the_budget(cache, monkeypatch):
+    users = [SimpleNamespace(id=user_id, data_version=1) for user_id in 'abc']
+    renders = []
+    size = len(_render(users[0], renders).encode('utf-8'))
+    monkeypatch.setattr(FragmentCache, 'MAX_BYTES', 2 * size)
+
+    _render(users[1], renders)
+    _render(users[0], renders)
+    _render(users[2], renders)
+
+    stats = cache.stats()
+    assert stats['evictions'] == 1
+    assert stats['entries'] == 2
+    assert stats['bytes'] == 2 * size
+    _render(users[0], renders)
+    _render(users[1], renders)
+    assert renders == ['a', 'b', 'c', 'b']
+
+def test_fragment_over_the_budget_is_not_cached(cache, monkeypatch):
+    monkeypatch.setattr(FragmentCache, 'MAX_BYTES', 10)
+    user = SimpleNamespace(id='a', data_version=1)
+    renders = []
+
+    _render(user, renders)
+    _render(user, renders)
+
+    assert renders == ['a', 'a']
+    assert cache.stats()['bytes'] == 0
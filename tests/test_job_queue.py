@@ -0,0 +1,88 @@
+from datetime import datetime, timedelta
+
+from models import Job
+from services.job_queue import JobQueue
+
+def _expire_lease(db, job_id):
+    db.session.get(Job, job_id).locked_until = datetime.now() - timedelta(seconds=1)
+    db.session.commit()
+
+def test_expired_lease_is_claimed_again_while_attempts_remain(db):
+    job = JobQueue.enqueue('food_logs.recompute', {'food_id': 1})
+    db.session.commit()
+
+    assert JobQueue.claim('worker-1').id == job.id
+    _expire_lease(db, job.id)
+
+    reclaimed = JobQueue.claim('worker-2')
+    assert reclaimed.id == job.id
+    assert reclaimed.attempts == 2
+    assert reclaimed.locked_by == 'worker-2'
+
+def test_expired_lease_on_the_last_attempt_fails_the_job(db):
+    # weights.import allows a single attempt
+    job = JobQueue.enqueue('weights.import', {'upload_id': 'missing'})
+    db.session.commit()
+
+    assert JobQueue.claim('worker-1').id == job.id
+    _expire_lease(db, job.id)
+
+    assert JobQueue.claim('worker-2') is None
+    job = db.session.get(Job, job.id, populate_existing=True)
+    assert job.status == 'failed'
+    assert job.attempts == 1
+    assert job.finished_at is not None
+    assert 'Lease expired' in job.last_error
+
+def test_running_job_with_a_live_lease_is_not_claimed(db):
+    JobQueue.enqueue('food_logs.recompute', {})
+    db.session.commit()
+
+    assert JobQueue.claim('worker-1') is not None
+    assert JobQueue.claim('worker-2') is None
+
+def test_periodic_purge_deletes_old_finished_jobs(app, db):
+    old = JobQueue.enqueue('food_logs.recompute', {'food_id': 1})
+    recent = JobQueue.enqueue('food_logs.recompute', {'food_id': 2})
+    old.status = recent.status = 'done'
+    old.finished_at = datetime.now() - timedelta(days=JobQueue.RETENTION_DAYS + 1)
+    recent.finished_at = datetime.now()
+    db.session.commit()
+    recent_id = recent.id
+
+    assert 'jobs.purge' in JobQueue._periodic
+    JobQueue.work(app, once=True)
+
+    assert [job.id for job in Job.query.filter_by(name='food_logs.recompute')] == [recent_id]
+    assert Job.query.filter_by(name='jobs.purge').one().status == 'done'
+
+class _RecordingStop:
+    """
+    Stop event that records the waits between polls and stops after ``polls``
+    """
+
+    def __init__(self, polls, on_wait=None):
+        self.waits = []
+        self.polls = polls
+        self.on_wait = on_wait
+
+    def is_set(self):
+        return len(self.waits) >= self.polls
+
+    def wait(self, seconds):
+        self.waits.append(seconds)
+        if self.on_wait:
+            self.on_wait(len(self.waits))
+
+def test_idle_worker_backs_off_and_resets_on_a_job(app, db, monkeypatch):
+    monkeypatch.setattr(JobQueue, '_periodic', {})
+
+    def enqueue_after_the_third_wait(waits):
+        if waits == 3:
+            JobQueue.enqueue('food_logs.recompute', {'food_id': 1})
+            db.session.commit()
+
+    stop = _RecordingStop(8, enqueue_after_the_third_wait)
+    assert JobQueue.work(app, stop=stop, poll_interval=2.0) == 1
+
+    assert stop.waits == [2.0, 4.0, 8.0, 2.0, 4.0, 8.0, 16.0, JobQueue.MAX_POLL_INTERVAL]
@@ -0,0 +1,20 @@
+import pytest
+
+from tools.load_test import percentile
+
+@pytest.mark.parametrize('pct, expected', [
+    (10, 1),
+    (50, 5),
+    (90, 9),
+    (95, 10),
+    (100, 10),
+    (0, 1),
+])
+def test_percentile_uses_nearest_rank(pct, expected):
+    assert percentile(list(range(10, 0, -1)), pct) == expected
+
+def test_percentile_of_exact_rank_is_not_rounded_up():
+    assert percentile(list(range(1, 101)), 7) == 7
+
+def test_percentile_of_nothing_is_zero():
+    assert percentile([], 99) == 0.0
@@ -0,0 +1,52 @@
+import json
+import subprocess
+
+import pytest
+
+from services.metrics import PerformanceMetrics
+
+@pytest.fixture
+def metrics_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(PerformanceMetrics, 'METRICS_DIR', tmp_path)
+    monkeypatch.setattr(PerformanceMetrics, '_snapshot_pid', None)
+    return tmp_path
+
+def _dead_pid():
+    process = subprocess.Popen(['true'])
+    process.wait()
+    return process.pid
+
+def _sample(text, line_start):
+    return [line for line in text.splitlines() if line.startswith(line_start)]
+
+def test_exited_worker_counters_are_kept(metrics_dir):
+    (metrics_dir / f'metrics-{_dead_pid()}-deadbeef.json').write_text(json.dumps({
+        'histograms': [['nutritracker_job_duration_seconds', [['job', 'dead.job']], [1] * 12 + [0, 0.5, 12]]],
+        'counters': [['nutritracker_jobs_total', [['job', 'dead.job'], ['outcome', 'done']], 5]],
+        'gauges': [['nutritracker_fragment_cache_bytes', [], 1024]],
+    }))
+
+    for _ in range(2):
+        text = PerformanceMetrics.render()
+
+        assert _sample(text, 'nutritracker_jobs_total{job="dead.job",outcome="done"}') == [
+            'nutritracker_jobs_total{job="dead.job",outcome="done"} 5'
+        ]
+        assert _sample(text, 'nutritracker_job_duration_seconds_count{job="dead.job"}') == [
+            'nutritracker_job_duration_seconds_count{job="dead.job"} 12'
+        ]
+        # The dead worker's gauge is gone with it
+        assert '1024' not in text
+    assert [path.name for path in metrics_dir.glob('metrics-*.json') if 'deadbeef' in path.name] == []
+    assert (metrics_dir / PerformanceMetrics.ARCHIVE).exists()
+
+def test_collector_gauges_are_exported_per_process(metrics_dir, monkeypatch):
+    monkeypatch.setattr(PerformanceMetrics, '_collectors',
+                        [lambda: [('nutritracker_fragment_cache_bytes', {}, 2048)]])
+
+    text = PerformanceMetrics.render()
+
+    assert '# TYPE nutritracker_fragment_cache_bytes gauge' in text
+    assert _sample(text, 'nutritracker_fragment_cache_bytes{') == [
+        f'nutritracker_fragment_cache_bytes{{pid="{PerformanceMetrics._snapshot_pid}"}} 2048'
+    ]
@@ -0,0 +1,42 @@
+import io
+from datetime import date
+
+import pytest
+
+from models import User
+from services.job_queue import JobQueue
+from services.nutrition_calculator import NutritionCalculator
+
+def _update_profile(app, client):
+    client.post('/update-profile', data={'age': '45', 'gender': 'male', 'height': '185',
+                                         'activity_level': 'very_active', 'goal': 'lose_weight'})
+
+def _add_weight(app, client):
+    client.post('/add-weight', data={'weight': '95', 'entry_date': date.today().isoformat()})
+
+def _import_weights(app, client):
+    client.post('/import-weights', data={
+        'file': (io.BytesIO(f'Date,Weight\n{date.today().isoformat()},95\n'.encode()), 'scale.csv')
+    })
+    JobQueue.work(app, once=True)
+
+def _sync_weight(app, client):
+    response = client.post('/api/sync', json={'mutations': [
+        {'key': 'weight', 'op': 'add_weight', 'data': {'weight': 95, 'entry_date': date.today().isoformat()}}
+    ]})
+    assert response.get_json()['results'][0]['status'] == 'applied'
+
+@pytest.mark.parametrize('change', [_update_profile, _add_weight, _import_weights, _sync_weight])
+def test_stored_targets_follow_the_change(app, db, client, seeded, change):
+    user = db.session.get(User, seeded['user_id'])
+    NutritionCalculator.refresh_targets(user)
+    db.session.commit()
+    before = NutritionCalculator.get_targets(user)
+
+    change(app, client)
+
+    db.session.expire_all()
+    user = db.session.get(User, seeded['user_id'])
+    live = NutritionCalculator.compute_targets(user)
+    assert live != pytest.approx(before)
+    assert NutritionCalculator.get_targets(user) == pytest.approx(live)
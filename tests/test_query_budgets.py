@@ -0,0 +1,77 @@
+import io
+from datetime import date
+
+import pytest
+from sqlalchemy import text
+
+from services.food_api import OpenFoodFactsAPI
+from services.query_budget import QueryBudget, QueryBudgetExceeded
+
+# endpoint -> function of the seeded data returning (method, url, client.open keyword arguments)
+ROUTES = {
+    'index': lambda seeded: ('GET', '/', {}),
+    'dashboard': lambda seeded: ('GET', '/dashboard', {}),
+    'food_log': lambda seeded: ('GET', f'/food-log?date={date.today().isoformat()}', {}),
+    'add_food': lambda seeded: ('POST', '/add-food', {
+        'data': {'food_id': seeded['food_ids'][1], 'quantity': '120', 'meal_type': 'snack'}
+    }),
+    'search_food': lambda seeded: ('GET', '/search-food?q=yogurt', {}),
+    'scan_barcode': lambda seeded: ('POST', '/scan-barcode', {'json': {'barcode': '0000000000017'}}),
+    'recognize_food': lambda seeded: ('POST', '/recognize-food', {
+        'data': {'image': (io.BytesIO(b'image'), 'meal.jpg')}
+    }),
+    'weight_tracker': lambda seeded: ('GET', '/weight-tracker', {}),
+    'add_weight': lambda seeded: ('POST', '/add-weight', {'data': {'weight': '69.5'}}),
+    'import_weights': lambda seeded: ('POST', '/import-weights', {
+        'data': {'file': (io.BytesIO(b'Date,Weight (kg)\n2024-01-01,70.1\n'), 'scale.csv')}
+    }),
+    'profile': lambda seeded: ('GET', '/profile', {}),
+    'barcode_benchmark': lambda seeded: ('GET', '/barcode-benchmark', {}),
+    'update_profile': lambda seeded: ('POST', '/update-profile', {'data': {
+        'age': '31', 'gender': 'female', 'height': '170', 'activity_level': 'active',
+        'goal': 'lose_weight', 'daily_calorie_goal': '1800'
+    }}),
+    'delete_food_log': lambda seeded: ('POST', f"/delete-food-log/{seeded['food_log_id']}", {}),
+    'static_asset': lambda seeded: ('GET', '/assets/js/missing.js', {}),
+    'metrics': lambda seeded: ('GET', '/metrics', {'headers': {'Authorization': 'Bearer test-token'}}),
+    'api_nutrition_summary': lambda seeded: ('GET', '/api/nutrition/summary', {}),
+    'api_weight_progress': lambda seeded: ('GET', '/api/weight/progress?days=90', {}),
+    'api_food_recommendations': lambda seeded: ('GET', '/api/recommendations/foods', {}),
+    'api_sync': lambda seeded: ('POST', '/api/sync', {'json': {'mutations': [
+        {'key': f'food-{n}', 'op': 'add_food',
+         'data': {'food_id': seeded['food_ids'][n % 3], 'quantity': 100, 'meal_type': 'lunch'}}
+        for n in range(20)
+    ] + [{'key': 'weight', 'op': 'add_weight', 'data': {'weight': 69.8}}]}}),
+}
+
+@pytest.fixture(autouse=True)
+def offline_food_api(monkeypatch):
+    monkeypatch.setattr(OpenFoodFactsAPI, 'search_products', lambda *args, **kwargs: [])
+    monkeypatch.setattr(OpenFoodFactsAPI, 'get_product_by_barcode', lambda *args, **kwargs: None)
+    monkeypatch.setenv('METRICS_TOKEN', 'test-token')
+
+def test_every_budgeted_route_is_exercised(app):
+    budgeted = {endpoint for endpoint, view in app.view_functions.items() if hasattr(view, 'query_budget')}
+    assert budgeted == set(ROUTES)
+
+@pytest.mark.parametrize('endpoint', sorted(ROUTES))
+def test_route_stays_within_query_budget(db, client, seeded, strict_query_budgets, endpoint):
+    seeded['food_log_id'] = db.session.execute(text("SELECT min(id) FROM food_logs")).scalar()
+    method, url, kwargs = ROUTES[endpoint](seeded)
+
+    # Raises QueryBudgetExceeded from the view when the budget or the N+1 check is violated
+    response = client.open(url, method=method, **kwargs)
+
+    assert response.status_code < 500
+
+def test_strict_budget_raises_on_overrun(db):
+    with pytest.raises(QueryBudgetExceeded):
+        with QueryBudget(max_queries=1, label='overrun'):
+            db.session.execute(text("SELECT 1"))
+            db.session.execute(text("SELECT 2"))
+
+def test_repeated_statement_is_reported_as_n_plus_one(db):
+    with pytest.raises(QueryBudgetExceeded, match='N\\+1'):
+        with QueryBudget(max_repeats=2, label='n+1'):
+            for food_id in range(3):
+                db.session.execute(text("SELECT name FROM foods WHERE id = :id"), {'id': food_id})
@@ -0,0 +1,27 @@
+from sqlalchemy import create_engine, event, text
+
+from services.schema_upgrade import _require_food_log_date
+
+def test_log_date_step_skips_the_backfill_once_required(db):
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        with db.engine.begin() as connection:
+            assert _require_food_log_date(connection) is False
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+
+    assert not [statement for statement in statements if statement.startswith('UPDATE')]
+
+def test_log_date_step_backfills_an_optional_column(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    with engine.begin() as connection:
+        connection.execute(text("CREATE TABLE food_logs (id INTEGER PRIMARY KEY, logged_at DATETIME, log_date DATE)"))
+        connection.execute(text("INSERT INTO food_logs (logged_at) VALUES ('2024-01-31 08:15:00')"))
+
+        assert _require_food_log_date(connection) is True
+        assert connection.execute(text("SELECT log_date FROM food_logs")).scalar() == '2024-01-31'
@@ -0,0 +1,89 @@
+import threading
+
+import pytest
+
+from models import Food
+from services.food_api import OpenFoodFactsAPI
+from services.food_log_recompute import NUTRIENT_COLUMNS
+from services.search_cache import SearchCache
+
+BANANA = [{'id': 1, 'name': 'Banana'}]
+
+def _invalidate_elsewhere(names):
+    """
+    invalidate() from another worker thread
+    """
+    worker = threading.Thread(target=SearchCache.invalidate, args=(names,))
+    worker.start()
+    worker.join()
+
+def test_store_after_a_miss_is_served(db):
+    assert SearchCache.get('banana') is None
+    SearchCache.set('banana', BANANA)
+
+    assert SearchCache.get('  BANANA ') == BANANA
+
+def test_store_after_a_concurrent_invalidation_is_dropped(db):
+    assert SearchCache.get('banana') is None
+    # Another worker adds a matching food while this one searches the database
+    _invalidate_elsewhere(['Banana bread'])
+    SearchCache.set('banana', BANANA)
+
+    assert SearchCache.get('banana') is None
+
+def test_unrelated_lookup_does_not_guard_the_store(db):
+    assert SearchCache.get('apple') is None
+    _invalidate_elsewhere(['Apple pie'])
+    assert SearchCache.get('banana') is None
+    SearchCache.set('banana', BANANA)
+
+    assert SearchCache.get('banana') == BANANA
+
+def test_search_route_caches_under_the_normalized_query(client, monkeypatch):
+    searched = []
+    monkeypatch.setattr(OpenFoodFactsAPI, 'search_products',
+                        lambda query, **kwargs: searched.append(query) or [])
+
+    first = client.get('/search-food?q=%20%20BANANA%20').get_json()
+    second = client.get('/search-food?q=banana').get_json()
+
+    assert [food['name'] for food in first] == ['Banana']
+    assert second == first
+    # Searched as typed, without the surrounding spaces
+    assert searched == ['BANANA']
+
+def test_accented_query_matches_accented_names(db, client, monkeypatch):
+    monkeypatch.setattr(OpenFoodFactsAPI, 'search_products', lambda *args, **kwargs: [])
+    db.session.add(Food(name='Crème brûlée', calories_per_100g=290))
+    db.session.commit()
+
+    results = client.get('/search-food?q=Crème').get_json()
+
+    assert [food['name'] for food in results] == ['Crème brûlée']
+
+def test_search_that_adds_foods_is_cached(db, client, monkeypatch):
+    searched = []
+    product = {'barcode': '4000000000001', 'name': 'Quinoa salad', 'brand': None,
+               **{column: 120.0 for column in NUTRIENT_COLUMNS.values()}}
+    monkeypatch.setattr(OpenFoodFactsAPI, 'search_products',
+                        lambda query, **kwargs: searched.append(query) or [dict(product)])
+
+    first = client.get('/search-food?q=quinoa').get_json()
+    second = client.get('/search-food?q=quinoa').get_json()
+
+    assert [food['name'] for food in first] == ['Quinoa salad']
+    assert second == first
+    assert searched == ['quinoa']
+
+def test_own_invalidation_does_not_hide_a_concurrent_one(db):
+    assert SearchCache.get('quinoa') is None
+    # Another worker's change, then this thread's own
+    _invalidate_elsewhere(['Quinoa bowl'])
+    SearchCache.invalidate(['Quinoa salad'])
+    SearchCache.set('quinoa', [{'id': 1, 'name': 'Quinoa salad'}])
+
+    assert SearchCache.get('quinoa') is None
+
+@pytest.mark.parametrize('query', ['', '   '])
+def test_blank_search_returns_nothing(client, query):
+    assert client.get(f'/search-food?q={query}').get_json() == []
@@ -0,0 +1,78 @@
+import pytest
+from sqlalchemy import event, select
+
+from models import BrowserSession
+
+COOKIE = 'session'
+
+def _stored_sessions(db):
+    return db.session.execute(select(BrowserSession.user_id)).scalars().all()
+
+def test_login_moves_the_session_to_a_new_id(app, db, seeded):
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['next_url'] = '/dashboard'
+    planted = client.get_cookie(COOKIE).value
+
+    with client.session_transaction() as session:
+        session['_user_id'] = seeded['user_id']
+    signed_in = client.get_cookie(COOKIE).value
+
+    assert signed_in != planted
+    assert _stored_sessions(db) == [seeded['user_id']]
+    # Whoever planted the old id does not share the login
+    attacker = app.test_client()
+    attacker.set_cookie(COOKIE, planted)
+    with attacker.session_transaction() as session:
+        assert '_user_id' not in session
+
+def test_logout_moves_the_session_to_a_new_id(app, db, client, seeded):
+    with client.session_transaction() as session:
+        session['next_url'] = '/dashboard'
+    signed_in = client.get_cookie(COOKIE).value
+
+    with client.session_transaction() as session:
+        del session['_user_id']
+
+    assert client.get_cookie(COOKIE).value != signed_in
+    assert _stored_sessions(db) == [None]
+
+def test_unchanged_user_keeps_the_session_id(app, db, client):
+    with client.session_transaction() as session:
+        session['next_url'] = '/dashboard'
+    cookie = client.get_cookie(COOKIE).value
+
+    with client.session_transaction() as session:
+        session['next_url'] = '/profile'
+
+    assert client.get_cookie(COOKIE).value == cookie
+
+@pytest.mark.parametrize('path', ['/static/css/missing.css', '/assets/js/missing.js'])
+def test_static_requests_do_not_load_the_session(app, db, client, path):
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        client.get(path)
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+
+    assert not [statement for statement in statements if 'browser_sessions' in statement]
+
+def test_second_flash_before_the_first_is_shown_is_kept(client):
+    client.post('/add-weight', data={'weight': 'heavy'})
+    client.post('/add-weight', data={'weight': 'heavier'})
+
+    with client.session_transaction() as session:
+        assert [message for _, message in session['_flashes']] == ['Please enter a valid weight'] * 2
+
+def test_unchanged_session_is_not_written(db, client):
+    client.get('/profile')
+    written = db.session.execute(select(BrowserSession.updated_at)).scalar()
+
+    client.get('/profile')
+
+    assert db.session.execute(select(BrowserSession.updated_at)).scalar() == written
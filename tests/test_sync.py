@@ -0,0 +1,36 @@
+from datetime import date
+
+from models import WeightEntry
+
+def _sync(client, *mutations):
+    response = client.post('/api/sync', json={'mutations': list(mutations)})
+    assert response.status_code == 200, response.get_json()
+    return response.get_json()['results']
+
+def test_unhashable_keys_are_rejected_per_mutation(client):
+    results = _sync(
+        client,
+        {'key': ['a'], 'op': 'add_weight', 'data': {'weight': 70}},
+        {'key': {'a': 1}, 'op': 'add_weight', 'data': {'weight': 70}},
+        {'key': 'x' * 65, 'op': 'add_weight', 'data': {'weight': 70}},
+        {'key': 'delete', 'op': 'delete_food_log', 'data': {'food_log_key': ['a']}},
+    )
+
+    assert [result['status'] for result in results] == ['error'] * 4
+    assert results[3]['error'] == 'Invalid food_log_key'
+
+def test_weights_outside_the_range_are_rejected(client):
+    results = _sync(
+        client,
+        {'key': 'low', 'op': 'add_weight', 'data': {'weight': 5, 'entry_date': '2024-01-01'}},
+        {'key': 'high', 'op': 'add_weight', 'data': {'weight': 4000, 'entry_date': '2024-01-01'}},
+    )
+
+    assert [result['error'] for result in results] == ['Invalid weight', 'Invalid weight']
+
+def test_add_weight_without_a_date_updates_todays_entry(db, client, seeded):
+    [result] = _sync(client, {'key': 'today', 'op': 'add_weight', 'data': {'weight': 68.4}})
+
+    assert result['status'] == 'applied'
+    entries = WeightEntry.query.filter_by(user_id=seeded['user_id'], entry_date=date.today()).all()
+    assert [entry.weight for entry in entries] == [68.4]
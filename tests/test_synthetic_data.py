@@ -0,0 +1,17 @@
+import pytest
+from sqlalchemy import select
+
+from models import Food, FoodLog
+from tools.synthetic_data import SyntheticData
+
+def test_food_logs_match_the_nutrients_of_their_food(db):
+    SyntheticData.generate(users=2, foods=25, days=3, logs_per_day=3, batch_size=7)
+
+    rows = db.session.execute(
+        select(FoodLog.quantity, FoodLog.calories, FoodLog.protein, Food.calories_per_100g, Food.protein_per_100g)
+        .join(Food, Food.id == FoodLog.food_id)
+    ).all()
+    assert rows
+    for quantity, calories, protein, calories_per_100g, protein_per_100g in rows:
+        assert calories == pytest.approx(calories_per_100g * quantity / 100)
+        assert protein == pytest.approx(protein_per_100g * quantity / 100)
@@ -0,0 +1,83 @@
+import io
+from datetime import date
+
+import pytest
+
+from models import Job, User, WeightEntry, WeightUpload
+from services.job_queue import JobQueue
+from services.weight_import import WeightImport
+
+def _readings(csv_text):
+    return list(WeightImport.parse_csv(io.BytesIO(csv_text.encode())))
+
+@pytest.mark.parametrize('header, value, kg', [
+    ('Weight', '70', 70),
+    ('Weight (kgs)', '70', 70),
+    ('Weight (kilograms)', '70', 70),
+    ('Weight (lb)', '154.3', 69.99),
+    ('Weight (lb.)', '154.3', 69.99),
+    ('Weight (lbs)', '154.3', 69.99),
+    ('Weight (pounds)', '154.3', 69.99),
+    ('Weight (st)', '11.02', 69.98),
+    ('Weight (stone)', '11.02', 69.98),
+    ('Weight (Stones)', '11.02', 69.98),
+])
+def test_unit_is_read_from_the_weight_header(header, value, kg):
+    [(day, weight)] = _readings(f"Date,{header}\n2024-01-31,{value}\n")
+
+    assert day == date(2024, 1, 31)
+    assert weight == pytest.approx(kg, abs=0.01)
+
+def test_unit_column_overrides_the_header():
+    readings = _readings("Date,Weight,Unit\n2024-01-30,70,kg\n2024-01-31,154.3,pounds\n")
+
+    assert [round(weight, 1) for _, weight in readings] == [70.0, 70.0]
+
+def test_readings_outside_the_range_are_counted_and_skipped(db):
+    user = User(id='importer')
+    db.session.add(user)
+    db.session.commit()
+
+    stats = WeightImport.import_readings(user, iter([
+        (date(2024, 1, 1), 70.0),
+        (date(2024, 1, 2), 7.0),
+        (date(2024, 1, 3), 700.0),
+    ]))
+
+    assert stats['readings'] == 3
+    assert stats['out_of_range'] == 2
+    assert stats['days'] == 1
+    assert [entry.entry_date for entry in db.session.query(WeightEntry)] == [date(2024, 1, 1)]
+
+def test_upload_is_imported_by_a_job_worker_from_the_database(app, db, client):
+    response = client.post('/import-weights', data={
+        'file': (io.BytesIO(b'Date,Weight (lb)\n2024-01-31,154.3\n'), 'scale.csv')
+    })
+    assert response.status_code == 302
+    assert db.session.query(WeightUpload).count() == 1
+
+    JobQueue.work(app, once=True)
+
+    assert Job.query.filter_by(name='weights.import').one().status == 'done'
+    assert db.session.query(WeightUpload).count() == 0
+    entry = WeightEntry.query.filter_by(entry_date=date(2024, 1, 31)).one()
+    assert entry.weight == 70.0
+
+def test_upload_over_the_size_limit_is_refused(db, client, monkeypatch):
+    monkeypatch.setattr(WeightImport, 'MAX_UPLOAD_BYTES', 10)
+
+    client.post('/import-weights', data={'file': (io.BytesIO(b'Date,Weight\n2024-01-31,70\n'), 'scale.csv')})
+
+    assert db.session.query(WeightUpload).count() == 0
+    assert Job.query.count() == 0
+
+def test_failed_import_still_deletes_the_upload(db, seeded):
+    user = db.session.get(User, seeded['user_id'])
+    upload_id = WeightImport.store_upload(user, 'scale.csv', io.BytesIO(b'no weights here\n'))
+    db.session.commit()
+
+    with pytest.raises(ValueError):
+        WeightImport.import_upload(upload_id)
+
+    assert db.session.query(WeightUpload).count() == 0
+    assert WeightImport.import_upload(upload_id) is None
@@ -0,0 +1,187 @@
+import json
+import logging
+import platform
+import statistics
+import time
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Callable, Dict, Any, List, Tuple
+
+from flask import Flask
+
+from models import User, Food, FoodLog, WeightEntry
+from services.food_api import OpenFoodFactsAPI
+from services.nutrition_calculator import NutritionCalculator
+from tools.synthetic_data import SyntheticData
+
+logger = logging.getLogger(__name__)
+
+BENCH_USER_ID = 'benchmark-user'
+
+# A typical Open Food Facts search result entry
+SAMPLE_OFF_PRODUCT = {
+    'code': '3017620422003',
+    'product_name': 'Nutella',
+    'brands': 'Ferrero,Nutella',
+    'nutriments': {
+        'energy-kcal_100g': 539,
+        'proteins_100g': 6.3,
+        'carbohydrates_100g': 57.5,
+        'fat_100g': 30.9,
+        'fiber_100g': 0,
+        'sugars_100g': 56.3,
+        'sodium_100g': 0.0428,
+    },
+}
+
+class Benchmarks:
+    """
+    Repeatable microbenchmarks of NutritionCalculator and the food API parsers,
+    run against a seeded in-memory SQLite database
+    """
+
+    TARGET_SECONDS = 0.2
+    REPEAT = 5
+    DEFAULT_THRESHOLD = 0.10
+
+    @staticmethod
+    @contextmanager
+    def in_memory_database(logs_per_day: int = 6, days: int = 365):
+        """
+        Push an app context bound to a fresh in-memory database holding one user
+        with ``days`` of food logs and weight entries
+        """
+        from app import db
+
+        bench_app = Flask(__name__)
+        bench_app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+        bench_app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+        db.init_app(bench_app)
+
+        with bench_app.app_context():
+            db.create_all()
+            user = User(id=BENCH_USER_ID, age=34, gender='female', height=168.0,
+                        activity_level='moderately_active', goal='lose_weight')
+            db.session.add(user)
+
+            foods = [Food(name=SyntheticData.food_name(i), **SyntheticData.food_nutrients(i)) for i in range(200)]
+            db.session.add_all(foods)
+            db.session.flush()
+
+            today = date.today()
+            for offset in range(days):
+                log_date = today - timedelta(days=offset)
+                for n in range(logs_per_day):
+                    food = foods[(offset * logs_per_day + n) % len(foods)]
+                    db.session.add(FoodLog(
+                        user_id=user.id, food_id=food.id, quantity=150,
+                        meal_type=['breakfast', 'lunch', 'dinner', 'snack'][n % 4], log_date=log_date,
+                        calories=food.calories_per_100g * 1.5, protein=food.protein_per_100g * 1.5,
+                        carbs=food.carbs_per_100g * 1.5, fat=food.fat_per_100g * 1.5,
+                        fiber=food.fiber_per_100g * 1.5, sugar=food.sugar_per_100g * 1.5,
+                        sodium=food.sodium_per_100g * 1.5
+                    ))
+                db.session.add(WeightEntry(user_id=user.id, entry_date=log_date,
+                                           weight=round(70 + (offset % 30) * 0.1, 1)))
+            NutritionCalculator.refresh_targets(user)
+            db.session.commit()
+
+            try:
+                yield db.session.get(User, BENCH_USER_ID)
+            finally:
+                db.session.remove()
+                db.drop_all()
+
+    @staticmethod
+    def cases(user: User) -> List[Tuple[str, Callable[[], Any]]]:
+        """
+        Named zero-argument callables to time
+        """
+        summary = NutritionCalculator.get_daily_nutrition_summary(user)
+        progress = NutritionCalculator.get_weight_progress(user, days=30)
+        weight_entries = sorted(user.weight_entries, key=lambda entry: entry.entry_date)
+        search_payload = [dict(SAMPLE_OFF_PRODUCT, code=str(i)) for i in range(20)]
+
+        return [
+            ('calculate_bmr', lambda: NutritionCalculator.calculate_bmr(user, 70.0)),
+            ('calculate_tdee', lambda: NutritionCalculator.calculate_tdee(user, 70.0)),
+            ('daily_nutrition_summary', lambda: NutritionCalculator.get_daily_nutrition_summary(user)),
+            ('meal_breakdown', lambda: NutritionCalculator.get_meal_breakdown(user, date.today())),
+            ('weight_progress_90d', lambda: NutritionCalculator.get_weight_progress(user, days=90)),
+            ('weight_progress_periods', lambda: NutritionCalculator.get_weight_progress_for_periods(user, [7, 30, 90])),
+            ('weight_trend_365_entries', lambda: NutritionCalculator._summarize_weight_entries(weight_entries)),
+            ('fitness_recommendations', lambda: NutritionCalculator.get_fitness_recommendations(user, summary, progress)),
+            ('fitness_recommendations_full', lambda: NutritionCalculator.get_fitness_recommendations(user)),
+            ('off_parse_product', lambda: OpenFoodFactsAPI.parse_product(SAMPLE_OFF_PRODUCT)),
+            ('off_parse_search_page', lambda: [OpenFoodFactsAPI.parse_product(p) for p in search_payload]),
+        ]
+
+    @staticmethod
+    def measure(func: Callable[[], Any]) -> Dict[str, Any]:
+        """
+        Time ``func`` timeit-style: calibrate a loop count, then repeat and keep per-call times
+        """
+        loops = 1
+        while True:
+            start = time.perf_counter()
+            for _ in range(loops):
+                func()
+            elapsed = time.perf_counter() - start
+            if elapsed >= Benchmarks.TARGET_SECONDS / Benchmarks.REPEAT or loops >= 10 ** 6:
+                break
+            loops *= 10 if elapsed < 0.001 else 2
+
+        timings = []
+        for _ in range(Benchmarks.REPEAT):
+            start = time.perf_counter()
+            for _ in range(loops):
+                func()
+            timings.append((time.perf_counter() - start) / loops)
+
+        return {
+            'loops': loops,
+            'min_us': round(min(timings) * 1e6, 3),
+            'median_us': round(statistics.median(timings) * 1e6, 3),
+        }
+
+    @staticmethod
+    def run(only: List[str] = None) -> Dict[str, Any]:
+        results = {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'benchmarks': {},
+        }
+        with Benchmarks.in_memory_database() as user:
+            for name, func in Benchmarks.cases(user):
+                if only and name not in only:
+                    continue
+                results['benchmarks'][name] = Benchmarks.measure(func)
+                logger.debug(f"{name}: {results['benchmarks'][name]}")
+        return results
+
+    @staticmethod
+    def compare(current: Dict[str, Any], baseline: Dict[str, Any],
+                threshold: float = DEFAULT_THRESHOLD) -> Tuple[List[str], List[str]]:
+        """
+        Compare median per-call times. Returns (report lines, names that regressed beyond ``threshold``).
+        """
+        lines, regressions = [], []
+        for name, stats in current['benchmarks'].items():
+            previous = baseline.get('benchmarks', {}).get(name)
+            if not previous:
+                lines.append(f"{name}: {stats['median_us']} us (no baseline)")
+                continue
+            change = (stats['median_us'] - previous['median_us']) / previous['median_us'] if previous['median_us'] else 0.0
+            flag = ''
+            if change > threshold:
+                regressions.append(name)
+                flag = '  REGRESSION'
+            lines.append(f"{name}: {previous['median_us']} -> {stats['median_us']} us ({change * 100:+.1f}%){flag}")
+        return lines, regressions
+
+    @staticmethod
+    def save(results: Dict[str, Any], path: Path) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(results, indent=2, sort_keys=True))
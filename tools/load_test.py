@@ -0,0 +1,236 @@
+import json
+import logging
+import math
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from pathlib import Path
+from typing import Dict, Any, List, Optional
+
+import requests
+from flask import Flask, request
+from sqlalchemy import select
+
+from models import User, Food, OAuth
+from tools.synthetic_data import SyntheticData, USER_PREFIX, BARCODE_PREFIX
+
+logger = logging.getLogger(__name__)
+
+# route name -> (method, weight in the request mix)
+ROUTE_MIX = {
+    'dashboard': ('GET', 30),
+    'food_log': ('GET', 25),
+    'search_food': ('GET', 20),
+    'add_food': ('POST', 10),
+    'weight_tracker': ('GET', 15),
+}
+
+def percentile(values: List[float], pct: float) -> float:
+    """
+    Nearest-rank percentile of ``values``
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    # Multiplying before dividing keeps exact ranks exact: 7 / 100 * 100 is 7.000000000000001
+    rank = max(1, math.ceil(pct * len(ordered) / 100))
+    return ordered[min(rank, len(ordered)) - 1]
+
+class LocalIdentity:
+    """
+    Sign in as an existing user without going through Replit OAuth, by storing a
+    long-lived token for a dedicated browser session key. Only for load testing.
+    """
+
+    PROVIDER = 'replit_auth'
+
+    @staticmethod
+    def prepare(user_ids: List[str]) -> None:
+        from app import db
+
+        browser_keys = [LocalIdentity.browser_session_key(user_id) for user_id in user_ids]
+        db.session.query(OAuth).filter(OAuth.browser_session_key.in_(browser_keys)).delete(
+            synchronize_session=False)
+        for user_id, browser_key in zip(user_ids, browser_keys):
+            oauth = OAuth()
+            oauth.user_id = user_id
+            oauth.browser_session_key = browser_key
+            oauth.provider = LocalIdentity.PROVIDER
+            oauth.token = {'access_token': 'load-test', 'token_type': 'Bearer', 'expires_in': 10 ** 9}
+            db.session.add(oauth)
+        db.session.commit()
+
+    @staticmethod
+    def browser_session_key(user_id: str) -> str:
+        return f'loadtest-{user_id}'
+
+    @staticmethod
+    def session_values(user_id: str) -> Dict[str, Any]:
+        return {
+            '_user_id': user_id,
+            '_fresh': True,
+            '_browser_session_key': LocalIdentity.browser_session_key(user_id),
+        }
+
+    @staticmethod
+    def session_cookie(app: Flask, user_id: str) -> str:
+        """
+        Build a session cookie value through the app's own session interface
+        """
+        with app.test_request_context('/'):
+            session = app.session_interface.open_session(app, request)
+            session.update(LocalIdentity.session_values(user_id))
+            session.permanent = True
+            response = app.response_class()
+            app.session_interface.save_session(app, session, response)
+            cookie_name = app.config['SESSION_COOKIE_NAME']
+            for header in response.headers.getlist('Set-Cookie'):
+                name, _, rest = header.partition('=')
+                if name == cookie_name:
+                    return rest.split(';', 1)[0]
+        raise RuntimeError("Session interface did not set a session cookie")
+
+class LoadTest:
+    """
+    Drive the main pages with authenticated sessions and report per-route latency
+    """
+
+    @staticmethod
+    def run(app: Flask, requests_total: int = 1000, concurrency: int = 8, users: int = 50,
+            base_url: Optional[str] = None, seed: int = 7) -> Dict[str, Any]:
+        """
+        Issue ``requests_total`` requests spread over ``users`` synthetic users.
+        Runs in-process through the test client unless ``base_url`` points at a server.
+        """
+        from app import db
+
+        user_ids = db.session.execute(
+            select(User.id).where(User.id.like(f'{USER_PREFIX}%')).order_by(User.id).limit(users)
+        ).scalars().all()
+        if not user_ids:
+            raise ValueError("No synthetic users found, generate synthetic data first")
+        food_ids = db.session.execute(
+            select(Food.id).where(Food.barcode.like(f'{BARCODE_PREFIX}%')).limit(10000)
+        ).scalars().all()
+        LocalIdentity.prepare(user_ids)
+
+        routes = list(ROUTE_MIX)
+        weights = [ROUTE_MIX[route][1] for route in routes]
+        terms = SyntheticData.search_terms()
+        latencies: Dict[str, List[float]] = {route: [] for route in routes}
+        errors: Dict[str, int] = {route: 0 for route in routes}
+        lock = threading.Lock()
+        remaining = [requests_total]
+
+        def make_client(user_id):
+            if base_url:
+                session = requests.Session()
+                session.cookies.set(app.config['SESSION_COOKIE_NAME'], LocalIdentity.session_cookie(app, user_id))
+                return session
+            client = app.test_client()
+            with client.session_transaction() as session:
+                session.update(LocalIdentity.session_values(user_id))
+            return client
+
+        def request_for(route, rng):
+            if route == 'dashboard':
+                return 'GET', '/dashboard', None
+            if route == 'food_log':
+                return 'GET', '/food-log', None
+            if route == 'weight_tracker':
+                return 'GET', '/weight-tracker', None
+            if route == 'search_food':
+                return 'GET', f'/search-food?q={rng.choice(terms)}', None
+            return 'POST', '/add-food', {
+                'food_id': rng.choice(food_ids),
+                'quantity': rng.choice(['50', '100', '150']),
+                'meal_type': rng.choice(['breakfast', 'lunch', 'dinner', 'snack']),
+                'log_date': date.today().isoformat(),
+            }
+
+        def worker(worker_index):
+            rng = random.Random(seed + worker_index)
+            clients = {}
+            while True:
+                with lock:
+                    if remaining[0] <= 0:
+                        return
+                    remaining[0] -= 1
+                user_id = rng.choice(user_ids)
+                client = clients.get(user_id)
+                if client is None:
+                    client = clients[user_id] = make_client(user_id)
+                route = rng.choices(routes, weights)[0]
+                method, path, form = request_for(route, rng)
+
+                start = time.perf_counter()
+                try:
+                    if base_url:
+                        response = client.request(method, base_url.rstrip('/') + path, data=form,
+                                                  allow_redirects=False, timeout=30)
+                        status = response.status_code
+                    else:
+                        status = client.open(path, method=method, data=form).status_code
+                except Exception as e:
+                    logger.warning(f"Request to {path} failed: {str(e)}")
+                    status = 599
+                elapsed = time.perf_counter() - start
+
+                with lock:
+                    latencies[route].append(elapsed)
+                    # Pages must render; writes answer with a redirect back to the page
+                    if status >= 400 or (method == 'GET' and status != 200):
+                        errors[route] += 1
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            list(executor.map(worker, range(concurrency)))
+        wall = time.perf_counter() - start
+
+        results = {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'target': base_url or 'in-process',
+            'database': db.engine.url.get_backend_name(),
+            'requests': requests_total,
+            'concurrency': concurrency,
+            'users': len(user_ids),
+            'seconds': round(wall, 3),
+            'throughput': round(requests_total / wall, 1) if wall > 0 else 0,
+            'routes': {},
+        }
+        for route in routes:
+            samples = latencies[route]
+            results['routes'][route] = {
+                'requests': len(samples),
+                'errors': errors[route],
+                'throughput': round(len(samples) / wall, 1) if wall > 0 else 0,
+                'p50_ms': round(percentile(samples, 50) * 1000, 2),
+                'p95_ms': round(percentile(samples, 95) * 1000, 2),
+                'p99_ms': round(percentile(samples, 99) * 1000, 2),
+            }
+        return results
+
+    @staticmethod
+    def save(results: Dict[str, Any], path: Path) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(results, indent=2, sort_keys=True))
+
+    @staticmethod
+    def compare(results: Dict[str, Any], baseline: Dict[str, Any]) -> List[str]:
+        """
+        Describe the per-route p50/p95/p99 change relative to ``baseline``
+        """
+        lines = []
+        for route, current in results['routes'].items():
+            previous = baseline.get('routes', {}).get(route)
+            if not previous:
+                continue
+            changes = []
+            for key in ('p50_ms', 'p95_ms', 'p99_ms'):
+                before, after = previous[key], current[key]
+                delta = ((after - before) / before * 100) if before else 0.0
+                changes.append(f"{key[:3]} {before} -> {after} ms ({delta:+.1f}%)")
+            lines.append(f"{route}: " + ', '.join(changes))
+        return lines
@@ -0,0 +1,226 @@
+import logging
+import random
+import time
+from array import array
+from datetime import date, datetime, timedelta
+from typing import Dict, Any, Iterator, List
+
+from sqlalchemy import delete, insert, select
+
+from models import User, Food, FoodLog, WeightEntry, OAuth
+from services.search_cache import SearchCache
+
+logger = logging.getLogger(__name__)
+
+USER_PREFIX = 'synthetic-'
+BARCODE_PREFIX = 'SYN'
+
+_ADJECTIVES = [
+    'organic', 'greek', 'whole', 'low fat', 'roasted', 'smoked', 'fresh', 'frozen',
+    'spicy', 'sweet', 'salted', 'unsalted', 'light', 'classic', 'crunchy', 'creamy',
+]
+_FOODS = [
+    'banana', 'apple', 'yogurt', 'oats', 'chicken breast', 'rice', 'pasta', 'bread',
+    'cheddar', 'almonds', 'peanut butter', 'salmon', 'tuna', 'eggs', 'milk', 'granola',
+    'hummus', 'tofu', 'lentils', 'quinoa', 'spinach', 'broccoli', 'avocado', 'beef',
+]
+_BRANDS = [None, 'Acme', 'Farmhouse', 'Green Valley', 'Nordic', 'Sunrise', 'Harvest Co']
+_MEALS = ['breakfast', 'lunch', 'dinner', 'snack']
+_ACTIVITY = ['sedentary', 'lightly_active', 'moderately_active', 'very_active', 'extremely_active']
+_GOALS = ['lose_weight', 'maintain', 'gain_weight']
+
+class SyntheticData:
+    """
+    Generate realistic volumes of users, foods and history with bulk inserts.
+    Synthetic rows are recognizable by their id/barcode prefix so they can be purged.
+    """
+
+    DEFAULT_BATCH_SIZE = 10000
+
+    @staticmethod
+    def food_name(index: int) -> str:
+        return (f"{_ADJECTIVES[index % len(_ADJECTIVES)]} "
+                f"{_FOODS[(index // len(_ADJECTIVES)) % len(_FOODS)]} {index}")
+
+    @staticmethod
+    def food_nutrients(index: int) -> Dict[str, float]:
+        """
+        Deterministic per-100g values for synthetic food ``index``
+        """
+        rng = random.Random(index)
+        protein = round(rng.uniform(0, 30), 1)
+        carbs = round(rng.uniform(0, 70), 1)
+        fat = round(rng.uniform(0, 35), 1)
+        return {
+            'calories_per_100g': round(protein * 4 + carbs * 4 + fat * 9, 1),
+            'protein_per_100g': protein,
+            'carbs_per_100g': carbs,
+            'fat_per_100g': fat,
+            'fiber_per_100g': round(rng.uniform(0, 10), 1),
+            'sugar_per_100g': round(rng.uniform(0, carbs), 1),
+            'sodium_per_100g': round(rng.uniform(0, 1.5), 3),
+        }
+
+    @staticmethod
+    def search_terms() -> List[str]:
+        """
+        Terms guaranteed to match many synthetic foods
+        """
+        return list(_FOODS)
+
+    @staticmethod
+    def generate(users: int = 1000, foods: int = 1000000, days: int = 730,
+                 logs_per_day: int = 5, seed: int = 42,
+                 batch_size: int = DEFAULT_BATCH_SIZE) -> Dict[str, Any]:
+        """
+        Insert ``users`` users, ``foods`` foods and ``days`` days of food logs and
+        weight entries per user
+        """
+        from app import db
+
+        rng = random.Random(seed)
+        start = time.perf_counter()
+        counts = {}
+
+        first_food = db.session.execute(
+            select(Food.id).where(Food.barcode.like(f'{BARCODE_PREFIX}%')).limit(1)
+        ).first()
+        if first_food is not None:
+            raise ValueError("Synthetic data already present, purge it first")
+
+        now = datetime.now()
+        food_ids = array('q')
+        for rows in SyntheticData._batches(({
+            'barcode': f'{BARCODE_PREFIX}{index:010d}',
+            'name': SyntheticData.food_name(index),
+            'brand': _BRANDS[index % len(_BRANDS)],
+            'created_at': now,
+            **SyntheticData.food_nutrients(index),
+        } for index in range(foods)), batch_size):
+            # Food logs pick foods by index, so the ids must come back in row order
+            food_ids.extend(db.session.execute(
+                insert(Food).returning(Food.id, sort_by_parameter_order=True), rows
+            ).scalars())
+            db.session.commit()
+        counts['foods'] = len(food_ids)
+        # Too many new names to invalidate by token
+        SearchCache.clear()
+
+        user_ids = [f'{USER_PREFIX}{n:06d}' for n in range(users)]
+        for rows in SyntheticData._batches(({
+            'id': user_id,
+            'email': f'{user_id}@example.invalid',
+            'first_name': 'Synthetic',
+            'last_name': user_id[len(USER_PREFIX):],
+            'age': rng.randint(18, 75),
+            'gender': rng.choice(['male', 'female']),
+            'height': round(rng.uniform(150, 200), 1),
+            'activity_level': rng.choice(_ACTIVITY),
+            'goal': rng.choice(_GOALS),
+            'daily_calorie_goal': 2000,
+            'data_version': 0,
+            'created_at': now,
+            'updated_at': now,
+        } for user_id in user_ids), batch_size):
+            db.session.execute(insert(User), rows)
+            db.session.commit()
+        counts['users'] = len(user_ids)
+
+        first_day = date.today() - timedelta(days=days - 1)
+
+        def food_log_rows() -> Iterator[Dict[str, Any]]:
+            for user_id in user_ids:
+                for offset in range(days):
+                    log_date = first_day + timedelta(days=offset)
+                    for _ in range(rng.randint(max(1, logs_per_day - 2), logs_per_day + 2)):
+                        index = rng.randrange(len(food_ids))
+                        quantity = float(rng.choice([30, 50, 80, 100, 150, 200, 250]))
+                        nutrients = SyntheticData.food_nutrients(index)
+                        yield {
+                            'user_id': user_id,
+                            'food_id': food_ids[index],
+                            'quantity': quantity,
+                            'meal_type': rng.choice(_MEALS),
+                            'log_date': log_date,
+                            'logged_at': datetime.combine(log_date, datetime.min.time()) + timedelta(
+                                minutes=rng.randrange(6 * 60, 23 * 60)),
+                            **{
+                                column: nutrients[f'{column}_per_100g'] * quantity / 100
+                                for column in ('calories', 'protein', 'carbs', 'fat', 'fiber', 'sugar', 'sodium')
+                            },
+                        }
+
+        counts['food_logs'] = SyntheticData._bulk_insert(FoodLog, food_log_rows(), batch_size)
+
+        def weight_rows() -> Iterator[Dict[str, Any]]:
+            for user_id in user_ids:
+                weight = rng.uniform(55, 110)
+                for offset in range(days):
+                    weight += rng.gauss(0, 0.15)
+                    # Most users weigh in on most days, not all
+                    if rng.random() < 0.6:
+                        yield {
+                            'user_id': user_id,
+                            'weight': round(weight, 1),
+                            'entry_date': first_day + timedelta(days=offset),
+                            'created_at': now,
+                        }
+
+        counts['weight_entries'] = SyntheticData._bulk_insert(WeightEntry, weight_rows(), batch_size)
+
+        elapsed = time.perf_counter() - start
+        total = sum(counts.values())
+        stats = {
+            **counts,
+            'seconds': round(elapsed, 1),
+            'rows_per_second': round(total / elapsed, 1) if elapsed > 0 else 0,
+        }
+        logger.info(f"Generated synthetic data: {stats}")
+        return stats
+
+    @staticmethod
+    def purge(batch_size: int = DEFAULT_BATCH_SIZE) -> Dict[str, int]:
+        """
+        Delete all synthetic users, their history and the synthetic foods
+        """
+        from app import db
+
+        synthetic_user = User.id.like(f'{USER_PREFIX}%')
+        user_ids = select(User.id).where(synthetic_user)
+        counts = {}
+        for name, stmt in (
+            ('food_logs', delete(FoodLog).where(FoodLog.user_id.in_(user_ids))),
+            ('weight_entries', delete(WeightEntry).where(WeightEntry.user_id.in_(user_ids))),
+            ('oauth', delete(OAuth).where(OAuth.user_id.in_(user_ids))),
+            ('users', delete(User).where(synthetic_user)),
+            ('foods', delete(Food).where(Food.barcode.like(f'{BARCODE_PREFIX}%'))),
+        ):
+            counts[name] = db.session.execute(stmt, execution_options={'synchronize_session': False}).rowcount
+            db.session.commit()
+        SearchCache.clear()
+        logger.info(f"Purged synthetic data: {counts}")
+        return counts
+
+    @staticmethod
+    def _bulk_insert(model, rows: Iterator[Dict[str, Any]], batch_size: int) -> int:
+        from app import db
+
+        total = 0
+        for batch in SyntheticData._batches(rows, batch_size):
+            db.session.execute(insert(model), batch)
+            db.session.commit()
+            total += len(batch)
+            if total % (batch_size * 50) == 0:
+                logger.info(f"Inserted {total} {model.__tablename__} rows")
+        return total
+
+    @staticmethod
+    def _batches(rows, batch_size: int) -> Iterator[list]:
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch